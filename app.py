@@ -1,10 +1,40 @@
 import streamlit as st
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import date
-from io import BytesIO
+from datetime import date, datetime, timedelta
+import os
+import sys
+import threading
 import time
+from concurrent.futures import as_completed
+
+import hr_data
+from hr_data import (
+    ATTENDANCE_STATUSES, BANK_FILE_FORMATS, EMPLOYEE_COLUMNS, HTTPONLY_SESSION_COOKIE,
+    LEAVE_ATTENDANCE_STATUSES, LEAVE_REQUEST_STATUSES, LEAVE_TYPES, PAYROLL_COLUMNS,
+    PAYROLL_DATASETS, PAY_RULES, RATE_COLUMNS, REQUIRED_EMPLOYEE_COLUMNS, SCRIPT_COOKIE_SECONDS,
+    SESSION_COOKIE, SESSION_COOKIE_ENDPOINT,
+    archived_months, attendance_for_months, bank_transfer_exclusions, bank_transfer_file,
+    bank_transfer_problems, build_attendance_grid, build_leave_ledger, closed_live_months,
+    compute_payroll, dataset_versions, decide_leave_request, diff_attendance_grid,
+    directory_query, employee_archived_months, employee_upload_writes, end_session,
+    get_data_store, get_store_department_cube, get_attendance_issues, get_directory_cache,
+    get_leave_ledger, get_login_sessions, get_store_payroll, get_staff_slice, is_checked_in,
+    issue_cookie_ticket, journal_status, leave_request_row, leave_requests_frame,
+    make_principal, month_range, open_session, password_matches, payroll_fingerprint,
+    payroll_range_report, payroll_total, payslip_archive, payslip_html, queue_checkin,
+    rate_history_rows, read_employee_upload, recent_audit_entries, recent_journal_entries,
+    refresh_data, resume_session, retry_failed_writes, rollup_cube, session_result,
+    start_journal_flusher, submit_job, submit_write, validate_employee_upload,
+    validate_leave_request, workbook_bytes, working_days, write_archive_partition
+)
+
+# pandas is imported on first use (see import_data_stack) so the login page paints without loading it.
+
+def import_data_stack():
+    """Import pandas into the script namespace (and the data layer) once it is actually needed"""
+    global pd
+    import pandas as pd
+    
+    hr_data.import_data_stack()
 
 # =====================================================
 # PAGE CONFIG
@@ -23,458 +53,145 @@ st.set_page_config(
 # CUSTOM CSS STYLING
 # =====================================================
 
-st.markdown("""
-<style>
-    * {
-        margin: 0;
-        padding: 0;
-        box-sizing: border-box;
-    }
-    
-    body {
-        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', 'Cantarell', sans-serif;
-    }
+# Served once from static/ (see .streamlit/config.toml) and cached by the browser,
+# instead of re-sending the whole stylesheet on every rerun
+st.markdown('<link rel="stylesheet" href="app/static/style.css">', unsafe_allow_html=True)
+
+# =====================================================
+# GOOGLE SHEETS CONNECTION WITH ERROR HANDLING
+# =====================================================
+
+def show_connection_error(error):
+    """Explain a failed Google Sheets connection to the user"""
+    import gspread
     
-    /* Main Color Theme */
-    :root {
-        --primary-color: #1f77b4;
-        --secondary-color: #667eea;
-        --accent-color: #764ba2;
-        --success-color: #28a745;
-        --danger-color: #dc3545;
-        --warning-color: #ffc107;
-        --light-bg: #f8f9fa;
-        --border-color: #e0e0e0;
-    }
+    if isinstance(error, KeyError):
+        if "gcp_service_account" in str(error):
+            st.error("❌ Error: 'gcp_service_account' not found in secrets. Please check .streamlit/secrets.toml")
+        else:
+            st.error("❌ Error: 'google_sheet' -> 'sheet_id' not found in secrets")
+    elif isinstance(error, gspread.exceptions.WorksheetNotFound):
+        st.error(f"❌ Worksheet not found: {str(error)}\n\nPlease ensure your Google Sheet has these worksheets: 'employees', 'attendance', 'users'")
+    elif isinstance(error, gspread.exceptions.APIError):
+        st.error(f"❌ Google Sheets API Error: {str(error)}\n\n**Solutions:**\n1. Check that the service account email has access to the Google Sheet\n2. Share the Google Sheet with: `{st.secrets['gcp_service_account'].get('client_email', 'N/A')}`\n3. Verify the sheet_id is correct")
+    else:
+        st.error(f"❌ Unexpected Error: {str(error)}")
+
+# =====================================================
+# MEMORY ACCOUNTING
+# =====================================================
+
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get("HR_SESSION_MEMORY_MB", 50))
+
+def object_size(value):
+    """Approximate bytes held by a value, counting DataFrames and containers deeply"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(object_size(item) for item in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(object_size(item) for item in value)
+    return sys.getsizeof(value)
+
+@st.cache_resource
+def get_session_registry():
+    """Process-wide record of how much memory each session holds"""
+    return {"sessions": {}, "lock": threading.Lock()}
+
+def enforce_session_budget(session):
+    """Record this session's memory, dropping its oldest cached page results while over budget
     
-    /* ===== LOGIN PAGE STYLES ===== */
-    .login-wrapper {
-        min-height: 100vh;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        background: #f5f5f5;
-        padding: 20px;
-    }
+    Only results kept by session_result are dropped (they are recomputed on demand);
+    widget and form state in st.session_state is measured but never touched.
+    """
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
     
-    .login-container {
-        width: 100%;
-        max-width: 380px;
-    }
+    state_bytes = sum(object_size(value) for value in st.session_state.values())
+    budget = SESSION_MEMORY_BUDGET_MB * 1024 * 1024
     
-    .login-card {
-        background: white;
-        border-radius: 16px;
-        padding: 45px 35px;
-        box-shadow: 0 10px 40px rgba(0, 0, 0, 0.08);
-        border: 1px solid #f0f0f0;
-        animation: slideUp 0.5s ease-out;
-    }
+    registry = get_login_sessions()
+    with registry["lock"]:
+        results = session["results"]
+        result_sizes = {key: object_size(value) for key, value in results.items()}
+        for key in list(results):
+            if state_bytes + sum(result_sizes.values()) <= budget:
+                break
+            del results[key]
+            del result_sizes[key]
     
-    @keyframes slideUp {
-        from {
-            opacity: 0;
-            transform: translateY(30px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    registry = get_session_registry()
+    with registry["lock"]:
+        registry["sessions"][ctx.session_id] = {
+            "user": principal["username"],
+            "bytes": state_bytes + sum(result_sizes.values()),
+            "updated": time.time()
         }
-    }
-    
-    .login-header {
-        margin-bottom: 35px;
-        text-align: center;
-    }
-    
-    .login-logo {
-        font-size: 48px;
-        margin-bottom: 18px;
-        display: block;
-    }
-    
-    .login-title {
-        font-size: 28px;
-        font-weight: 700;
-        color: #1a1a1a;
-        margin-bottom: 10px;
-        letter-spacing: -0.5px;
-    }
-    
-    .login-subtitle {
-        font-size: 14px;
-        color: #999;
-        line-height: 1.5;
-    }
-    
-    .form-group {
-        margin-bottom: 20px;
-    }
-    
-    .form-label {
-        display: block;
-        font-size: 13px;
-        font-weight: 600;
-        color: #333;
-        margin-bottom: 8px;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    .form-input-wrapper {
-        position: relative;
-    }
-    
-    .stTextInput input,
-    .stTextInput > div > div > input {
-        width: 100% !important;
-        padding: 12px 14px !important;
-        border: 1.5px solid #e8e8e8 !important;
-        border-radius: 8px !important;
-        font-size: 14px !important;
-        background-color: #fafafa !important;
-        transition: all 0.3s ease !important;
-        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto' !important;
-    }
-    
-    .stTextInput input:focus,
-    .stTextInput > div > div > input:focus {
-        border-color: #1f77b4 !important;
-        background-color: white !important;
-        box-shadow: 0 0 0 3px rgba(31, 119, 180, 0.08) !important;
-    }
-    
-    .stTextInput input::placeholder,
-    .stTextInput > div > div > input::placeholder {
-        color: #bbb !important;
-    }
-    
-    .login-button {
-        width: 100%;
-        padding: 12px !important;
-        background: linear-gradient(135deg, #1f77b4 0%, #0056b3 100%) !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 8px !important;
-        font-size: 15px !important;
-        font-weight: 600 !important;
-        cursor: pointer !important;
-        transition: all 0.3s ease !important;
-        margin-top: 8px !important;
-        box-shadow: 0 3px 12px rgba(31, 119, 180, 0.25) !important;
-    }
-    
-    .login-button:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 5px 16px rgba(31, 119, 180, 0.35) !important;
-    }
-    
-    .login-button:active {
-        transform: translateY(0) !important;
-    }
-    
-    .login-error {
-        background-color: #fff5f5;
-        border: 1.5px solid #ff6b6b;
-        color: #d32f2f;
-        padding: 12px 14px;
-        border-radius: 8px;
-        margin-bottom: 18px;
-        font-size: 13px;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-        animation: shake 0.3s ease-in-out;
-    }
-    
-    @keyframes shake {
-        0%, 100% { transform: translateX(0); }
-        25% { transform: translateX(-5px); }
-        75% { transform: translateX(5px); }
-    }
-    
-    .login-success {
-        background-color: #f1f9f6;
-        border: 1.5px solid #4caf50;
-        color: #2e7d32;
-        padding: 12px 14px;
-        border-radius: 8px;
-        margin-bottom: 18px;
-        font-size: 13px;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    
-    /* Hide streamlit defaults on login */
-    .login-view .stTabs,
-    .login-view .nav-container,
-    .login-view [data-testid="stSidebar"],
-    .login-view header {
-        display: none !important;
-    }
-    
-    /* ===== MAIN APP STYLES ===== */
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1f77b4;
-        text-align: center;
-        margin-bottom: 2rem;
-        border-bottom: 3px solid #1f77b4;
-        padding-bottom: 1rem;
-        text-shadow: 1px 1px 2px rgba(0,0,0,0.1);
-    }
-    
-    .section-header {
-        font-size: 1.8rem;
-        color: #2c3e50;
-        font-weight: bold;
-        border-left: 5px solid #1f77b4;
-        padding-left: 1rem;
-        margin-top: 2rem;
-        margin-bottom: 1rem;
-    }
-    
-    .form-container {
-        background-color: #f8f9fa;
-        padding: 2rem;
-        border-radius: 10px;
-        border: 1px solid #e0e0e0;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-    }
-    
-    .success-message {
-        background-color: #d4edda;
-        color: #155724;
-        padding: 1rem;
-        border-radius: 5px;
-        border-left: 4px solid #28a745;
-    }
-    
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        text-align: center;
-    }
-    
-    .dataframe-container {
-        border-radius: 8px;
-        overflow: hidden;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .sidebar-header {
-        font-size: 1.2rem;
-        font-weight: bold;
-        color: #1f77b4;
-        border-bottom: 2px solid #1f77b4;
-        padding-bottom: 0.5rem;
-        margin-bottom: 1rem;
-    }
-    
-    .nav-container {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 1rem;
-        margin-bottom: 2rem;
-        justify-content: center;
-    }
-    
-    .nav-button {
-        padding: 1rem 1.5rem;
-        border-radius: 8px;
-        border: 2px solid #1f77b4;
-        background-color: white;
-        color: #1f77b4;
-        font-weight: 600;
-        cursor: pointer;
-        transition: all 0.3s ease;
-        text-decoration: none;
-        display: inline-block;
-    }
-    
-    .nav-button:hover {
-        background-color: #1f77b4;
-        color: white;
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(31, 119, 180, 0.3);
-    }
-    
-    .nav-button.active {
-        background-color: #1f77b4;
-        color: white;
-    }
-    
-    .stButton>button {
-        border-radius: 8px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        border: none;
-    }
-    
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-    }
-    
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 1rem;
-        border-bottom: 2px solid #e0e0e0;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        border-bottom: 3px solid #1f77b4;
-    }
+
+def memory_report(store):
+    """(shared, per_session) frames of memory held by the process-wide store and by each live session"""
+    from streamlit import runtime
     
-    .stTextInput, .stNumberInput, .stSelectbox, .stDateInput {
-        border-radius: 8px;
-    }
+    with store["lock"]:
+        frames = dict(store["frames"])
+        derived = dict(store["derived"])
     
-    .stDataFrame {
-        border-radius: 8px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
+    directory_cache = get_directory_cache()
+    with directory_cache["lock"]:
+        directory_entries = (len(directory_cache["entries"]), directory_cache["bytes"])
     
-    .stInfo, .stWarning, .stError, .stSuccess {
-        border-radius: 8px;
-        border-left: 4px solid;
-    }
+    shared = pd.DataFrame(
+        [(f"dataset: {name}", len(frame), object_size(frame)) for name, frame in frames.items()] +
+        [(f"derived: {key}", None, object_size(value)) for key, value in derived.items()] +
+        [("directory query cache", *directory_entries)],
+        columns=["Item", "Rows", "Bytes"]
+    ).astype({"Rows": "Int64"})
     
-    .user-info-bar {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 1rem;
-        border-radius: 8px;
-        margin-bottom: 1.5rem;
-        text-align: center;
-        font-weight: 600;
-    }
-
-    .attendance-summary {
-        display: flex;
-        gap: 1rem;
-        margin: 1.5rem 0;
-        flex-wrap: wrap;
-    }
-
-    .attendance-card {
-        flex: 1;
-        min-width: 150px;
-        padding: 1.5rem;
-        border-radius: 10px;
-        text-align: center;
-        font-weight: 600;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-
-    .present-card {
-        background: linear-gradient(135deg, #28a745 0%, #20c997 100%);
-        color: white;
-    }
-
-    .absent-card {
-        background: linear-gradient(135deg, #dc3545 0%, #fd7e14 100%);
-        color: white;
-    }
-
-    .total-card {
-        background: linear-gradient(135deg, #1f77b4 0%, #0056b3 100%);
-        color: white;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# =====================================================
-# GOOGLE SHEETS CONNECTION WITH ERROR HANDLING
-# =====================================================
-
-@st.cache_resource
-def init_gspread_client():
-    """Initialize Google Sheets client with proper error handling"""
-    try:
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        
-        credentials_dict = st.secrets["gcp_service_account"]
-        
-        credentials = Credentials.from_service_account_info(
-            credentials_dict,
-            scopes=scopes
+    registry = get_session_registry()
+    with registry["lock"]:
+        # Sessions that have disconnected since their last run are forgotten
+        if runtime.exists():
+            for session_id in list(registry["sessions"]):
+                if not runtime.get_instance().is_active_session(session_id):
+                    del registry["sessions"][session_id]
+        sessions = pd.DataFrame(
+            [(session_id[:8], info["user"], info["bytes"], datetime.fromtimestamp(info["updated"]).isoformat(timespec="seconds"))
+             for session_id, info in registry["sessions"].items()],
+            columns=["Session", "User", "Bytes", "Last Run"]
         )
-        
-        client = gspread.authorize(credentials)
-        return client
     
-    except KeyError:
-        st.error("❌ Error: 'gcp_service_account' not found in secrets. Please check .streamlit/secrets.toml")
-        st.stop()
-    except Exception as e:
-        st.error(f"❌ Authentication Error: {str(e)}")
-        st.stop()
-
-@st.cache_resource
-def get_worksheets():
-    """Get worksheet references with error handling"""
-    try:
-        client = init_gspread_client()
-        sheet_id = st.secrets["google_sheet"]["sheet_id"]
-        
-        spreadsheet = client.open_by_key(sheet_id)
-        
-        employees_ws = spreadsheet.worksheet("employees")
-        attendance_ws = spreadsheet.worksheet("attendance")
-        users_ws = spreadsheet.worksheet("users")
-        
-        return employees_ws, attendance_ws, users_ws
-    
-    except KeyError:
-        st.error("❌ Error: 'google_sheet' -> 'sheet_id' not found in secrets")
-        st.stop()
-    except gspread.exceptions.WorksheetNotFound as e:
-        st.error(f"❌ Worksheet not found: {str(e)}\n\nPlease ensure your Google Sheet has these worksheets: 'employees', 'attendance', 'users'")
-        st.stop()
-    except gspread.exceptions.APIError as e:
-        st.error(f"❌ Google Sheets API Error: {str(e)}\n\n**Solutions:**\n1. Check that the service account email has access to the Google Sheet\n2. Share the Google Sheet with: `{st.secrets['gcp_service_account'].get('client_email', 'N/A')}`\n3. Verify the sheet_id is correct")
-        st.stop()
-    except Exception as e:
-        st.error(f"❌ Unexpected Error: {str(e)}")
-        st.stop()
-
-try:
-    employees_ws, attendance_ws, users_ws = get_worksheets()
-except:
-    st.stop()
-
-# =====================================================
-# UTILITY FUNCTIONS
-# =====================================================
-
-def load_sheet(ws):
-    """Load worksheet data as DataFrame"""
-    try:
-        return pd.DataFrame(ws.get_all_records())
-    except Exception as e:
-        st.error(f"Error loading sheet: {str(e)}")
-        return pd.DataFrame()
-
-def append_row(ws, data):
-    """Append new row to worksheet"""
-    try:
-        ws.append_row(data)
-    except Exception as e:
-        st.error(f"Error appending row: {str(e)}")
-        raise
+    for report in (shared, sessions):
+        report["MB"] = (report.pop("Bytes") / 1024 / 1024).round(3)
+    return shared, sessions
 
 # =====================================================
 # LOGIN SECTION
 # =====================================================
 
+def set_session_cookie(token):
+    """Point the browser's session cookie at token, or clear the cookie when token is empty
+    
+    Served through asgi.py, the server sets the cookie HttpOnly in exchange for a single-use
+    ticket; under plain `streamlit run` the page script writes it, valid for SCRIPT_COOKIE_SECONDS.
+    """
+    if HTTPONLY_SESSION_COOKIE:
+        request = (
+            f'{{method: "POST", body: "{issue_cookie_ticket(token)}", credentials: "same-origin"}}' if token
+            else '{method: "DELETE", credentials: "same-origin"}'
+        )
+        script = f'fetch("{SESSION_COOKIE_ENDPOINT}", {request});'
+    else:
+        value = (
+            f"{SESSION_COOKIE}={token}; path=/; max-age={SCRIPT_COOKIE_SECONDS}" if token
+            else f"{SESSION_COOKIE}=; path=/; max-age=0"
+        )
+        script = f'document.cookie = "{value}; SameSite=Strict" + (location.protocol === "https:" ? "; Secure" : "");'
+    st.html(f"<script>{script}</script>", unsafe_allow_javascript=True)
+
 def login():
     """Beautiful Modern Login Page - White Background, Narrow"""
     st.markdown('<div class="login-view">', unsafe_allow_html=True)
@@ -514,7 +231,14 @@ def login():
         st.markdown('</div>', unsafe_allow_html=True)
         
         if st.button("Sign In", use_container_width=True, type="primary", key="login_btn"):
-            users = load_sheet(users_ws)
+            import_data_stack()
+            store = get_data_store()
+            
+            if not store["frames"]:
+                show_connection_error(store["error"])
+                return
+            
+            users = store["frames"]["users"]
             
             if users.empty:
                 st.markdown(
@@ -522,22 +246,14 @@ def login():
                     unsafe_allow_html=True
                 )
             else:
-                users["username"] = users["username"].astype(str).str.strip()
-                users["password"] = users["password"].astype(str).str.strip()
-                
-                user = users[
-                    (users["username"] == username.strip()) &
-                    (users["password"] == password.strip())
-                ]
+                user = users[users["username"].astype(str).str.strip() == username.strip()]
+                # Passwords are hashed while the users still come from the local snapshot
+                user = user[user["password"].map(lambda stored: password_matches(stored, password.strip()))]
                 
                 if not user.empty:
-                    st.session_state["logged_in"] = True
-                    st.session_state["role"] = user.iloc[0]["role"]
-                    st.session_state["username"] = username
-                    
-                    # For Staff users, store their employee_id
-                    if user.iloc[0]["role"].lower() == "staff":
-                        st.session_state["employee_id"] = str(username)
+                    # The session lives in the server-side registry; the cookie resumes it after a reconnect
+                    token = open_session(make_principal(username.strip(), user.iloc[0]["role"]))
+                    st.session_state["session_token"] = token
                     
                     st.markdown(
                         '<div class="login-success">✅ Login successful! Redirecting...</div>',
@@ -553,13 +269,50 @@ def login():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-if "logged_in" not in st.session_state:
-    st.session_state["logged_in"] = False
+# Cookies are read when the browser connects, so a token that was signed out of is still listed until it reconnects
+cookie_token = st.context.cookies.get(SESSION_COOKIE)
+if cookie_token == st.session_state.get("ended_token"):
+    cookie_token = None
+
+session_token = st.session_state.get("session_token") or cookie_token
+session = resume_session(session_token)
 
-if not st.session_state["logged_in"]:
+if session is None:
+    if session_token:
+        st.info("⏰ Your session has expired. Please sign in again.")
+        st.session_state.pop("session_token", None)
+        st.session_state["ended_token"] = session_token
+    if st.context.cookies.get(SESSION_COOKIE):
+        set_session_cookie(None)
     login()
     st.stop()
 
+st.session_state["session_token"] = session_token
+# A script-written cookie is short-lived, so it is renewed while the session is in use
+cookie_set = st.session_state.get("session_cookie")
+if cookie_set is None or cookie_set[0] != session_token or (
+    not HTTPONLY_SESSION_COOKIE and time.time() - cookie_set[1] > SCRIPT_COOKIE_SECONDS / 2
+):
+    set_session_cookie(session_token)
+    st.session_state["session_cookie"] = (session_token, time.time())
+principal = session["principal"]
+
+# =====================================================
+# DATA ACCESS
+# =====================================================
+
+import_data_stack()
+store = get_data_store()
+
+if not store["frames"]:
+    show_connection_error(store["error"])
+    st.stop()
+
+start_journal_flusher()
+read_only = store["offline"]
+current_user = principal["username"]
+enforce_session_budget(session)
+
 # =====================================================
 # NAVIGATION BUTTONS
 # =====================================================
@@ -569,19 +322,26 @@ if "current_page" not in st.session_state:
 
 st.markdown(f"""
 <div class="user-info-bar">
-👤 {st.session_state['username']} | Role: {st.session_state['role']}
+👤 {principal['username']} | Role: {principal['role']}
 </div>
 """, unsafe_allow_html=True)
 
-# Determine which pages to show based on role
-is_admin = st.session_state.get("role", "").lower() == "admin"
-is_staff = st.session_state.get("role", "").lower() == "staff"
+if st.button("🚪 Sign Out", key="logout_btn"):
+    end_session(session_token)
+    st.session_state.clear()
+    st.session_state["ended_token"] = session_token
+    st.rerun()
+
+# Pages to show were decided from the role at sign-in
+is_admin = principal["is_admin"]
+is_staff = principal["is_staff"]
+is_head = principal["is_head"]
 
 st.markdown('<div class="nav-container">', unsafe_allow_html=True)
 
 if is_admin:
     # Admin sees all pages
-    col1, col2, col3, col4, col5 = st.columns(5)
+    col1, col2, col3, col4, col5, col6, col7, col8 = st.columns(8)
     
     with col1:
         if st.button("📊 Dashboard", use_container_width=True, key="nav_dashboard"):
@@ -607,10 +367,32 @@ if is_admin:
         if st.button("💰 Payroll", use_container_width=True, key="nav_payroll"):
             st.session_state["current_page"] = "Payroll"
             st.rerun()
+    
+    with col6:
+        if st.button("🏢 Departments", use_container_width=True, key="nav_departments"):
+            st.session_state["current_page"] = "Departments"
+            st.rerun()
+    
+    with col7:
+        if st.button("🌴 Leave", use_container_width=True, key="nav_leave"):
+            st.session_state["current_page"] = "Leave"
+            st.rerun()
+    
+    with col8:
+        if st.button("🔄 Sync Status", use_container_width=True, key="nav_sync"):
+            st.session_state["current_page"] = "Sync Status"
+            st.rerun()
 
-elif is_staff:
-    # Staff only sees their own data
-    col1, col2, col3 = st.columns(3)
+elif is_staff or is_head:
+    # Staff only sees their own data; Department Heads also see their department
+    nav_cols = st.columns(5 if is_head else 4)
+    col1, col2, col3, col4 = nav_cols[-4:]
+    
+    if is_head:
+        with nav_cols[0]:
+            if st.button("🏢 My Department", use_container_width=True, key="nav_my_department"):
+                st.session_state["current_page"] = "Department Dashboard"
+                st.rerun()
     
     with col1:
         if st.button("👤 My Profile", use_container_width=True, key="nav_profile"):
@@ -626,17 +408,122 @@ elif is_staff:
         if st.button("💰 My Payroll", use_container_width=True, key="nav_my_payroll"):
             st.session_state["current_page"] = "Staff Payroll"
             st.rerun()
+    
+    with col4:
+        if st.button("🌴 My Leave", use_container_width=True, key="nav_my_leave"):
+            st.session_state["current_page"] = "Staff Leave"
+            st.rerun()
 
 st.markdown('</div>', unsafe_allow_html=True)
 st.markdown("---")
 
+if read_only:
+    st.warning(
+        f"⚠️ Google Sheets is unreachable. Showing the local snapshot from {store['synced_at']} — "
+        "changes are disabled until the connection is restored."
+    )
+
 # =====================================================
 # PAGE ROUTING
 # =====================================================
 
 menu = st.session_state["current_page"]
-df_emp = load_sheet(employees_ws)
-df_att = load_sheet(attendance_ws)
+
+# Staff pages only ever get the signed-in employee's own slice (see STAFF PAGES)
+if is_admin or is_head:
+    df_emp = store["frames"]["employees"]
+    df_att = store["frames"]["attendance"]
+    rate_history = store["frames"]["rate_history"]
+
+# =====================================================
+# DEPARTMENT DASHBOARD
+# =====================================================
+
+DEPARTMENT_TREND_MONTHS = 12
+
+def department_dashboard(department=None):
+    """Headcount, attendance rate and payroll cost by department, with drill-down to employees"""
+    live_months = set(df_att["date"].astype(str).str[:7]) if not df_att.empty else set()
+    month_list = sorted(live_months | set(archived_months()), reverse=True)
+    
+    if not month_list:
+        st.warning("⚠️ No attendance data available. Please add attendance records first.")
+        st.stop()
+    
+    selected_month = st.selectbox("Select Month", month_list, key="department_month")
+    trend_months = sorted(month for month in month_list if month <= selected_month)[-DEPARTMENT_TREND_MONTHS:]
+    versions = dataset_versions(*PAYROLL_DATASETS)
+    
+    # The drill-down's month payroll computes alongside the rollups rather than after them
+    cube_job = submit_job(("department_cube", tuple(trend_months), versions), get_store_department_cube, trend_months)
+    payroll_job = submit_job(("payroll", selected_month, versions), get_store_payroll, [selected_month])
+    
+    with st.spinner("⏳ Computing department rollups..."):
+        cube = cube_job.result()
+    
+    if department is not None:
+        cube = cube[cube.index.get_level_values("Department") == department]
+        
+        if cube.empty:
+            st.info(f"📭 No employees found in {department}.")
+            st.stop()
+    
+    month_totals = rollup_cube(cube, "Month").loc[selected_month]
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("👥 Headcount", int(month_totals["Headcount"]))
+    col2.metric("📅 Attendance Rate", f"{month_totals['Attendance Rate']:.1%}")
+    col3.metric("💰 Payroll Cost", f"{month_totals['Payroll Cost']:,.2f}")
+    col4.metric("📊 Cost per Head", f"{month_totals['Payroll Cost'] / max(month_totals['Headcount'], 1):,.2f}")
+    
+    month_cube = cube.xs(selected_month, level="Month")
+    
+    if department is None:
+        st.markdown('<div class="section-header">🏢 Departments</div>', unsafe_allow_html=True)
+        st.dataframe(
+            month_cube[["Headcount", "Attendance Rate", "Payroll Cost"]].reset_index(),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Attendance Rate": st.column_config.NumberColumn(format="percent"),
+                "Payroll Cost": st.column_config.NumberColumn(format="%.2f")
+            }
+        )
+    
+    st.markdown('<div class="section-header">📈 Trend</div>', unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.caption("Payroll Cost")
+        st.line_chart(cube["Payroll Cost"].unstack("Department"))
+    
+    with col2:
+        st.caption("Attendance Rate")
+        st.line_chart(cube["Attendance Rate"].unstack("Department"))
+    
+    # Drill-down from a department to its employees for the selected month
+    st.markdown('<div class="section-header">🔍 Employees</div>', unsafe_allow_html=True)
+    
+    if department is None:
+        drill_department = st.selectbox("Department", month_cube.index.tolist(), key="department_drilldown")
+    else:
+        drill_department = department
+    
+    with st.spinner("⏳ Loading employees..."):
+        month_payroll = payroll_job.result()
+    
+    employees = month_payroll[month_payroll["Department"].astype(str) == drill_department]
+    st.dataframe(
+        employees[["Employee ID", "Name", "Present Days", "Overtime Hours", "Total Salary"]].assign(**{
+            "Attendance Rate": employees["Present Days"] / max(int(working_days([selected_month])[0]), 1)
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Attendance Rate": st.column_config.NumberColumn(format="percent"),
+            "Total Salary": st.column_config.NumberColumn(format="%.2f")
+        }
+    )
 
 # =====================================================
 # ADMIN PAGES
@@ -679,7 +566,7 @@ if is_admin:
     elif menu == "Employee Directory":
         st.markdown('<div class="main-header">👥 Employee Directory</div>', unsafe_allow_html=True)
         
-        df = load_sheet(employees_ws)
+        df = df_emp
         
         if df.empty:
             st.info("📭 No employees found. Start by adding new employees.")
@@ -699,19 +586,8 @@ if is_admin:
         with col3:
             filter_status = st.selectbox("Filter by Status", ["All", "Active", "Inactive"])
         
-        filtered_df = df.copy()
-        
-        if search_term:
-            filtered_df = filtered_df[
-                (filtered_df["full_name"].str.contains(search_term, case=False, na=False)) |
-                (filtered_df["employee_id"].astype(str).str.contains(search_term, na=False))
-            ]
-        
-        if filter_dept != "All":
-            filtered_df = filtered_df[filtered_df["department"] == filter_dept]
-        
-        if filter_status != "All":
-            filtered_df = filtered_df[filtered_df["status"] == filter_status]
+        # Shared with every session running the same query on the same data
+        filtered_df, employee_options = directory_query(search_term, filter_dept, filter_status)
         
         st.markdown(f"**📋 Total Records: {len(filtered_df)}**")
         st.dataframe(filtered_df, use_container_width=True, hide_index=True)
@@ -720,11 +596,6 @@ if is_admin:
         st.markdown('<div class="section-header">⚙️ Manage Employee</div>', unsafe_allow_html=True)
         
         if not filtered_df.empty:
-            employee_options = [
-                f"{row['employee_id']} - {row['full_name']}"
-                for _, row in filtered_df.iterrows()
-            ]
-            
             selected_option = st.selectbox("Select Employee", employee_options)
             selected_id = selected_option.split(" - ")[0]
             
@@ -762,17 +633,16 @@ if is_admin:
                     
                     daily_rate_meal = st.number_input("Daily Rate Meal Allowance", value=float(selected_emp.get("daily_rate_meal", 0)))
                     allowance_monthly = st.number_input("Monthly Allowance", value=float(selected_emp.get("allowance_monthly", 0)))
+                    rates_effective = st.date_input("Rate Changes Effective From", value=date.today())
                     
                     col1, col2 = st.columns(2)
                     with col1:
-                        update = st.form_submit_button("💾 Update", use_container_width=True, type="primary")
+                        update = st.form_submit_button("💾 Update", use_container_width=True, type="primary", disabled=read_only)
                     with col2:
                         cancel = st.form_submit_button("❌ Cancel", use_container_width=True)
                     
                     if update:
                         try:
-                            row_number = int(df.index[df["employee_id"].astype(str) == str(selected_id)][0]) + 2
-                            
                             updated_row = [
                                 str(selected_id),
                                 str(full_name),
@@ -794,7 +664,17 @@ if is_admin:
                                 str(selected_emp["status"])
                             ]
                             
-                            employees_ws.update(f"A{row_number}:R{row_number}", [updated_row])
+                            new_rates = [daily_rate_basic, daily_rate_transport, daily_rate_meal, allowance_monthly]
+                            old_rates = pd.to_numeric(
+                                pd.Series([selected_emp.get(column, 0) for column in RATE_COLUMNS]), errors="coerce"
+                            ).fillna(0.0).tolist()
+                            
+                            # Rate changes are recorded with their effective date so past payroll keeps the old rates
+                            if new_rates != old_rates:
+                                submit_write(store, "rate_history", "append", {
+                                    "rows": rate_history_rows(rate_history, selected_emp, rates_effective, new_rates)
+                                }, current_user)
+                            submit_write(store, "employees", "update", {"row": updated_row}, current_user)
                             st.success("✅ Employee Updated Successfully!")
                             st.session_state["edit_mode"] = False
                             st.rerun()
@@ -811,10 +691,9 @@ if is_admin:
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button("✅ Yes, Delete", use_container_width=True, type="secondary"):
+                    if st.button("✅ Yes, Delete", use_container_width=True, type="secondary", disabled=read_only):
                         try:
-                            row_number = int(df.index[df["employee_id"].astype(str) == str(selected_id)][0]) + 2
-                            employees_ws.delete_rows(row_number)
+                            submit_write(store, "employees", "delete", {"employee_id": str(selected_id)}, current_user)
                             st.success("✅ Employee Deleted Successfully!")
                             st.session_state["confirm_delete"] = False
                             st.rerun()
@@ -830,6 +709,70 @@ if is_admin:
     elif menu == "Add New Employee":
         st.markdown('<div class="main-header">➕ Add New Employee</div>', unsafe_allow_html=True)
         
+        add_mode = st.radio("Add", ["Single Employee", "Bulk Upload"], horizontal=True, key="add_mode", label_visibility="collapsed")
+        
+        if add_mode == "Bulk Upload":
+            st.markdown('<div class="section-header">📤 Bulk Upload</div>', unsafe_allow_html=True)
+            st.caption(
+                f"CSV or Excel file with one employee per row and these columns: {', '.join(EMPLOYEE_COLUMNS)}. "
+                f"Only {', '.join(REQUIRED_EMPLOYEE_COLUMNS)} are required. Rows with an existing Employee ID "
+                "update that employee, and columns left out keep their current values."
+            )
+            
+            uploaded_file = st.file_uploader("Employee File", type=["csv", "xlsx"], key="employee_upload")
+            
+            if uploaded_file is None:
+                st.stop()
+            
+            try:
+                plan, problems = validate_employee_upload(read_employee_upload(uploaded_file), df_emp)
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+                st.stop()
+            
+            pending = plan[plan["Action"] != "Unchanged"]
+            
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("➕ New", int((plan["Action"] == "Insert").sum()))
+            col2.metric("✏️ Updated", int((plan["Action"] == "Update").sum()))
+            col3.metric("➖ Unchanged", int((plan["Action"] == "Unchanged").sum()))
+            col4.metric("❌ Rejected Rows", problems["Row"].nunique())
+            
+            if not problems.empty:
+                st.warning("⚠️ Some rows were rejected and will not be applied:")
+                st.dataframe(problems, use_container_width=True, hide_index=True)
+            
+            if pending.empty:
+                st.info("📭 The file contains no changes to apply.")
+                st.stop()
+            
+            st.markdown('<div class="section-header">🔍 Preview Changes</div>', unsafe_allow_html=True)
+            st.dataframe(
+                pending[["Action", "employee_id", "full_name", "department", "position", "Changes"]],
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            rates_effective = st.date_input(
+                "Rate Changes Effective From",
+                value=date.today(),
+                key="upload_rates_effective",
+                help="New employees' rates apply from their join date."
+            )
+            
+            if st.button(f"💾 Apply {len(pending)} Changes", use_container_width=True, type="primary", disabled=read_only, key="apply_upload"):
+                employees_payload, rates_payload = employee_upload_writes(plan, df_emp, rate_history, rates_effective)
+                
+                try:
+                    submit_write(store, "employees", "upsert", employees_payload, current_user)
+                    if rates_payload["rows"]:
+                        submit_write(store, "rate_history", "append", rates_payload, current_user)
+                    st.success(f"✅ {len(pending)} employees saved!")
+                except Exception as e:
+                    st.error(f"❌ Error saving employees: {str(e)}")
+            
+            st.stop()
+        
         tab1, tab2, tab3 = st.tabs(["👤 Personal Info", "💼 Job Info", "💰 Compensation"])
         
         with tab1:
@@ -879,22 +822,20 @@ if is_admin:
         
             st.markdown("---")
 
-        if st.button("💾 Save New Employee", use_container_width=True, type="primary"):
+        if st.button("💾 Save New Employee", use_container_width=True, type="primary", disabled=read_only):
 
             if not employee_id or not full_name or not department or not position:
                 st.error("❌ Please fill in all required fields (ID, Name, Department, Position)")
 
             else:
                 try:
-                    df_existing = load_sheet(employees_ws)
-
-                    existing_ids = df_existing["employee_id"].astype(str).tolist() if not df_existing.empty else []
+                    existing_ids = df_emp["employee_id"].astype(str).tolist() if not df_emp.empty else []
 
                     if str(employee_id) in existing_ids:
                         st.warning(f"⚠️ Employee ID {employee_id} already exists in the system!")
 
                     else:
-                        append_row(employees_ws, [
+                        submit_write(store, "employees", "insert", {"row": [
                             str(employee_id),
                             str(full_name),
                             str(place_of_birth),
@@ -913,7 +854,11 @@ if is_admin:
                             float(daily_rate_meal),
                             float(allowance_monthly),
                             "Active"
-                        ])
+                        ]}, current_user)
+                        submit_write(store, "rate_history", "append", {"rows": [[
+                            str(employee_id), str(join_date),
+                            float(daily_rate_basic), float(daily_rate_transport), float(daily_rate_meal), float(allowance_monthly)
+                        ]]}, current_user)
 
                         st.success(f"✅ Employee {full_name} successfully added!")
 
@@ -928,6 +873,93 @@ if is_admin:
             st.warning("⚠️ No employees registered in the system. Please add employees first.")
             st.stop()
         
+        attendance_mode = st.radio(
+            "Mode",
+            ["📋 Daily Roster", "✏️ Mark Attendance"],
+            horizontal=True,
+            key="attendance_mode"
+        )
+        
+        if attendance_mode == "✏️ Mark Attendance":
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                entry_date = st.date_input("Date", value=date.today(), key="att_entry_date")
+            
+            with col2:
+                entry_period = st.selectbox("Period", ["Single Day", "Whole Week"], key="att_entry_period")
+            
+            with col3:
+                departments = ["All"] + sorted(df_emp["department"].astype(str).unique().tolist())
+                entry_dept = st.selectbox("Filter by Department", departments, key="att_entry_dept")
+            
+            if entry_period == "Whole Week":
+                week_start = entry_date - timedelta(days=entry_date.weekday())
+                entry_dates = [str(week_start + timedelta(days=offset)) for offset in range(7)]
+            else:
+                entry_dates = [str(entry_date)]
+            
+            roster_emp = df_emp[df_emp["status"] == "Active"]
+            if entry_dept != "All":
+                roster_emp = roster_emp[roster_emp["department"].astype(str) == entry_dept]
+            
+            if roster_emp.empty:
+                st.info("📭 No active employees found for the selected department.")
+                st.stop()
+            
+            current_grid = build_attendance_grid(roster_emp, df_att, entry_dates)
+            
+            if "att_editor_rev" not in st.session_state:
+                st.session_state["att_editor_rev"] = 0
+            
+            col1, col2 = st.columns([3, 1])
+            
+            with col1:
+                bulk_status = st.selectbox("Mark everyone as", ATTENDANCE_STATUSES, key="att_bulk_status")
+            
+            with col2:
+                st.write("")
+                if st.button("📌 Apply to All", use_container_width=True, key="att_bulk_apply"):
+                    st.session_state["att_bulk_fill"] = (tuple(entry_dates), entry_dept, bulk_status)
+                    st.session_state["att_editor_rev"] += 1
+            
+            editor_grid = current_grid
+            bulk_fill = st.session_state.get("att_bulk_fill")
+            if bulk_fill and bulk_fill[:2] == (tuple(entry_dates), entry_dept):
+                editor_grid = current_grid.assign(**{day: bulk_fill[2] for day in entry_dates})
+            
+            edited_grid = st.data_editor(
+                editor_grid,
+                column_config={
+                    day: st.column_config.SelectboxColumn(day, options=ATTENDANCE_STATUSES)
+                    for day in entry_dates
+                },
+                disabled=["Employee ID", "Name"],
+                hide_index=True,
+                use_container_width=True,
+                key=f"att_editor_{st.session_state['att_editor_rev']}"
+            )
+            
+            changes = diff_attendance_grid(current_grid, edited_grid, entry_dates)
+            st.markdown(f"**📝 Pending changes: {len(changes)}**")
+            
+            if st.button("💾 Save Attendance", use_container_width=True, type="primary",
+                         disabled=read_only or not changes, key="att_save"):
+                try:
+                    submit_write(
+                        store, "attendance", "upsert",
+                        {"changes": [list(change) for change in changes], "overwrite": True},
+                        current_user
+                    )
+                    st.session_state.pop("att_bulk_fill", None)
+                    st.session_state["att_editor_rev"] += 1
+                    st.success(f"✅ Attendance saved: {len(changes)} change(s).")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Error saving attendance: {str(e)}")
+            
+            st.stop()
+        
         if df_att.empty:
             st.info("📭 No attendance records found.")
         else:
@@ -935,42 +967,26 @@ if is_admin:
                 dates = sorted(df_att["date"].unique(), reverse=True)
                 selected_date = st.selectbox("Select Date", dates)
                 
-                df_filtered = df_att[df_att["date"] == selected_date].copy()
-                
-                df_filtered = df_filtered.merge(
-                    df_emp[['employee_id', 'full_name']],
-                    on='employee_id',
-                    how='inner'
-                )
+                day_att = df_att[df_att["date"] == selected_date]
+                day_status = day_att.assign(employee_id=day_att["employee_id"].astype(str)).drop_duplicates(
+                    "employee_id", keep="last"
+                ).set_index("employee_id")["status"]
                 
-                all_employees = df_emp[['employee_id', 'full_name']].copy()
-                
-                complete_attendance = []
-                for _, emp in all_employees.iterrows():
-                    emp_id = emp['employee_id']
-                    emp_name = emp['full_name']
-                    
-                    emp_record = df_filtered[df_filtered['employee_id'] == emp_id]
-                    
-                    if not emp_record.empty:
-                        status = emp_record.iloc[0]['status']
-                    else:
-                        status = 'Absent'
-                    
-                    complete_attendance.append({
-                        'Employee ID': emp_id,
-                        'Name': emp_name,
-                        'Date': selected_date,
-                        'Status': status
-                    })
-                
-                df_complete = pd.DataFrame(complete_attendance)
+                # Every employee is listed; records for IDs not in the employee list are shown below instead of dropped
+                df_complete = pd.DataFrame({
+                    'Employee ID': df_emp['employee_id'].to_numpy(),
+                    'Name': df_emp['full_name'].to_numpy(),
+                    'Date': selected_date,
+                    'Status': df_emp['employee_id'].astype(str).map(day_status).fillna('Absent').to_numpy()
+                })
+                unknown_att = day_att[~day_att["employee_id"].astype(str).isin(df_emp["employee_id"].astype(str))]
                 
                 df_complete.insert(0, 'No.', range(1, len(df_complete) + 1))
                 
                 total_employees = len(df_complete)
                 present_count = len(df_complete[df_complete['Status'].str.lower() == 'present'])
                 absent_count = len(df_complete[df_complete['Status'].str.lower() == 'absent'])
+                leave_count = int(df_complete['Status'].isin(LEAVE_ATTENDANCE_STATUSES).sum())
                 
                 st.markdown(f"""
                 <div class="attendance-summary">
@@ -984,6 +1000,11 @@ if is_admin:
                         <div style="font-size: 0.9rem; opacity: 0.9;">Absent</div>
                         <div style="font-size: 2.5rem; margin-top: 0.5rem;">{absent_count}</div>
                     </div>
+                    <div class="attendance-card leave-card">
+                        <div style="font-size: 2rem; margin-bottom: 0.5rem;">🌴</div>
+                        <div style="font-size: 0.9rem; opacity: 0.9;">On Leave</div>
+                        <div style="font-size: 2.5rem; margin-top: 0.5rem;">{leave_count}</div>
+                    </div>
                     <div class="attendance-card total-card">
                         <div style="font-size: 2rem; margin-bottom: 0.5rem;">👥</div>
                         <div style="font-size: 0.9rem; opacity: 0.9;">Total</div>
@@ -994,6 +1015,31 @@ if is_admin:
                 
                 st.markdown(f"**📋 Detailed Records for {selected_date}:**")
                 st.dataframe(df_complete, use_container_width=True, hide_index=True)
+                
+                if not unknown_att.empty:
+                    st.warning(f"⚠️ {len(unknown_att)} record(s) on {selected_date} belong to employee IDs that are not in the employee list:")
+                    st.dataframe(unknown_att, use_container_width=True, hide_index=True)
+                
+                st.markdown("---")
+                st.markdown('<div class="section-header">🩺 Data Quality</div>', unsafe_allow_html=True)
+                
+                issues = get_attendance_issues()
+                
+                if issues.empty:
+                    st.success("✅ No attendance data issues found.")
+                else:
+                    st.warning(f"⚠️ {len(issues)} attendance record(s) need attention.")
+                    
+                    issue_counts = issues["Issue"].value_counts()
+                    for col, (issue, count) in zip(st.columns(len(issue_counts)), issue_counts.items()):
+                        col.metric(issue, int(count))
+                    
+                    issue_filter = st.selectbox("Show", ["All"] + issue_counts.index.tolist(), key="att_issue_filter")
+                    st.dataframe(
+                        issues if issue_filter == "All" else issues[issues["Issue"] == issue_filter],
+                        use_container_width=True,
+                        hide_index=True
+                    )
             else:
                 st.warning("⚠️ Attendance data format is incorrect. Missing 'date' or 'employee_id' columns.")
     
@@ -1001,14 +1047,116 @@ if is_admin:
     elif menu == "Payroll":
         st.markdown('<div class="main-header">💰 Payroll Management</div>', unsafe_allow_html=True)
         
-        if df_att.empty:
+        live_months = set(df_att["date"].astype(str).str[:7]) if not df_att.empty else set()
+        month_list = sorted(live_months | set(archived_months()), reverse=True)
+        
+        if not month_list:
             st.warning("⚠️ No attendance data available. Please add attendance records first.")
             st.stop()
         
+        report_type = st.radio(
+            "Report Type",
+            ["Single Month", "Month Range", "Year to Date"],
+            horizontal=True,
+            key="payroll_report_type"
+        )
+        
+        if report_type != "Single Month":
+            col1, col2, col3 = st.columns(3)
+            
+            if report_type == "Year to Date":
+                years = sorted({month[:4] for month in month_list}, reverse=True)
+                
+                with col1:
+                    selected_year = st.selectbox("Select Year", years, key="payroll_ytd_year")
+                
+                start_month = f"{selected_year}-01"
+                end_month = max(month for month in month_list if month.startswith(selected_year))
+            else:
+                with col1:
+                    start_month = st.selectbox("From Month", sorted(month_list), key="payroll_range_start")
+                
+                with col2:
+                    end_month = st.selectbox("To Month", month_list, key="payroll_range_end")
+            
+            with col3:
+                departments = ["All"] + sorted(df_emp["department"].astype(str).unique().tolist())
+                range_dept = st.selectbox("Filter by Department", departments, key="payroll_range_dept")
+            
+            if start_month > end_month:
+                st.warning("⚠️ 'From Month' must not be after 'To Month'.")
+                st.stop()
+            
+            range_months = month_range(start_month, end_month)
+            range_emp = df_emp if range_dept == "All" else df_emp[df_emp["department"].astype(str) == range_dept]
+            
+            if range_emp.empty:
+                st.info("📭 No employees found for the selected department.")
+                st.stop()
+            
+            # Each month is computed in the worker pool (the same jobs the single-month page uses), so the
+            # totals fill in as months finish; the table and the export follow once all are in
+            versions = dataset_versions(*PAYROLL_DATASETS)
+            month_jobs = [submit_job(("payroll", month, versions), get_store_payroll, [month]) for month in range_months]
+            
+            st.markdown("---")
+            st.markdown(
+                f'<div class="section-header">💼 Payroll Report {start_month} to {end_month}</div>',
+                unsafe_allow_html=True
+            )
+            
+            total_slot, average_slot, count_slot, months_slot = (col.empty() for col in st.columns(4))
+            total_slot.metric("💰 Total Payroll", "…")
+            average_slot.metric("📊 Avg Monthly Payroll", "…")
+            count_slot.metric("👥 Employee Count", len(range_emp))
+            months_slot.metric("📅 Months", len(range_months))
+            
+            st.markdown("---")
+            table_slot = st.empty()
+            st.markdown("---")
+            export_slot = st.empty()
+            export_slot.info("⏳ The Excel export is prepared once the report is complete.")
+            
+            running_total = 0.0
+            for done, job in enumerate(as_completed(month_jobs), start=1):
+                month_payroll = job.result()
+                if range_dept != "All":
+                    month_payroll = month_payroll[month_payroll["Department"] == range_dept]
+                running_total += month_payroll["Total Salary"].sum()
+                total_slot.metric(
+                    "💰 Total Payroll", f"{running_total:,.2f}",
+                    delta=f"{done} of {len(range_months)} months", delta_color="off"
+                )
+                table_slot.progress(done / len(range_months), text=f"⏳ Computing payroll report... {done} of {len(range_months)} months")
+            
+            # Every month is cached by now, so the report only assembles them
+            report_key = ("payroll_range", tuple(range_months), range_dept, versions)
+            range_payroll, range_summary, sheets = submit_job(report_key, payroll_range_report, range_months, range_dept).result()
+            
+            total_slot.metric("💰 Total Payroll", f"{range_summary['Total'].sum():,.2f}")
+            average_slot.metric("📊 Avg Monthly Payroll", f"{range_summary['Total'].sum() / len(range_months):,.2f}")
+            count_slot.metric("👥 Employee Count", len(range_summary))
+            table_slot.dataframe(range_summary, use_container_width=True, hide_index=True)
+            
+            export_slot.info("⏳ Preparing Excel export...")
+            try:
+                workbook_job = submit_job(("workbook",) + report_key, workbook_bytes, sheets)
+                export_slot.download_button(
+                    "⬇️ Download Payroll Report Excel",
+                    data=workbook_job.result(),
+                    file_name=f"Payroll_{start_month}_to_{end_month}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True,
+                    type="primary"
+                )
+            except Exception as e:
+                export_slot.error(f"Error exporting payroll: {str(e)}")
+            
+            st.stop()
+        
         col1, col2, col3 = st.columns([2, 2, 1])
         
         with col1:
-            month_list = sorted(df_att["date"].str[:7].unique(), reverse=True)
             selected_month = st.selectbox("Select Month", month_list)
         
         with col2:
@@ -1017,48 +1165,15 @@ if is_admin:
         with col3:
             edit_mode = st.toggle("✏️ Edit Mode")
         
-        df_month = df_att[df_att["date"].str.startswith(selected_month)]
-        
-        payroll = []
-        for _, emp in df_emp.iterrows():
-            present_days = len(
-                df_month[
-                    (df_month["employee_id"] == emp["employee_id"]) &
-                    (df_month["status"].astype(str).str.lower() == "present")
-                ]
-            )
-            
-            daily_basic = float(emp.get("daily_rate_basic", 0))
-            daily_transport = float(emp.get("daily_rate_transport", 0))
-            daily_meal = float(emp.get("daily_rate_meal", 0))
-            allowance_monthly = float(emp.get("allowance_monthly", 0))
-            
-            salary_from_attendance = (daily_basic + daily_transport + daily_meal) * present_days
-            
-            payroll.append({
-                "Employee ID": emp["employee_id"],
-                "Name": emp["full_name"],
-                "Bank Account": str(emp.get("bank_account_number", "")),
-                "Present Days": present_days,
-                "Daily Basic": daily_basic,
-                "Daily Transport": daily_transport,
-                "Daily Meal": daily_meal,
-                "Monthly Allowance": allowance_monthly,
-                "Salary from Attendance": salary_from_attendance,
-                "Overtime": 0.0,
-                "Bonus": 0.0
-            })
-        
-        payroll_df = pd.DataFrame(payroll)
-        
-        column_order = [
-            "Employee ID", "Name", "Bank Account", "Present Days",
-            "Daily Basic", "Daily Transport", "Daily Meal", "Monthly Allowance",
-            "Salary from Attendance", "Overtime", "Bonus"
-        ]
-        payroll_df = payroll_df[column_order]
+        payroll_job = submit_job(
+            ("payroll", selected_month, dataset_versions(*PAYROLL_DATASETS)),
+            get_store_payroll, [selected_month]
+        )
         
         if edit_mode:
+            with st.spinner("⏳ Computing payroll..."):
+                payroll_df = payroll_job.result()[PAYROLL_COLUMNS]
+            
             st.markdown('<div class="section-header">✏️ Edit Payroll Data</div>', unsafe_allow_html=True)
             edited_df = st.data_editor(payroll_df, use_container_width=True, num_rows="dynamic", key="payroll_editor")
             
@@ -1066,78 +1181,321 @@ if is_admin:
             
             if st.button("💾 Save Changes", use_container_width=True, type="primary"):
                 st.info("✅ Payroll changes saved successfully!")
-                payroll_df = edited_df.copy()
-        else:
-            edited_df = payroll_df.copy()
+                payroll_df = edited_df
         
-        edited_df["Total Salary"] = (
-            edited_df["Salary from Attendance"] +
-            edited_df["Monthly Allowance"] +
-            edited_df["Overtime"] +
-            edited_df["Bonus"]
-        )
+        # The whole page is laid out before waiting on the payroll: the metrics, table, Excel export,
+        # bank file and payslips each fill in as soon as what they need is ready
+        total_slot, average_slot, count_slot, month_slot = (col.empty() for col in st.columns(4))
+        total_slot.metric("💰 Total Payroll", "…")
+        average_slot.metric("📊 Avg Salary", "…")
+        count_slot.metric("👥 Employee Count", len(df_emp))
+        month_slot.metric("📅 Month", selected_month)
         
         st.markdown("---")
         st.markdown('<div class="section-header">💼 Payroll Summary</div>', unsafe_allow_html=True)
+        table_slot = st.empty()
+        st.markdown("---")
+        export_slot = st.empty()
+        
+        st.markdown("---")
+        st.markdown('<div class="section-header">🏦 Bank Transfer File</div>', unsafe_allow_html=True)
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            bank_file_format = st.radio("File Format", BANK_FILE_FORMATS, horizontal=True, key="bank_file_format")
+        
+        with col2:
+            payment_date = st.date_input("Payment Date", value=date.today(), key="bank_payment_date")
+        
+        bank_notes_slot = st.empty()
+        bank_slot = st.empty()
+        
+        st.markdown("---")
+        st.markdown('<div class="section-header">🧾 Payslips</div>', unsafe_allow_html=True)
+        payslips_slot = st.empty()
+        
+        if not edit_mode:
+            table_slot.info("⏳ Computing payroll...")
+        export_slot.info("⏳ Preparing Excel export...")
+        bank_slot.info("⏳ Preparing the bank transfer file...")
+        payslips_slot.info("⏳ Preparing payslips...")
+        
+        # Money goes out as computed: edits made in Edit Mode are never saved, so they stay out of these files
+        computed_df = payroll_job.result()
+        if not edit_mode:
+            edited_df = computed_df[PAYROLL_COLUMNS]
+        
+        edited_df = edited_df.assign(**{"Total Salary": payroll_total(edited_df)})
+        
+        total_slot.metric("💰 Total Payroll", f"{edited_df['Total Salary'].sum():,.2f}")
+        average_slot.metric("📊 Avg Salary", f"{edited_df['Total Salary'].mean():,.2f}")
+        count_slot.metric("👥 Employee Count", len(edited_df))
+        table_slot.dataframe(edited_df, use_container_width=True, hide_index=True)
+        
+        # The workbook and the payslips render in the pool side by side
+        export_df = edited_df.assign(**{"Bank Account": edited_df["Bank Account"].astype(str)})
+        workbook_job = submit_job(("workbook", payroll_fingerprint(export_df)), workbook_bytes, {"Payroll": export_df})
+        payslips_job = submit_job(
+            ("payslips", selected_month, payroll_fingerprint(computed_df)),
+            payslip_archive, computed_df, selected_month
+        )
+        payslips_slot.info(f"⏳ Preparing {len(computed_df)} payslips...")
+        
+        excluded = bank_transfer_exclusions(computed_df)
+        bank_problems = bank_transfer_problems(computed_df, selected_month)
+        
+        with bank_notes_slot.container():
+            if edit_mode:
+                st.info("ℹ️ The transfer file and payslips use the computed payroll, not the edits above.")
+            
+            if excluded:
+                st.warning(
+                    f"⚠️ {len(excluded)} employee(s) are left out of the transfer file: "
+                    + ", ".join(f"{name} ({reason})" for name, reason in excluded)
+                )
+            
+            if bank_problems:
+                st.error(
+                    f"❌ {len(bank_problems)} bank record(s) can't be written until the employee details are fixed: "
+                    + ", ".join(f"{name} ({problem})" for name, problem in bank_problems)
+                )
+        
+        bank_slot.download_button(
+            "⬇️ Download Bank Transfer File",
+            data=b"" if bank_problems else bank_transfer_file(computed_df, selected_month, payment_date, bank_file_format),
+            file_name=f"Transfer_{selected_month}.{'csv' if bank_file_format == 'CSV' else 'txt'}",
+            mime="text/csv" if bank_file_format == "CSV" else "text/plain",
+            use_container_width=True,
+            disabled=bool(bank_problems),
+            key="bank_file_download"
+        )
+        
+        for job in as_completed([workbook_job, payslips_job]):
+            if job is workbook_job:
+                try:
+                    export_slot.download_button(
+                        "⬇️ Download Payroll Excel",
+                        data=job.result(),
+                        file_name=f"Payroll_{selected_month}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        use_container_width=True,
+                        type="primary"
+                    )
+                except Exception as e:
+                    export_slot.error(f"Error exporting payroll: {str(e)}")
+            else:
+                try:
+                    payslips_slot.download_button(
+                        f"⬇️ Download All Payslips ({len(computed_df)})",
+                        data=job.result(),
+                        file_name=f"Payslips_{selected_month}.zip",
+                        mime="application/zip",
+                        use_container_width=True,
+                        key="payslips_download"
+                    )
+                except Exception as e:
+                    payslips_slot.error(f"Error generating payslips: {str(e)}")
+    
+    # DEPARTMENTS
+    elif menu == "Departments":
+        st.markdown('<div class="main-header">🏢 Department Overview</div>', unsafe_allow_html=True)
+        
+        if df_emp.empty:
+            st.warning("⚠️ No employee data. Please add employees to get started.")
+        else:
+            department_dashboard()
+    
+    # LEAVE
+    elif menu == "Leave":
+        st.markdown('<div class="main-header">🌴 Leave Management</div>', unsafe_allow_html=True)
+        
+        leave_requests = leave_requests_frame(store["frames"]["leave_requests"])
+        employee_names = df_emp.assign(employee_id=df_emp["employee_id"].astype(str)).drop_duplicates(
+            "employee_id", keep="last"
+        ).set_index("employee_id")["full_name"]
         
-        st.dataframe(edited_df, use_container_width=True, hide_index=True)
+        st.markdown('<div class="section-header">⏳ Pending Requests</div>', unsafe_allow_html=True)
+        
+        pending = leave_requests[leave_requests["status"].astype(str) == "Pending"]
+        
+        if pending.empty:
+            st.info("📭 No leave requests waiting for a decision.")
+        else:
+            for request in pending.to_dict("records"):
+                col1, col2, col3 = st.columns([4, 1, 1])
+                
+                with col1:
+                    name = employee_names.get(str(request["employee_id"]), request["employee_id"])
+                    st.write(
+                        f"**{name}** — {request['leave_type']} leave, {request['start_date']} to {request['end_date']} "
+                        f"({request['days']} days){': ' + str(request['reason']) if str(request['reason']) else ''}"
+                    )
+                
+                with col2:
+                    approve = st.button("✅ Approve", use_container_width=True, key=f"leave_approve_{request['request_id']}",
+                                        disabled=read_only)
+                
+                with col3:
+                    reject = st.button("❌ Reject", use_container_width=True, key=f"leave_reject_{request['request_id']}",
+                                       disabled=read_only)
+                
+                if approve or reject:
+                    try:
+                        # Approving also marks the leave days in attendance, so payroll pays them
+                        if decide_leave_request(store, request, "Approved" if approve else "Rejected", current_user):
+                            st.success(f"✅ Leave request {'approved' if approve else 'rejected'}.")
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ This request was already decided or cancelled. Refresh to see its status.")
+                    except Exception as e:
+                        st.error(f"❌ Error saving decision: {str(e)}")
         
         st.markdown("---")
+        st.markdown('<div class="section-header">📒 Leave Balances</div>', unsafe_allow_html=True)
+        
+        ledger = get_leave_ledger().reset_index()
+        
+        if ledger.empty:
+            st.info("📭 No leave balances yet.")
+        else:
+            ledger.insert(1, "Name", ledger["employee_id"].map(employee_names))
+            st.dataframe(
+                ledger.rename(columns={"employee_id": "Employee ID", "leave_type": "Leave Type"}),
+                use_container_width=True,
+                hide_index=True
+            )
+        
+        st.markdown('<div class="section-header">📋 All Requests</div>', unsafe_allow_html=True)
+        
+        status_filter = st.selectbox("Status", ["All"] + LEAVE_REQUEST_STATUSES, key="leave_status_filter")
+        shown_requests = leave_requests if status_filter == "All" else leave_requests[leave_requests["status"].astype(str) == status_filter]
+        
+        if shown_requests.empty:
+            st.info("📭 No leave requests found.")
+        else:
+            st.dataframe(shown_requests.iloc[::-1], use_container_width=True, hide_index=True)
+    
+    # SYNC STATUS
+    elif menu == "Sync Status":
+        st.markdown('<div class="main-header">🔄 Sync Status</div>', unsafe_allow_html=True)
+        
+        status_counts = journal_status()
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("💰 Total Payroll", f"{edited_df['Total Salary'].sum():,.2f}")
+            st.metric("⏳ Pending Writes", status_counts.get("pending", 0))
         
         with col2:
-            st.metric("📊 Avg Salary", f"{edited_df['Total Salary'].mean():,.2f}")
+            st.metric("❌ Failed Writes", status_counts.get("failed", 0))
         
         with col3:
-            st.metric("👥 Employee Count", len(edited_df))
+            st.metric("🕒 Last Sheets Sync", store["synced_at"] or "Never")
         
         with col4:
-            st.metric("📅 Month", selected_month)
+            st.metric("🌐 Google Sheets", "Offline" if read_only else "Online")
         
-        st.markdown("---")
+        col1, col2 = st.columns(2)
         
-        try:
-            output = BytesIO()
-            export_df = edited_df.copy()
-            export_df["Bank Account"] = export_df["Bank Account"].astype(str)
-            
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                export_df.to_excel(writer, index=False, sheet_name="Payroll")
-                worksheet = writer.sheets["Payroll"]
-                for cell in worksheet["C"]:
-                    cell.number_format = "@"
-            
-            output.seek(0)
+        with col1:
+            if st.button("🔁 Retry Failed Writes", use_container_width=True, key="retry_failed_btn",
+                         disabled=not status_counts.get("failed")):
+                retry_failed_writes()
+                st.rerun()
+        
+        with col2:
+            if st.button("🔄 Sync Now", use_container_width=True, key="sync_now_btn"):
+                refresh_data()
+                st.rerun()
+        
+        st.markdown('<div class="section-header">📋 Recent Writes</div>', unsafe_allow_html=True)
+        
+        journal_df = recent_journal_entries()
+        
+        if journal_df.empty:
+            st.info("📭 No writes recorded yet.")
+        else:
+            st.dataframe(journal_df, use_container_width=True, hide_index=True)
+        
+        st.markdown('<div class="section-header">📜 Audit Log</div>', unsafe_allow_html=True)
+        
+        audit_search = st.text_input("Filter by Employee ID", placeholder="Enter employee ID", key="audit_search")
+        audit_df = recent_audit_entries(entity=audit_search.strip())
+        
+        if audit_df.empty:
+            st.info("📭 No changes recorded yet.")
+        else:
+            st.dataframe(audit_df, use_container_width=True, hide_index=True)
+        
+        st.markdown('<div class="section-header">🧠 Memory</div>', unsafe_allow_html=True)
+        
+        shared_memory, session_memory = memory_report(store)
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("📦 Shared Data", f"{shared_memory['MB'].sum():,.1f} MB")
+        
+        with col2:
+            st.metric("👥 Sessions", len(session_memory))
+        
+        with col3:
+            st.metric("🧍 Session State", f"{session_memory['MB'].sum():,.1f} MB")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.dataframe(shared_memory, use_container_width=True, hide_index=True)
+        
+        with col2:
+            st.dataframe(session_memory, use_container_width=True, hide_index=True)
+        
+        st.markdown('<div class="section-header">🗄️ Attendance Archive</div>', unsafe_allow_html=True)
+        st.write(f"**Archived months:** {', '.join(archived_months()) or 'None'}")
+        
+        closed_months = closed_live_months(df_att)
+        
+        if not closed_months:
+            st.info("📭 No closed months left in the live attendance sheet.")
+        else:
+            months_to_archive = st.multiselect("Closed months to archive", closed_months, key="archive_months")
             
-            st.download_button(
-                "⬇️ Download Payroll Excel",
-                data=output,
-                file_name=f"Payroll_{selected_month}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True,
-                type="primary"
-            )
-        except Exception as e:
-            st.error(f"Error exporting payroll: {str(e)}")
+            if st.button("🗄️ Archive Selected Months", use_container_width=True, key="archive_btn",
+                         disabled=read_only or not months_to_archive):
+                try:
+                    # Partitions are written now; the sheet rows are removed by the journal flusher
+                    for month in months_to_archive:
+                        write_archive_partition(month, df_att[df_att["date"].astype(str).str[:7] == month])
+                    submit_write(store, "attendance", "archive", {"months": months_to_archive}, current_user)
+                    st.success(f"✅ Archived {len(months_to_archive)} month(s).")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Error archiving attendance: {str(e)}")
 
 # =====================================================
 # STAFF PAGES
 # =====================================================
 
-elif is_staff:
-    staff_id = st.session_state.get("employee_id")
-    staff_employee = df_emp[df_emp["employee_id"].astype(str) == str(staff_id)].iloc[0] if not df_emp.empty and staff_id else None
+elif is_staff or is_head:
+    staff_id = session["slice"]
+    staff_slice = get_staff_slice(staff_id) if staff_id else None
+    staff_employee = staff_slice["employee"].iloc[0] if staff_slice is not None and not staff_slice["employee"].empty else None
     
     if staff_employee is None:
         st.error("❌ Your employee record not found. Please contact admin.")
         st.stop()
     
+    # DEPARTMENT HEAD DASHBOARD
+    if menu == "Department Dashboard" and is_head:
+        st.markdown(
+            f'<div class="main-header">🏢 {staff_employee["department"]} Department</div>',
+            unsafe_allow_html=True
+        )
+        department_dashboard(str(staff_employee["department"]))
+    
     # STAFF PROFILE
-    if menu == "Staff Profile":
+    elif menu == "Staff Profile":
         st.markdown('<div class="main-header">👤 My Profile</div>', unsafe_allow_html=True)
         
         col1, col2 = st.columns([1, 2])
@@ -1214,16 +1572,12 @@ elif is_staff:
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    submit = st.form_submit_button("💾 Save Changes", use_container_width=True, type="primary")
+                    submit = st.form_submit_button("💾 Save Changes", use_container_width=True, type="primary", disabled=read_only)
                 with col2:
                     cancel = st.form_submit_button("❌ Cancel", use_container_width=True)
                 
                 if submit:
                     try:
-                        # Find the row number for this employee
-                        df_all = load_sheet(employees_ws)
-                        row_number = int(df_all.index[df_all["employee_id"].astype(str) == str(staff_id)][0]) + 2
-                        
                         # Prepare updated row data (all columns)
                         updated_row = [
                             str(staff_id),
@@ -1246,8 +1600,8 @@ elif is_staff:
                             str(staff_employee['status'])
                         ]
                         
-                        # Update the row in Google Sheets
-                        employees_ws.update(f"A{row_number}:R{row_number}", [updated_row])
+                        # Journal the update; it reaches Google Sheets in the background
+                        submit_write(store, "employees", "update", {"row": updated_row}, current_user)
                         
                         st.success("✅ Personal details updated successfully!")
                         st.session_state["edit_personal_mode"] = False
@@ -1282,14 +1636,31 @@ elif is_staff:
     elif menu == "Staff Attendance":
         st.markdown('<div class="main-header">📅 My Attendance</div>', unsafe_allow_html=True)
         
-        staff_attendance = df_att[df_att["employee_id"].astype(str) == str(staff_id)]
+        staff_attendance = staff_slice["attendance"]
         
-        if staff_attendance.empty:
+        today = str(date.today())
+        recorded_today = "date" in staff_attendance.columns and (staff_attendance["date"].astype(str) == today).any()
+        checked_in = recorded_today or is_checked_in(staff_id, today)
+        
+        if st.button(
+            f"✅ Checked in for {today}" if checked_in else f"👆 Check In for {today}",
+            use_container_width=True,
+            type="primary",
+            disabled=checked_in,
+            key="staff_checkin_btn"
+        ):
+            queue_checkin(staff_id, today)
+            st.success("✅ Check-in received. It will appear in your records within a minute.")
+        
+        st.markdown("---")
+        
+        # Get available months for staff, including archived ones
+        live_months = set(staff_attendance["date"].astype(str).str[:7]) if not staff_attendance.empty else set()
+        staff_months = sorted(live_months | set(employee_archived_months(staff_id)), reverse=True)
+        
+        if not staff_months:
             st.info("📭 No attendance records found.")
         else:
-            # Get available months for staff
-            staff_months = sorted(staff_attendance["date"].str[:7].unique(), reverse=True)
-            
             col1, col2 = st.columns([3, 1])
             
             with col1:
@@ -1300,12 +1671,13 @@ elif is_staff:
                 st.write("")
             
             # Filter attendance for selected month
-            monthly_attendance = staff_attendance[staff_attendance["date"].str.startswith(selected_month)]
+            monthly_attendance = attendance_for_months(staff_attendance, [selected_month], employee_id=staff_id)
             
             # Calculate summary for selected month
             total_records = len(monthly_attendance)
             present_count = len(monthly_attendance[monthly_attendance["status"].astype(str).str.lower() == "present"])
-            absent_count = total_records - present_count
+            leave_count = int(monthly_attendance["status"].astype(str).isin(LEAVE_ATTENDANCE_STATUSES).sum())
+            absent_count = total_records - present_count - leave_count
             
             st.markdown(f"""
             <div class="attendance-summary">
@@ -1319,6 +1691,11 @@ elif is_staff:
                     <div style="font-size: 0.9rem; opacity: 0.9;">Absent Days</div>
                     <div style="font-size: 2.5rem; margin-top: 0.5rem;">{absent_count}</div>
                 </div>
+                <div class="attendance-card leave-card">
+                    <div style="font-size: 2rem; margin-bottom: 0.5rem;">🌴</div>
+                    <div style="font-size: 0.9rem; opacity: 0.9;">Leave Days</div>
+                    <div style="font-size: 2.5rem; margin-top: 0.5rem;">{leave_count}</div>
+                </div>
                 <div class="attendance-card total-card">
                     <div style="font-size: 2rem; margin-bottom: 0.5rem;">📊</div>
                     <div style="font-size: 0.9rem; opacity: 0.9;">Total Records</div>
@@ -1330,8 +1707,7 @@ elif is_staff:
             st.markdown("---")
             st.markdown(f'<div class="section-header">📋 Attendance Records for {selected_month}</div>', unsafe_allow_html=True)
             
-            display_df = monthly_attendance[['date', 'status']].copy()
-            display_df = display_df.sort_values('date', ascending=False).reset_index(drop=True)
+            display_df = monthly_attendance[['date', 'status']].sort_values('date', ascending=False).reset_index(drop=True)
             display_df.insert(0, 'No.', range(1, len(display_df) + 1))
             
             st.dataframe(display_df, use_container_width=True, hide_index=True)
@@ -1340,12 +1716,11 @@ elif is_staff:
     elif menu == "Staff Payroll":
         st.markdown('<div class="main-header">💰 My Payroll</div>', unsafe_allow_html=True)
         
-        if df_att.empty:
-            st.warning("⚠️ No attendance data available.")
-            st.stop()
+        staff_attendance = staff_slice["attendance"]
         
-        # Get available months for staff
-        staff_months = sorted(df_att[df_att["employee_id"].astype(str) == str(staff_id)]["date"].str[:7].unique(), reverse=True)
+        # Get available months for staff, including archived ones
+        live_months = set(staff_attendance["date"].astype(str).str[:7]) if not staff_attendance.empty else set()
+        staff_months = sorted(live_months | set(employee_archived_months(staff_id)), reverse=True)
         
         if len(staff_months) == 0:
             st.warning("⚠️ No payroll data available for you.")
@@ -1360,38 +1735,35 @@ elif is_staff:
         with col2:
             st.write("")
         
-        df_month = df_att[df_att["date"].str.startswith(selected_month)]
-        
-        present_days = len(
-            df_month[
-                (df_month["employee_id"].astype(str) == str(staff_id)) &
-                (df_month["status"].astype(str).str.lower() == "present")
-            ]
+        # Kept with the session, so revisiting a month doesn't recompute it
+        staff_payroll = session_result(
+            session,
+            ("staff_payroll", selected_month, staff_slice["built"]),
+            lambda: compute_payroll(
+                staff_slice["employee"],
+                attendance_for_months(staff_attendance, [selected_month], employee_id=staff_id),
+                [selected_month],
+                staff_slice["rate_history"]
+            ).iloc[0]
         )
-        
-        daily_basic = float(staff_employee.get("daily_rate_basic", 0))
-        daily_transport = float(staff_employee.get("daily_rate_transport", 0))
-        daily_meal = float(staff_employee.get("daily_rate_meal", 0))
-        allowance_monthly = float(staff_employee.get("allowance_monthly", 0))
-        
-        salary_from_attendance = (daily_basic + daily_transport + daily_meal) * present_days
-        total_salary = salary_from_attendance + allowance_monthly
+        total_salary = staff_payroll["Total Salary"]
         
         st.markdown('<div class="section-header">📊 Payroll Summary</div>', unsafe_allow_html=True)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            st.metric("Present Days", present_days)
-            st.metric("Daily Basic Rate", f"{daily_basic:,.2f}")
-            st.metric("Daily Transport Rate", f"{daily_transport:,.2f}")
-            st.metric("Daily Meal Allowance", f"{daily_meal:,.2f}")
+            st.metric("Present Days", int(staff_payroll["Present Days"]))
+            st.metric("Paid Leave Days", int(staff_payroll["Paid Leave Days"]))
+            st.metric("Overtime Hours", f"{staff_payroll['Overtime Hours']:,.2f}")
+            st.metric("Daily Basic Rate", f"{staff_payroll['Daily Basic']:,.2f}")
+            st.metric("Daily Transport Rate", f"{staff_payroll['Daily Transport']:,.2f}")
+            st.metric("Daily Meal Allowance", f"{staff_payroll['Daily Meal']:,.2f}")
         
         with col2:
-            st.metric("Salary from Attendance", f"{salary_from_attendance:,.2f}")
-            st.metric("Monthly Allowance", f"{allowance_monthly:,.2f}")
-            st.metric("Overtime", "0.00")
-            st.metric("Bonus", "0.00")
+            for rule in PAY_RULES:
+                amount = staff_payroll[rule["component"]]
+                st.metric(rule["component"], f"{-amount if rule['kind'] == 'deduction' and amount else amount:,.2f}")
         
         st.markdown("---")
         st.markdown('<div class="section-header">💰 Total Salary</div>', unsafe_allow_html=True)
@@ -1403,3 +1775,101 @@ elif is_staff:
             <div style="font-size: 48px; font-weight: bold;">{total_salary:,.2f}</div>
         </div>
         """, unsafe_allow_html=True)
+        
+        st.write("")
+        st.download_button(
+            "🧾 Download Payslip",
+            data=payslip_html(staff_payroll, selected_month),
+            file_name=f"Payslip_{selected_month}_{staff_id}.html",
+            mime="text/html",
+            use_container_width=True,
+            key="my_payslip_download"
+        )
+    
+    # STAFF LEAVE
+    elif menu == "Staff Leave":
+        st.markdown('<div class="main-header">🌴 My Leave</div>', unsafe_allow_html=True)
+        
+        my_requests = leave_requests_frame(staff_slice["leave_requests"])
+        # Built from the employee's own slice and kept with the session, like the staff payroll
+        ledger_month = date.today().strftime("%Y-%m")
+        ledger = session_result(
+            session,
+            ("leave_ledger", ledger_month, staff_slice["built"]),
+            build_leave_ledger, staff_slice["employee"], staff_slice["leave_requests"], ledger_month
+        )
+        my_ledger = ledger.droplevel("employee_id")
+        
+        st.markdown('<div class="section-header">📒 Leave Balance</div>', unsafe_allow_html=True)
+        
+        balance_cols = st.columns(max(len(my_ledger), 1))
+        for col, (leave_type, balance) in zip(balance_cols, my_ledger.iterrows()):
+            with col:
+                st.metric(
+                    f"{leave_type} Leave",
+                    f"{balance['Balance']:g} days",
+                    help=f"Accrued {balance['Accrued']:g}, taken {balance['Taken']:g}, pending {balance['Pending']:g}"
+                )
+        
+        st.markdown("---")
+        st.markdown('<div class="section-header">📝 Request Leave</div>', unsafe_allow_html=True)
+        
+        with st.form("leave_request_form"):
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                leave_type = st.selectbox("Leave Type", list(LEAVE_TYPES), key="leave_type")
+            
+            with col2:
+                start_date = st.date_input("From", value=date.today(), key="leave_start")
+            
+            with col3:
+                end_date = st.date_input("To", value=date.today(), key="leave_end")
+            
+            reason = st.text_input("Reason", key="leave_reason")
+            submit = st.form_submit_button("📨 Submit Request", use_container_width=True, type="primary", disabled=read_only)
+            
+            if submit:
+                problem = validate_leave_request(staff_id, leave_type, start_date, end_date, my_requests, ledger)
+                
+                if problem:
+                    st.error(f"❌ {problem}")
+                else:
+                    try:
+                        row = leave_request_row(staff_id, leave_type, start_date, end_date, reason.strip())
+                        submit_write(store, "leave_requests", "insert", {"row": row}, current_user)
+                        st.success(f"✅ Requested {row[5]} day(s) of {leave_type} leave. It is now waiting for approval.")
+                        time.sleep(1)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ Error submitting request: {str(e)}")
+        
+        st.markdown("---")
+        st.markdown('<div class="section-header">📋 My Requests</div>', unsafe_allow_html=True)
+        
+        if my_requests.empty:
+            st.info("📭 You have not requested any leave yet.")
+        else:
+            st.dataframe(
+                my_requests[["request_id", "leave_type", "start_date", "end_date", "days", "reason", "status", "decided_at"]].iloc[::-1],
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            pending_ids = my_requests.loc[my_requests["status"].astype(str) == "Pending", "request_id"].astype(str).tolist()
+            
+            if pending_ids:
+                col1, col2 = st.columns([3, 1])
+                
+                with col1:
+                    cancel_id = st.selectbox("Pending request", pending_ids, key="leave_cancel_id")
+                
+                with col2:
+                    st.write("")
+                    if st.button("🚫 Cancel Request", use_container_width=True, key="leave_cancel_btn", disabled=read_only):
+                        request = my_requests[my_requests["request_id"].astype(str) == cancel_id].iloc[0]
+                        if decide_leave_request(store, request, "Cancelled", current_user):
+                            st.success("✅ Leave request cancelled.")
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ This request has already been decided.")
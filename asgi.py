@@ -0,0 +1,52 @@
+"""ASGI entry point that serves the app with an HttpOnly session cookie
+
+A Streamlit script can't set response headers, so under `streamlit run` the session cookie
+is written by page JavaScript, where any script on the page can read it (app.py then keeps
+it only briefly). Served from this module instead, the page trades a single-use ticket for
+the cookie at /session-cookie and the server sets it HttpOnly, SameSite=Strict and, over
+HTTPS, Secure:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8501
+
+Behind a reverse proxy that terminates TLS, run uvicorn with --proxy-headers and
+--forwarded-allow-ips so the cookie is marked Secure. Data service workers are started
+the same way, with the environment described in data_service.py.
+"""
+import os
+
+# Tells app.py to get the cookie from the endpoint below instead of writing it itself
+os.environ["HR_HTTPONLY_COOKIE"] = "1"
+
+import streamlit as st
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+import hr_data
+
+def cookie_options(request):
+    return {"path": "/", "httponly": True, "secure": request.url.scheme == "https", "samesite": "strict"}
+
+async def set_session_cookie(request):
+    """Trade a ticket from hr_data.issue_cookie_ticket for the session cookie"""
+    ticket = (await request.body()).decode("utf-8", "replace").strip()
+    token = await run_in_threadpool(hr_data.redeem_cookie_ticket, ticket)
+    if token is None:
+        return Response(status_code=403)
+
+    response = Response(status_code=204)
+    response.set_cookie(hr_data.SESSION_COOKIE, token, **cookie_options(request))
+    return response
+
+async def clear_session_cookie(request):
+    """Remove the session cookie, e.g. after sign-out"""
+    response = Response(status_code=204)
+    response.delete_cookie(hr_data.SESSION_COOKIE, **cookie_options(request))
+    return response
+
+routes = [
+    Route(hr_data.SESSION_COOKIE_ENDPOINT, set_session_cookie, methods=["POST"]),
+    Route(hr_data.SESSION_COOKIE_ENDPOINT, clear_session_cookie, methods=["DELETE"])
+]
+
+app = st.App(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"), routes=routes)
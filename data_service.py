@@ -0,0 +1,93 @@
+"""Shared data service for multi-process deployments
+
+Runs the data layer (store, Google Sheets sync, write journal, payroll cache) in a
+process of its own and serves it to any number of Streamlit workers over a local
+socket, so the workers can run on separate cores behind a load balancer without each
+one keeping its own Sheets sync, journal and payroll cache. Workers poll for changes and
+receive only the rows that changed since their last poll:
+
+    HR_DATA_SERVICE_KEY=<secret> HR_DATA_SERVICE=127.0.0.1:8765 python data_service.py
+    HR_DATA_SERVICE_KEY=<secret> HR_DATA_SERVICE=127.0.0.1:8765 streamlit run app.py --server.port 8501
+    HR_DATA_SERVICE_KEY=<secret> HR_DATA_SERVICE=127.0.0.1:8765 streamlit run app.py --server.port 8502
+
+Workers and the service must share HR_LOCAL_DATA_DIR (the attendance archive and the
+persisted sign-in sessions live there). HR_DATA_SERVICE_KEY is required and must be the same secret everywhere: the
+connection carries pickled data, so anyone holding the key can run code in the service.
+For the same reason the service only binds to a loopback address unless
+HR_DATA_SERVICE_ALLOW_REMOTE is set. Set HR_SHEETS_STANDIN to a directory of CSV files
+to run without Google Sheets (see local_sheets.py).
+"""
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import hr_data
+
+def changes(store, known_versions):
+    """How to catch up on each of the caller's datasets whose version differs, with the store's sync status
+    
+    Datasets the change feed fully covers since the caller's version are sent as the rows
+    of the changed keys, so a check-in doesn't resend the whole attendance history to
+    every worker.
+    """
+    with store["lock"]:
+        return {
+            "datasets": {
+                name: hr_data.dataset_delta(store, name, version)
+                for name, version in known_versions.items()
+                if name in store["frames"] and store["versions"][name] != version
+            },
+            "synced_at": store["synced_at"],
+            "offline": store["offline"],
+            "error": str(store["error"]) if store["error"] else None
+        }
+
+HANDLERS = {
+    "changes": changes,
+    "payroll": lambda store, months: hr_data.get_store_payroll(months),
+    "department_cube": lambda store, months: hr_data.get_store_department_cube(months),
+    "submit_write": hr_data.submit_write,
+    "refresh": lambda store, datasets: hr_data.refresh_data(*datasets),
+    "journal_status": lambda store: hr_data.journal_status(),
+    "recent_journal_entries": lambda store, limit: hr_data.recent_journal_entries(limit),
+    "recent_audit_entries": lambda store, limit, entity: hr_data.recent_audit_entries(limit, entity),
+    "retry_failed_writes": lambda store: hr_data.retry_failed_writes()
+}
+
+def serve_connection(conn, store):
+    """Answer one worker connection's requests until it closes"""
+    with conn:
+        while True:
+            try:
+                method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                conn.send(("ok", HANDLERS[method](store, *args)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+def main():
+    # Refuse to start without a secret or on a non-loopback address (unless explicitly allowed)
+    address = hr_data.data_service_address()
+    authkey = hr_data.data_service_key()
+    
+    # This process is the service, so the data layer works on Sheets directly
+    hr_data.USE_DATA_SERVICE = False
+    hr_data.import_data_stack()
+
+    store = hr_data.get_data_store()
+    hr_data.start_journal_flusher()
+
+    with Listener(address, authkey=authkey) as listener:
+        print(f"HR data service listening on {address[0]}:{address[1]}", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError):
+                continue
+            threading.Thread(target=serve_connection, args=(conn, store), daemon=True).start()
+
+if __name__ == "__main__":
+    main()
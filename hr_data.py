@@ -0,0 +1,2740 @@
+"""Data layer of the HR system: Google Sheets access, the shared data store, payroll,
+attendance archive and the write journal
+
+Imported by app.py and by data_service.py, which runs it in a process of its own so
+several Streamlit workers can share one store (see DATA SERVICE CLIENT below).
+"""
+import streamlit as st
+from datetime import date, datetime
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import closing
+from pathlib import Path
+import csv
+import hashlib
+import hmac
+import html
+import io
+import json
+import os
+import secrets
+import sqlite3
+import string
+import sys
+import threading
+import time
+import zipfile
+
+# pandas, gspread and google-auth are imported on first use (see import_data_stack
+# and init_gspread_client) so the login page paints without loading them.
+
+def import_data_stack():
+    """Import pandas into the module namespace once it is actually needed"""
+    global pd
+    import pandas as pd
+    
+    # Sessions share the store's frames without copying them; copy-on-write keeps any
+    # change a page makes from leaking into the shared data (always on from pandas 3)
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+# =====================================================
+# GOOGLE SHEETS CONNECTION WITH ERROR HANDLING
+# =====================================================
+
+WORKSHEET_NAMES = ("employees", "attendance", "users", "rate_history", "leave_requests")
+
+# A directory of <worksheet>.csv files used instead of Google Sheets (see local_sheets.py)
+SHEETS_STANDIN_DIR = os.environ.get("HR_SHEETS_STANDIN")
+
+# Worksheets the app maintains itself, created with these headers when missing
+MANAGED_WORKSHEETS = {
+    "rate_history": [
+        "employee_id", "effective_date", "daily_rate_basic", "daily_rate_transport",
+        "daily_rate_meal", "allowance_monthly"
+    ],
+    "leave_requests": [
+        "request_id", "employee_id", "leave_type", "start_date", "end_date", "days", "reason",
+        "status", "requested_at", "decided_by", "decided_at"
+    ]
+}
+
+@st.cache_resource
+def init_gspread_client():
+    """Initialize Google Sheets client (raises on missing secrets or bad credentials)"""
+    import gspread
+    from google.oauth2.service_account import Credentials
+    
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"
+    ]
+    
+    credentials_dict = st.secrets["gcp_service_account"]
+    
+    credentials = Credentials.from_service_account_info(
+        credentials_dict,
+        scopes=scopes
+    )
+    
+    return gspread.authorize(credentials)
+
+def connect_worksheets():
+    """Open the spreadsheet and return its worksheets by name (raises on failure)"""
+    import gspread
+    
+    if SHEETS_STANDIN_DIR:
+        from local_sheets import LocalSpreadsheet
+        spreadsheet = LocalSpreadsheet(SHEETS_STANDIN_DIR)
+    else:
+        client = init_gspread_client()
+        sheet_id = st.secrets["google_sheet"]["sheet_id"]
+        spreadsheet = client.open_by_key(sheet_id)
+    
+    # One metadata call for every worksheet instead of one call per worksheet
+    worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+    
+    for name in WORKSHEET_NAMES:
+        if name in MANAGED_WORKSHEETS and name not in worksheets:
+            worksheets[name] = spreadsheet.add_worksheet(title=name, rows=1000, cols=len(MANAGED_WORKSHEETS[name]))
+            worksheets[name].append_row(MANAGED_WORKSHEETS[name])
+        elif name not in worksheets:
+            raise gspread.exceptions.WorksheetNotFound(name)
+    
+    return {name: worksheets[name] for name in WORKSHEET_NAMES}
+
+def fetch_sheet_records(worksheets):
+    """Fetch several worksheets concurrently so the fetch costs roughly one round-trip"""
+    with ThreadPoolExecutor(max_workers=len(worksheets)) as executor:
+        futures = [executor.submit(ws.get_all_records) for ws in worksheets]
+    return [future.result() for future in futures]
+
+# =====================================================
+# DATA STORE & LOCAL SNAPSHOT
+# =====================================================
+
+LOCAL_DATA_DIR = Path(os.environ.get("HR_LOCAL_DATA_DIR", Path(__file__).resolve().parent / "local_data"))
+SNAPSHOT_PATH = LOCAL_DATA_DIR / "snapshot.sqlite"
+SYNC_INTERVAL_SECONDS = 60
+
+def records_checksum(payload):
+    """SHA-256 of a serialized records payload"""
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def hash_password(password, salt=None):
+    """Salted scrypt hash of a password, as scrypt$<salt>$<hash>"""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.scrypt(str(password).encode("utf-8"), salt=bytes.fromhex(salt), n=2 ** 14, r=8, p=1)
+    return f"scrypt${salt}${digest.hex()}"
+
+def password_matches(stored, password):
+    """True if a password matches the stored one, which is a hash when the users came from the snapshot"""
+    stored = str(stored).strip()
+    if stored.startswith("scrypt$"):
+        return hmac.compare_digest(hash_password(password, stored.split("$")[1]), stored)
+    return hmac.compare_digest(stored, str(password))
+
+@st.cache_resource
+def get_password_hashes():
+    """Hashes already computed for the snapshot, by digest of (username, password), so unchanged users aren't rehashed"""
+    return {}
+
+def snapshot_users(records):
+    """The users records as written to disk: passwords replaced by salted hashes"""
+    hashes = get_password_hashes()
+    snapshot = []
+    for record in records:
+        password = str(record.get("password", "")).strip()
+        if not password.startswith("scrypt$"):
+            key = hashlib.sha256(f"{record.get('username')}\0{password}".encode("utf-8")).hexdigest()
+            if key not in hashes:
+                hashes[key] = hash_password(password)
+            password = hashes[key]
+        snapshot.append({**record, "password": password})
+    return snapshot
+
+def read_snapshot():
+    """Read the last good snapshot as {dataset: (records, checksum, synced_at)}, skipping corrupt entries"""
+    if not SNAPSHOT_PATH.exists():
+        return {}
+    
+    snapshot = {}
+    try:
+        with closing(sqlite3.connect(SNAPSHOT_PATH, timeout=30)) as conn:
+            rows = conn.execute("SELECT dataset, records, checksum, synced_at FROM snapshots").fetchall()
+    except sqlite3.Error:
+        return {}
+    
+    for dataset, payload, checksum, synced_at in rows:
+        if records_checksum(payload) == checksum:
+            snapshot[dataset] = (json.loads(payload), checksum, synced_at)
+    
+    # Snapshots written before passwords were hashed are rewritten right away
+    if "users" in snapshot and any(not str(record.get("password", "")).startswith("scrypt$") for record in snapshot["users"][0]):
+        records, _, synced_at = snapshot["users"]
+        write_snapshot({"users": (json.dumps(records, default=str), None)}, synced_at)
+        return read_snapshot()
+    return snapshot
+
+def write_snapshot(payloads, synced_at):
+    """Persist {dataset: (payload, checksum)} to the local snapshot in one transaction
+    
+    Passwords never reach the disk: users are written with hashed passwords (and the
+    checksum of that payload, so the next sync rewrites them with fresh data).
+    """
+    if "users" in payloads:
+        users_payload = json.dumps(snapshot_users(json.loads(payloads["users"][0])), default=str)
+        payloads = {**payloads, "users": (users_payload, records_checksum(users_payload))}
+    
+    LOCAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(SNAPSHOT_PATH, timeout=30)) as conn:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots "
+                "(dataset TEXT PRIMARY KEY, records TEXT, checksum TEXT, synced_at TEXT)"
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                [(dataset, payload, checksum, synced_at) for dataset, (payload, checksum) in payloads.items()]
+            )
+
+def sync_data_store(store, datasets=WORKSHEET_NAMES):
+    """Reconcile the store with Google Sheets; on failure keep serving the current data read-only"""
+    fetch_started = time.time()
+    
+    try:
+        if store["worksheets"] is None:
+            store["worksheets"] = connect_worksheets()
+        all_records = fetch_sheet_records([store["worksheets"][name] for name in datasets])
+    except Exception as e:
+        with store["lock"]:
+            store["offline"] = True
+            store["error"] = e
+        return False
+    
+    synced_at = datetime.now().isoformat(timespec="seconds")
+    changed = {}
+    # Journaled writes that the fetched data may not contain yet stay applied on top of it
+    unsynced_writes = read_unsynced_writes(since=fetch_started)
+    
+    with store["lock"]:
+        for name, records in zip(datasets, all_records):
+            payload = json.dumps(records, default=str)
+            checksum = records_checksum(payload)
+            writes = unsynced_writes.get(name, [])
+            fetched_changed = checksum != store["checksums"].get(name)
+            if fetched_changed or writes or name in store["local_writes"]:
+                frame = pd.DataFrame(records)
+                for op, write_payload in writes:
+                    frame = apply_write(frame, name, op, write_payload)
+                keys = changed_keys(name, store["frames"].get(name), frame)
+                store["frames"][name] = frame
+                record_change(store, name, keys)
+            if writes:
+                store["local_writes"].add(name)
+            else:
+                store["local_writes"].discard(name)
+            if fetched_changed:
+                store["checksums"][name] = checksum
+                changed[name] = (payload, checksum)
+        store["offline"] = False
+        store["error"] = None
+        store["synced_at"] = synced_at
+    
+    try:
+        write_snapshot(changed, synced_at)
+    except sqlite3.Error:
+        pass
+    return True
+
+def run_sync_loop(store):
+    """Background reconcile with Google Sheets for the lifetime of the process"""
+    while True:
+        time.sleep(SYNC_INTERVAL_SECONDS)
+        sync_data_store(store)
+
+@st.cache_resource
+def get_data_store():
+    """Process-wide data shared by all sessions, served from the local snapshot until Sheets answers"""
+    store = {
+        "frames": {},
+        "checksums": {},
+        "versions": {name: 0 for name in WORKSHEET_NAMES},
+        "worksheets": None,
+        "synced_at": None,
+        "offline": False,
+        "error": None,
+        "derived": {},
+        "changes": {name: deque(maxlen=CHANGE_FEED_LENGTH) for name in WORKSHEET_NAMES},
+        "local_writes": set(),
+        "service": None,
+        "lock": threading.Lock()
+    }
+    
+    if USE_DATA_SERVICE:
+        store["service"] = DataServiceClient()
+        pull_from_service(store)
+        threading.Thread(target=run_service_poll, args=(store,), daemon=True).start()
+        return store
+    
+    snapshot = read_snapshot()
+    
+    if all(name in snapshot for name in WORKSHEET_NAMES):
+        unsynced_writes = read_unsynced_writes()
+        for name, (records, checksum, synced_at) in snapshot.items():
+            frame = pd.DataFrame(records)
+            for op, payload in unsynced_writes.get(name, []):
+                frame = apply_write(frame, name, op, payload)
+                store["local_writes"].add(name)
+            store["frames"][name] = frame
+            store["checksums"][name] = checksum
+            store["versions"][name] = 1
+        store["synced_at"] = min(synced_at for _, _, synced_at in snapshot.values())
+        threading.Thread(target=sync_data_store, args=(store,), daemon=True).start()
+    else:
+        sync_data_store(store)
+    
+    threading.Thread(target=run_sync_loop, args=(store,), daemon=True).start()
+    return store
+
+def refresh_data(*datasets):
+    """Re-read the given datasets from Google Sheets now instead of waiting for the background sync"""
+    store = get_data_store()
+    
+    if store["service"]:
+        store["service"].call("refresh", list(datasets or WORKSHEET_NAMES))
+        pull_from_service(store)
+    else:
+        sync_data_store(store, datasets or WORKSHEET_NAMES)
+
+def get_derived(key, datasets, build):
+    """Return build(*frames) for the given datasets, rebuilt only when one of them changes version"""
+    store = get_data_store()
+    
+    with store["lock"]:
+        frames = [store["frames"][name] for name in datasets]
+        versions = tuple(store["versions"][name] for name in datasets)
+        cached = store["derived"].get(key)
+    
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    
+    value = build(*frames)
+    with store["lock"]:
+        store["derived"][key] = (versions, value)
+    return value
+
+def build_attendance_partitions(df_att):
+    """Index the attendance frame by employee: (frame, {employee_id: row positions})"""
+    if df_att.empty:
+        return df_att, {}
+    return df_att, df_att.groupby(df_att["employee_id"].astype(str), sort=False).indices
+
+def get_employee_attendance(employee_id):
+    """Attendance rows of a single employee, without scanning the company-wide frame"""
+    df_att, partitions = get_derived("attendance_partitions", ("attendance",), build_attendance_partitions)
+    positions = partitions.get(str(employee_id))
+    
+    if positions is None:
+        return df_att.iloc[0:0]
+    return df_att.take(positions)
+
+STAFF_SLICE_DATASETS = ("employees", "attendance", "rate_history", "leave_requests")
+
+def build_staff_slice(employee_id, df_emp, history, requests, versions):
+    """The rows one employee may see: their employee record, attendance, rate history and leave requests"""
+    return {
+        "employee": df_emp[df_emp["employee_id"].astype(str) == employee_id],
+        "attendance": get_employee_attendance(employee_id),
+        "rate_history": history[history["employee_id"].astype(str) == employee_id] if not history.empty else history,
+        "leave_requests": requests[requests["employee_id"].astype(str) == employee_id] if not requests.empty else requests,
+        # Dataset versions the slice was built from, for keying results computed from it
+        "built": versions
+    }
+
+def get_staff_slice(employee_id):
+    """Pre-sliced view of a single employee's data, shared by all of their sessions
+    
+    Staff pages work from this instead of the company-wide frames, so a staff session never
+    holds anyone else's records. Writes that only touch other employees (per the change
+    feed) leave the slice as it is.
+    """
+    employee_id = str(employee_id)
+    key = ("staff_slice", employee_id)
+    store = get_data_store()
+    
+    with store["lock"]:
+        df_emp, _, history, requests = (store["frames"][name] for name in STAFF_SLICE_DATASETS)
+        versions = tuple(store["versions"][name] for name in STAFF_SLICE_DATASETS)
+        cached = store["derived"].get(key)
+    
+    if cached is not None and cached[0] != versions:
+        changed = [changes_since(name, version) for name, version in zip(STAFF_SLICE_DATASETS, cached[0])]
+        if all(keys is not None and not touches_employee(keys, employee_id) for keys in changed):
+            cached = (versions, cached[1])
+        else:
+            cached = None
+    
+    if cached is None:
+        cached = (versions, build_staff_slice(employee_id, df_emp, history, requests, versions))
+    
+    with store["lock"]:
+        store["derived"][key] = cached
+    return cached[1]
+
+# =====================================================
+# CHANGE FEED
+# =====================================================
+
+# Every version bump of a dataset is recorded with the entity keys it changed, so cached
+# views can refresh just the affected rows instead of rebuilding on any new version
+CHANGE_FEED_LENGTH = 256
+# Columns identifying one entity (row) of each dataset
+ENTITY_KEYS = {
+    "employees": ["employee_id"],
+    "attendance": ["employee_id", "date"],
+    "rate_history": ["employee_id", "effective_date"],
+    "leave_requests": ["employee_id", "request_id"]
+}
+
+def write_keys(dataset, op, payload):
+    """Entity keys ("id", "id|date" or "id|request") a journaled write touches"""
+    if dataset == "attendance":
+        return {f"{emp_id}|{day}" for emp_id, day, _ in payload["changes"]}
+    if dataset == "rate_history":
+        return {f"{row[0]}|{row[1]}" for row in payload["rows"]}
+    if dataset == "leave_requests":
+        if op == "decide":
+            return {f"{payload['employee_id']}|{payload['request_id']}"}
+        return {f"{payload['row'][1]}|{payload['row'][0]}"}
+    if op == "delete":
+        return {str(payload["employee_id"])}
+    if op == "upsert":
+        return {str(row[0]) for row in payload["rows"]}
+    return {str(payload["row"][0])}
+
+def entity_keys(frame, dataset):
+    """Entity key of every row of a frame"""
+    columns = ENTITY_KEYS[dataset]
+    keys = frame[columns[0]].astype(str)
+    for column in columns[1:]:
+        keys = keys + "|" + frame[column].astype(str)
+    return keys
+
+def changed_keys(dataset, old, new):
+    """Entity keys whose rows differ between two versions of a dataset, or None if that can't be told"""
+    if dataset not in ENTITY_KEYS or old is None or old.empty or new.empty or list(old.columns) != list(new.columns):
+        return None
+    
+    old_rows = entity_keys(old, dataset) + "#" + pd.Series(pd.util.hash_pandas_object(old, index=False).to_numpy(), index=old.index).astype(str)
+    new_rows = entity_keys(new, dataset) + "#" + pd.Series(pd.util.hash_pandas_object(new, index=False).to_numpy(), index=new.index).astype(str)
+    differing = pd.concat([old_rows[~old_rows.isin(new_rows)], new_rows[~new_rows.isin(old_rows)]])
+    return set(differing.str.rsplit("#", n=1).str[0])
+
+def record_change(store, dataset, keys):
+    """Bump a dataset's version and feed the keys that changed (None: possibly all); caller holds the lock"""
+    store["versions"][dataset] += 1
+    store["changes"][dataset].append((store["versions"][dataset], None if keys is None else frozenset(keys)))
+
+def changes_since(dataset, version):
+    """Entity keys changed in a dataset after a version, or None when the feed can't tell"""
+    store = get_data_store()
+    with store["lock"]:
+        current = store["versions"][dataset]
+        feed = [entry for entry in store["changes"][dataset] if entry[0] > version]
+    
+    if len(feed) != current - version or any(keys is None for _, keys in feed):
+        return None
+    return set().union(*(keys for _, keys in feed))
+
+def touches_employee(keys, employee_id):
+    """True if any of the changed entity keys belongs to the employee"""
+    return any(key == employee_id or key.startswith(f"{employee_id}|") for key in keys)
+
+# =====================================================
+# COMPENSATION HISTORY
+# =====================================================
+
+RATE_COLUMNS = MANAGED_WORKSHEETS["rate_history"][2:]
+
+def rates_as_of(history, keys, fallback):
+    """Rates in force for each (employee_id, date) row of keys, looked up in the rate history
+    
+    fallback (aligned with keys) is used for rows with no history entry on or before their
+    date and for columns the history does not track. The latest entry for a date wins.
+    """
+    rates = fallback.reset_index(drop=True)
+    columns = [column for column in rates.columns if column in RATE_COLUMNS and column in history.columns]
+    if history.empty or not columns:
+        return rates
+    
+    entries = pd.DataFrame({
+        "employee_id": history["employee_id"].astype(str),
+        "effective_date": pd.to_datetime(history["effective_date"].astype(str), errors="coerce"),
+        **{column: numeric_column(history, column) for column in columns}
+    }).dropna(subset=["effective_date"]).sort_values("effective_date", kind="stable")
+    
+    when = pd.to_datetime(keys["date"].reset_index(drop=True), errors="coerce")
+    lookup = pd.DataFrame({
+        "employee_id": keys["employee_id"].astype(str).to_numpy(),
+        "when": when,
+        "row": range(len(keys))
+    })[when.notna()].sort_values("when", kind="stable")
+    
+    joined = pd.merge_asof(lookup, entries, left_on="when", right_on="effective_date", by="employee_id")
+    joined = joined[joined["effective_date"].notna()]
+    rates.loc[joined["row"].to_numpy(), columns] = joined[columns].to_numpy()
+    return rates
+
+def rate_history_rows(history, employee, effective_date, new_rates):
+    """History rows recording a rate change, first seeding the previous rates if the employee has no history yet"""
+    employee_id = str(employee["employee_id"])
+    rows = []
+    
+    if history.empty or not (history["employee_id"].astype(str) == employee_id).any():
+        previous = pd.to_numeric(pd.Series([employee.get(column, 0) for column in RATE_COLUMNS]), errors="coerce")
+        # The old rates applied to everything before the change
+        rows.append([employee_id, "1900-01-01"] + previous.fillna(0.0).tolist())
+    
+    rows.append([employee_id, str(effective_date)] + [float(value) for value in new_rates])
+    return rows
+
+# =====================================================
+# PAYROLL COMPUTATION
+# =====================================================
+
+# Pay components, evaluated in order over the whole employee x month frame at once.
+# Earnings add to Total Salary and deductions subtract from it. Employee and attendance
+# columns a rule names are optional: a missing column counts as 0.
+PAY_RULES = [
+    {"component": "Salary from Attendance", "kind": "earning", "rule": "per_day",
+     "rates": ["daily_rate_basic", "daily_rate_transport", "daily_rate_meal"]},
+    {"component": "Monthly Allowance", "kind": "earning", "rule": "fixed", "amount": "allowance_monthly"},
+    {"component": "Prorated Allowance", "kind": "earning", "rule": "prorated", "amount": "allowance_prorated_monthly"},
+    {"component": "Overtime", "kind": "earning", "rule": "per_hour", "hours": "overtime_hours",
+     "rate": "overtime_rate_hourly"},
+    {"component": "Bonus", "kind": "earning", "rule": "fixed", "amount": "bonus_monthly"},
+    {"component": "Deductions", "kind": "deduction", "rule": "fixed", "amount": "deduction_monthly"},
+    {"component": "Tax", "kind": "deduction", "rule": "percent_of_gross", "rate": "tax_rate_percent"}
+]
+
+PAY_COMPONENTS = [rule["component"] for rule in PAY_RULES]
+
+PAYROLL_COLUMNS = [
+    "Employee ID", "Name", "Bank Account", "Present Days", "Paid Leave Days", "Overtime Hours",
+    "Daily Basic", "Daily Transport", "Daily Meal"
+] + PAY_COMPONENTS
+
+def month_range(start_month, end_month):
+    """List every YYYY-MM month from start_month to end_month inclusive"""
+    return pd.period_range(start_month, end_month, freq="M").strftime("%Y-%m").tolist()
+
+def numeric_column(df, column):
+    """Return a float column, treating missing columns and blank cells as 0"""
+    if column not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0.0).astype(float)
+
+def working_days(months):
+    """Number of weekdays in each YYYY-MM month"""
+    import numpy as np
+    
+    starts = pd.PeriodIndex(months, freq="M").to_timestamp()
+    ends = starts + pd.offsets.MonthBegin(1)
+    return np.busday_count(starts.values.astype("datetime64[D]"), ends.values.astype("datetime64[D]"))
+
+def evaluate_pay_rule(rule, inputs, earned):
+    """Amount of one pay component for every employee x month row"""
+    import numpy as np
+    
+    if rule["rule"] == "per_day":
+        # Each present or paid leave day is paid at the rate in force on that day
+        return sum(inputs[("per_day", rate)] for rate in rule["rates"])
+    if rule["rule"] == "per_hour":
+        return inputs[rule["hours"]] * inputs[rule["rate"]] * rule.get("multiplier", 1.0)
+    if rule["rule"] == "fixed":
+        return inputs[rule["amount"]]
+    if rule["rule"] == "prorated":
+        paid_days = inputs["present_days"] + inputs["paid_leave_days"]
+        return inputs[rule["amount"]] * np.minimum(paid_days / inputs["working_days"], 1.0)
+    if rule["rule"] == "percent_of_gross":
+        return earned * inputs[rule["rate"]] / 100
+    raise ValueError(f"Unknown pay rule: {rule['rule']}")
+
+def payroll_total(payroll_df):
+    """Total Salary of each payroll row: its earnings minus its deductions"""
+    earnings = [rule["component"] for rule in PAY_RULES if rule["kind"] == "earning"]
+    deductions = [rule["component"] for rule in PAY_RULES if rule["kind"] == "deduction"]
+    return payroll_df[earnings].sum(axis=1) - payroll_df[deductions].sum(axis=1)
+
+def rule_employee_columns():
+    """Employee columns the pay rules read, plus the daily rates shown on the payslip"""
+    columns = {"daily_rate_basic", "daily_rate_transport", "daily_rate_meal"}
+    for rule in PAY_RULES:
+        columns.update(rule.get("rates", []))
+        columns.update(rule[key] for key in ("amount", "rate") if key in rule)
+    return sorted(columns)
+
+def compute_payroll(df_emp, df_att, months, history=None):
+    """Compute payroll for every employee x month with a single grouped aggregation
+    
+    Daily rates are looked up in the compensation history as of each attendance day and
+    monthly amounts as of month end, so a past month is always paid at that month's rates.
+    """
+    import numpy as np
+    
+    months = list(months)
+    n_months = len(months)
+    history = history if history is not None else pd.DataFrame()
+    employee_ids = df_emp["employee_id"].astype(str)
+
+    grid = pd.MultiIndex.from_product([employee_ids, months], names=["employee_id", "month"])
+    day_rate_columns = sorted({rate for rule in PAY_RULES if rule["rule"] == "per_day" for rate in rule["rates"]})
+    
+    if not df_att.empty:
+        month_att = df_att[df_att["date"].astype(str).str[:7].isin(months)]
+        # A duplicated (employee, day) row is paid once; the last one recorded wins, as on the attendance grid
+        month_att = month_att[~attendance_keys(month_att).duplicated(keep="last")].reset_index(drop=True)
+        att_month = month_att["date"].astype(str).str[:7]
+        att_ids = month_att["employee_id"].astype(str)
+        statuses = month_att["status"].astype(str).str.lower()
+        present = (statuses == "present").to_numpy()
+        paid = statuses.isin([status.lower() for status in PAID_ATTENDANCE_STATUSES]).to_numpy()
+        
+        current = df_emp.assign(employee_id=employee_ids).drop_duplicates("employee_id").set_index("employee_id")
+        day_rates = rates_as_of(
+            history,
+            pd.DataFrame({"employee_id": att_ids, "date": month_att["date"]}),
+            pd.DataFrame({column: att_ids.map(numeric_column(current, column)).fillna(0.0) for column in day_rate_columns})
+        )
+        per_employee_month = pd.concat([
+            pd.DataFrame({
+                "employee_id": att_ids,
+                "month": att_month.to_numpy(),
+                "present_days": present,
+                "paid_leave_days": paid & ~present,
+                "overtime_hours": numeric_column(month_att, "overtime_hours")
+            }),
+            day_rates.mul(paid, axis=0).add_prefix("per_day:")
+        ], axis=1).groupby(["employee_id", "month"]).sum().reindex(grid, fill_value=0)
+    else:
+        per_employee_month = pd.DataFrame(
+            0.0, index=grid,
+            columns=["present_days", "paid_leave_days", "overtime_hours"] + [f"per_day:{rate}" for rate in day_rate_columns]
+        )
+
+    def per_month(series):
+        return series.repeat(n_months).to_numpy()
+
+    # Monthly amounts (and the daily rates shown on the payslip) as of each month's last day
+    employee_columns = rule_employee_columns()
+    month_ends = pd.PeriodIndex(months, freq="M").to_timestamp(how="end").normalize()
+    month_rates = rates_as_of(
+        history,
+        pd.DataFrame({"employee_id": per_month(employee_ids), "date": np.tile(month_ends, len(df_emp))}),
+        pd.DataFrame({column: per_month(numeric_column(df_emp, column)) for column in employee_columns})
+    )
+    
+    inputs = {column: month_rates[column].to_numpy() for column in employee_columns}
+    inputs.update({("per_day", rate): per_employee_month[f"per_day:{rate}"].to_numpy() for rate in day_rate_columns})
+    inputs["present_days"] = per_employee_month["present_days"].astype(int).to_numpy()
+    inputs["paid_leave_days"] = per_employee_month["paid_leave_days"].astype(int).to_numpy()
+    inputs["overtime_hours"] = per_employee_month["overtime_hours"].astype(float).to_numpy()
+    inputs["working_days"] = np.tile(working_days(months), len(df_emp))
+
+    payroll_df = pd.DataFrame({
+        "Month": months * len(df_emp),
+        "Employee ID": per_month(df_emp["employee_id"]),
+        "Name": per_month(df_emp["full_name"]),
+        "Department": per_month(df_emp["department"].astype(str)),
+        "Bank Account": per_month(df_emp.get("bank_account_number", pd.Series("", index=df_emp.index)).astype(str)),
+        "Present Days": inputs["present_days"],
+        "Paid Leave Days": inputs["paid_leave_days"],
+        "Overtime Hours": inputs["overtime_hours"],
+        "Daily Basic": inputs["daily_rate_basic"],
+        "Daily Transport": inputs["daily_rate_transport"],
+        "Daily Meal": inputs["daily_rate_meal"]
+    })
+    
+    earned = 0.0
+    for rule in PAY_RULES:
+        amount = evaluate_pay_rule(rule, inputs, earned)
+        payroll_df[rule["component"]] = amount
+        if rule["kind"] == "earning":
+            earned = earned + amount
+    
+    payroll_df["Total Salary"] = payroll_total(payroll_df)
+    return payroll_df
+
+def payroll_fingerprint(*frames):
+    """Content hash of the frames a payroll result was computed from"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(",".join(map(str, frame.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def archive_stamps(months):
+    """Modification time of each archived partition among the months, to tell when the archive changed"""
+    return tuple((month, archive_path(month).stat().st_mtime_ns) for month in months if archive_path(month).exists())
+
+def split_attendance_by_month(df_att, months):
+    """{month: attendance rows} for a month range, live and archived, found in one pass over each
+
+    Archived rows for a day the live sheet also has are dropped, as in attendance_for_months.
+    """
+    months = list(months)
+    live_months = df_att["date"].astype(str).str[:7] if not df_att.empty else pd.Series(dtype=str)
+    in_range = live_months.isin(months).to_numpy()
+    live = df_att[in_range] if not df_att.empty else df_att
+    live_groups = live.groupby(live_months[in_range].to_numpy(), sort=False).indices if not live.empty else {}
+
+    archived_in_range = sorted(set(months) & set(archived_months()))
+    archived = read_archived_attendance(archived_in_range) if archived_in_range else pd.DataFrame(columns=ARCHIVE_COLUMNS)
+    if not archived.empty and not live.empty:
+        archived = archived[~attendance_keys(archived).isin(attendance_keys(live))]
+    archived_groups = archived.groupby(archived["date"].astype(str).str[:7].to_numpy(), sort=False).indices if not archived.empty else {}
+
+    by_month = {}
+    for month in months:
+        parts = [frame.take(groups[month]) for frame, groups in ((archived, archived_groups), (live, live_groups)) if month in groups]
+        if not parts:
+            by_month[month] = live.iloc[0:0]
+        elif len(parts) == 1:
+            by_month[month] = parts[0]
+        else:
+            by_month[month] = pd.concat(parts, ignore_index=True)
+    return by_month
+
+def payroll_month_fingerprints(df_emp, df_att, history, months):
+    """({month: fingerprint of the inputs its payroll depends on}, {month: (attendance, rate history)})"""
+    employee_ids = df_emp["employee_id"].astype(str)
+    untracked = [column for column in rule_employee_columns() if column not in RATE_COLUMNS]
+    identity = df_emp.reindex(columns=["employee_id", "full_name", "department", "bank_account_number"] + untracked)
+    has_history = not history.empty and "effective_date" in history.columns
+    if has_history:
+        effective = history["effective_date"].astype(str)
+        history_ids = history["employee_id"].astype(str)
+    
+    attendance_by_month = split_attendance_by_month(df_att, months)
+    fingerprints, inputs = {}, {}
+    for month in months:
+        month_history = history
+        covered = pd.Series(False, index=df_emp.index)
+        if has_history:
+            in_force = (effective <= f"{month}-31").to_numpy()
+            month_history = history[in_force]
+            first_effective = effective[in_force].groupby(history_ids[in_force]).min()
+            covered = employee_ids.map(first_effective).fillna("9999") <= f"{month}-01"
+        uncovered_rates = df_emp.loc[~covered.to_numpy()].reindex(columns=["employee_id"] + RATE_COLUMNS)
+        
+        fingerprints[month] = payroll_fingerprint(identity, attendance_by_month[month], month_history, uncovered_rates)
+        inputs[month] = (attendance_by_month[month], month_history)
+    return fingerprints, inputs
+
+def get_payroll(df_emp, df_att, history, months):
+    """compute_payroll, reusing each month's result until that month's own inputs change
+    
+    A month depends only on its attendance, the rate history up to its end and the rates of
+    employees that history does not cover yet, so closed months stay cached across edits
+    to later months and rate changes effective after them. The range is split by month in
+    one pass, and not at all when called again with the same frames and archive.
+    """
+    import numpy as np
+    
+    store = get_data_store()
+    months = list(months)
+    # Store frames are replaced, never changed in place, so the same objects hold the same data
+    frames, stamps = (df_emp, df_att, history), archive_stamps(months)
+    with store["lock"]:
+        seen = store["derived"].get("payroll_inputs")
+        cached = {month: store["derived"].get(("payroll", month)) for month in months}
+    
+    fingerprints = {}
+    if seen is not None and all(a is b for a, b in zip(seen[0], frames)) and seen[1] == stamps:
+        fingerprints = dict(seen[2])
+    inputs = {}
+    unknown = [month for month in months if month not in fingerprints]
+    if unknown:
+        new_fingerprints, inputs = payroll_month_fingerprints(df_emp, df_att, history, unknown)
+        fingerprints.update(new_fingerprints)
+        with store["lock"]:
+            store["derived"]["payroll_inputs"] = (frames, stamps, fingerprints)
+    
+    stale = [month for month in months if cached[month] is None or cached[month][0] != fingerprints[month]]
+    if any(month not in inputs for month in stale):
+        inputs.update(payroll_month_fingerprints(df_emp, df_att, history, [month for month in stale if month not in inputs])[1])
+    
+    month_frames = []
+    for month in months:
+        if month not in stale:
+            month_frames.append(cached[month][1])
+            continue
+        
+        month_att, month_history = inputs[month]
+        month_payroll = compute_payroll(df_emp, month_att, [month], month_history)
+        with store["lock"]:
+            store["derived"][("payroll", month)] = (fingerprints[month], month_payroll)
+        month_frames.append(month_payroll)
+    
+    # Back to compute_payroll's order: each employee's months next to each other
+    n_emp, n_months = len(df_emp), len(month_frames)
+    order = (np.arange(n_months)[None, :] * n_emp + np.arange(n_emp)[:, None]).ravel()
+    return pd.concat(month_frames, ignore_index=True).take(order).reset_index(drop=True)
+
+PAYROLL_DATASETS = ("employees", "attendance", "rate_history")
+
+def get_store_payroll(months):
+    """get_payroll of the current employees, attendance and rate history
+    
+    With a data service, the service computes it from its own data, so all workers share
+    one payroll cache. Use get_payroll for frames of your own (e.g. filtered or edited).
+    """
+    store = get_data_store()
+    if store["service"]:
+        return store["service"].call("payroll", list(months))
+    
+    with store["lock"]:
+        frames = [store["frames"][name] for name in PAYROLL_DATASETS]
+    return get_payroll(*frames, months)
+
+def summarize_payroll_range(payroll_df, months):
+    """Pivot an employee x month payroll frame into one row per employee with monthly totals"""
+    months = list(months)
+    n_months = len(months)
+
+    summary = payroll_df.iloc[::n_months][["Employee ID", "Name", "Department"]].reset_index(drop=True)
+    monthly_totals = pd.DataFrame(
+        payroll_df["Total Salary"].to_numpy().reshape(-1, n_months),
+        columns=months
+    )
+    summary = pd.concat([summary, monthly_totals], axis=1)
+    summary["Present Days"] = payroll_df["Present Days"].to_numpy().reshape(-1, n_months).sum(axis=1)
+    summary["Total"] = monthly_totals.sum(axis=1)
+    return summary
+
+def build_payroll_workbook(sheets):
+    """Write {sheet name: DataFrame} to an Excel workbook, keeping bank accounts as text"""
+    output = BytesIO()
+
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for sheet_name, sheet_df in sheets.items():
+            sheet_df.to_excel(writer, index=False, sheet_name=sheet_name)
+
+            if "Bank Account" in sheet_df.columns:
+                worksheet = writer.sheets[sheet_name]
+                column_index = sheet_df.columns.get_loc("Bank Account") + 1
+                for (cell,) in worksheet.iter_rows(min_col=column_index, max_col=column_index):
+                    cell.number_format = "@"
+
+    output.seek(0)
+    return output
+
+# =====================================================
+# BANK TRANSFER FILE
+# =====================================================
+
+BANK_FILE_FORMATS = ("CSV", "Fixed Width")
+# Field widths of a fixed-width detail record; longer values are rejected, never cut
+BANK_FIELD_WIDTHS = {"account": 20, "reference": 24, "name": 35}
+BANK_ACCOUNT_PATTERN = r"[0-9A-Za-z]+"
+
+def bank_account_text(value):
+    """Account number as text, or "" when missing (numeric cells may come back as 1234.0)"""
+    text = "" if value is None or value != value else str(value).strip()
+    return text[:-2] if text.endswith(".0") and text[:-2].isdigit() else text
+
+def bank_amount_cents(amount):
+    """A payroll total in whole cents, 0 when missing"""
+    return int(round(float(amount) * 100)) if amount == amount and amount is not None else 0
+
+def bank_transfer_rows(payroll, month):
+    """(employee_id, name, account, cents, reference) of every payroll row that goes into the transfer file"""
+    batch_reference = f"PAYROLL{month.replace('-', '')}"
+    for employee_id, name, account, amount in zip(
+        payroll["Employee ID"], payroll["Name"], payroll["Bank Account"], payroll["Total Salary"]
+    ):
+        account = bank_account_text(account)
+        cents = bank_amount_cents(amount)
+        if account and cents > 0:
+            yield employee_id, str(name), account, cents, f"{batch_reference}-{employee_id}"
+
+def bank_transfer_exclusions(payroll):
+    """(name, reason) of every payroll row bank_transfer_rows leaves out of the transfer file"""
+    excluded = []
+    for name, account, amount in zip(payroll["Name"], payroll["Bank Account"], payroll["Total Salary"]):
+        cents = bank_amount_cents(amount)
+        if not bank_account_text(account):
+            excluded.append((str(name), "no bank account"))
+        elif cents <= 0:
+            excluded.append((str(name), f"net pay is {cents / 100:,.2f}"))
+    return excluded
+
+def bank_transfer_problems(payroll, month):
+    """(name, problem) of every employee whose record can't be written to the transfer file as is"""
+    import re
+    
+    problems = []
+    for employee_id, name, account, cents, reference in bank_transfer_rows(payroll, month):
+        if not re.fullmatch(BANK_ACCOUNT_PATTERN, account):
+            problems.append((name, "bank account has characters other than letters and digits"))
+        elif len(account) > BANK_FIELD_WIDTHS["account"]:
+            problems.append((name, f"bank account is longer than {BANK_FIELD_WIDTHS['account']} characters"))
+        if not name.isprintable():
+            problems.append((name, "name has line breaks or control characters"))
+        elif len(name) > BANK_FIELD_WIDTHS["name"]:
+            problems.append((name, f"name is longer than {BANK_FIELD_WIDTHS['name']} characters"))
+        if len(reference) > BANK_FIELD_WIDTHS["reference"]:
+            problems.append((name, f"employee ID {employee_id} is too long for the payment reference"))
+    return problems
+
+def bank_transfer_lines(payroll, month, payment_date, file_format):
+    """Yield a bank transfer file for a month's payroll, one line at a time in a single pass
+    
+    Rows without a bank account or with nothing to pay are left out (bank_transfer_exclusions
+    lists them). Amounts are summed in cents, and the trailer carries the record count, the
+    batch total, a hash total of the account numbers and a SHA-256 checksum of the detail
+    records. Raises ValueError, before any line is written, if bank_transfer_problems finds
+    a record that doesn't fit.
+    """
+    problems = bank_transfer_problems(payroll, month)
+    if problems:
+        raise ValueError("; ".join(f"{name}: {problem}" for name, problem in problems))
+    
+    batch_reference = f"PAYROLL{month.replace('-', '')}"
+    value_date = str(payment_date).replace("-", "")
+    fixed_width = file_format == "Fixed Width"
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    
+    def csv_line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+    
+    if fixed_width:
+        yield f"H{batch_reference:<20}{value_date}\n"
+    else:
+        yield csv_line(["record_type", "account_number", "amount", "reference", "beneficiary_name"])
+        yield csv_line(["H", batch_reference, value_date, "", ""])
+    
+    digest = hashlib.sha256()
+    count = total_cents = account_hash = 0
+    
+    for employee_id, name, account, cents, reference in bank_transfer_rows(payroll, month):
+        if fixed_width:
+            line = f"D{account:<20}{cents:015d}{reference:<24}{name:<35}\n"
+        else:
+            line = csv_line(["D", account, f"{cents // 100}.{cents % 100:02d}", reference, name])
+        
+        digest.update(line.encode("utf-8"))
+        count += 1
+        total_cents += cents
+        account_hash += int("".join(character for character in account if character.isdigit()) or 0)
+        yield line
+    
+    account_hash %= 10 ** 10
+    if fixed_width:
+        yield f"T{count:08d}{total_cents:018d}{account_hash:010d}{digest.hexdigest()}\n"
+    else:
+        yield csv_line(["T", count, f"{total_cents // 100}.{total_cents % 100:02d}", account_hash, digest.hexdigest()])
+
+def bank_transfer_file(payroll, month, payment_date, file_format):
+    """The whole bank transfer file as bytes, for a download"""
+    return "".join(bank_transfer_lines(payroll, month, payment_date, file_format)).encode("utf-8")
+
+# =====================================================
+# PAYSLIPS
+# =====================================================
+
+# Parsed once at import and shared by every payslip
+PAYSLIP_TEMPLATE = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Payslip $month - $name</title>
+<style>
+body { font-family: Arial, sans-serif; margin: 40px; color: #333; }
+h1 { color: #1f77b4; margin-bottom: 4px; }
+table { border-collapse: collapse; width: 100%; margin-top: 24px; }
+td { padding: 6px 8px; border-bottom: 1px solid #ddd; }
+td.amount { text-align: right; }
+tr.total td { font-weight: bold; font-size: 18px; border-top: 2px solid #28a745; border-bottom: none; }
+@media print { body { margin: 0; } }
+</style>
+</head>
+<body>
+<h1>Payslip</h1>
+<div>Pay period: $month</div>
+<table>
+<tr><td>Employee ID</td><td>$employee_id</td></tr>
+<tr><td>Name</td><td>$name</td></tr>
+<tr><td>Bank Account</td><td>$bank_account</td></tr>
+<tr><td>Present Days</td><td>$present_days</td></tr>
+<tr><td>Paid Leave Days</td><td>$paid_leave_days</td></tr>
+<tr><td>Overtime Hours</td><td>$overtime_hours</td></tr>
+</table>
+<table>
+$component_rows
+<tr class="total"><td>Total Salary</td><td class="amount">$total_salary</td></tr>
+</table>
+</body>
+</html>
+""")
+
+def payslip_html(record, month):
+    """One employee's payslip as an HTML page (print it from the browser for a PDF)"""
+    component_rows = "\n".join(
+        f'<tr><td>{html.escape(rule["component"])}</td><td class="amount">'
+        f'{-record[rule["component"]] if rule["kind"] == "deduction" and record[rule["component"]] else record[rule["component"]]:,.2f}</td></tr>'
+        for rule in PAY_RULES
+    )
+    return PAYSLIP_TEMPLATE.substitute(
+        month=html.escape(str(month)),
+        employee_id=html.escape(str(record["Employee ID"])),
+        name=html.escape(str(record["Name"])),
+        bank_account=html.escape(bank_account_text(record["Bank Account"]) or "Not provided"),
+        present_days=f"{float(record['Present Days']):g}",
+        paid_leave_days=f"{float(record['Paid Leave Days']):g}",
+        overtime_hours=f"{float(record['Overtime Hours']):,.2f}",
+        component_rows=component_rows,
+        total_salary=f"{record['Total Salary']:,.2f}"
+    )
+
+def payslip_archive(payroll, month):
+    """Zip of one HTML payslip per employee in a month's payroll"""
+    columns = PAYROLL_COLUMNS + ["Total Salary"]
+    output = BytesIO()
+    
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for values in payroll[columns].itertuples(index=False, name=None):
+            record = dict(zip(columns, values))
+            archive.writestr(f"Payslip_{month}_{record['Employee ID']}.html", payslip_html(record, month))
+    return output.getvalue()
+
+# =====================================================
+# DEPARTMENT ROLLUPS
+# =====================================================
+
+def rollup_department_month(month_payroll, df_emp, month):
+    """One month of the department cube, aggregated from that month's payroll rows"""
+    join_date = df_emp["join_date"].astype(str) if "join_date" in df_emp.columns else pd.Series("", index=df_emp.index)
+    # Active employees who had joined by month end, plus anyone with attendance that month
+    employed = (join_date <= f"{month}-31") | ~join_date.str.match(r"\d{4}-\d{2}-\d{2}")
+    counted = (employed & (df_emp["status"].astype(str) == "Active")).to_numpy() | (month_payroll["Present Days"].to_numpy() > 0)
+    
+    rollup = pd.DataFrame({
+        "Department": month_payroll["Department"].to_numpy(),
+        "Headcount": counted.astype(int),
+        "Present Days": month_payroll["Present Days"].to_numpy(),
+        "Payroll Cost": month_payroll["Total Salary"].to_numpy()
+    }).groupby("Department").sum().reset_index()
+    rollup["Possible Days"] = rollup["Headcount"] * int(working_days([month])[0])
+    rollup["Month"] = month
+    return rollup
+
+def with_attendance_rate(rollup):
+    """Add the attendance rate, which has to be recomputed after every aggregation"""
+    possible = rollup["Possible Days"].where(rollup["Possible Days"] > 0)
+    return rollup.assign(**{"Attendance Rate": (rollup["Present Days"] / possible).fillna(0.0)})
+
+def get_department_cube(df_emp, df_att, history, months):
+    """Department x month cube of headcount, attendance and payroll cost
+    
+    Each month is rebuilt only when its payroll or the roster changed, so a write to one
+    month refreshes that month's slice instead of the whole cube.
+    """
+    store = get_data_store()
+    
+    # Brings every month's cached payroll up to date first
+    get_payroll(df_emp, df_att, history, months)
+    roster_key = payroll_fingerprint(df_emp.reindex(columns=["employee_id", "department", "status", "join_date"]))
+    
+    slices = []
+    for month in months:
+        with store["lock"]:
+            payroll_key, month_payroll = store["derived"][("payroll", month)]
+            cached = store["derived"].get(("department_cube", month))
+        
+        if cached is None or cached[0] != (payroll_key, roster_key):
+            cached = ((payroll_key, roster_key), rollup_department_month(month_payroll, df_emp, month))
+            with store["lock"]:
+                store["derived"][("department_cube", month)] = cached
+        slices.append(cached[1])
+    
+    cube = pd.concat(slices, ignore_index=True)
+    return with_attendance_rate(cube).set_index(["Department", "Month"]).sort_index()
+
+def get_store_department_cube(months):
+    """get_department_cube of the current data, computed by the data service when there is one"""
+    store = get_data_store()
+    if store["service"]:
+        return store["service"].call("department_cube", list(months))
+    
+    with store["lock"]:
+        frames = [store["frames"][name] for name in PAYROLL_DATASETS]
+    return get_department_cube(*frames, months)
+
+def rollup_cube(cube, level):
+    """Aggregate the cube up to one of its levels ("Month" gives the organization per month)"""
+    return with_attendance_rate(
+        cube[["Headcount", "Present Days", "Possible Days", "Payroll Cost"]].groupby(level=level).sum()
+    )
+
+# =====================================================
+# ATTENDANCE ENTRY
+# =====================================================
+
+ATTENDANCE_STATUSES = ["Present", "Absent", "Leave", "Unpaid Leave"]
+# Statuses paid at the daily rates: "Leave" is paid leave, "Unpaid Leave" is not
+PAID_ATTENDANCE_STATUSES = ["Present", "Leave"]
+
+def column_letter(column_number):
+    """Convert a 1-based column number to its A1 letter(s)"""
+    from gspread.utils import rowcol_to_a1
+    
+    return rowcol_to_a1(1, column_number)[:-1]
+
+def build_attendance_grid(df_emp, df_att, dates):
+    """One row per employee and one status column per date, blank where nothing is recorded"""
+    grid = pd.DataFrame({
+        "Employee ID": df_emp["employee_id"].astype(str).to_numpy(),
+        "Name": df_emp["full_name"].to_numpy()
+    })
+    
+    recorded = pd.DataFrame(columns=dates)
+    if not df_att.empty:
+        in_period = df_att[df_att["date"].astype(str).isin(dates)]
+        if not in_period.empty:
+            recorded = (
+                in_period.assign(employee_id=in_period["employee_id"].astype(str), date=in_period["date"].astype(str))
+                .drop_duplicates(["employee_id", "date"], keep="last")
+                .pivot(index="employee_id", columns="date", values="status")
+            )
+    
+    for day in dates:
+        grid[day] = grid["Employee ID"].map(recorded[day]) if day in recorded.columns else None
+    return grid
+
+def diff_attendance_grid(before, after, dates):
+    """List (employee_id, date, status) for every cell the user changed to a non-blank status"""
+    before_long = before.melt(id_vars=["Employee ID"], value_vars=dates, var_name="date", value_name="status")
+    after_long = after.melt(id_vars=["Employee ID"], value_vars=dates, var_name="date", value_name="status")
+    
+    changed = after_long["status"].notna() & (after_long["status"] != before_long["status"])
+    return list(after_long.loc[changed, ["Employee ID", "date", "status"]].itertuples(index=False, name=None))
+
+def upsert_attendance(ws, changes, overwrite=True):
+    """Upsert (employee_id, date, status) rows with one batched cell update and one append
+    
+    With overwrite=False rows that already exist are left untouched (insert only).
+    """
+    header = ws.row_values(1)
+    id_col = header.index("employee_id") + 1
+    date_col = header.index("date") + 1
+    status_letter = column_letter(header.index("status") + 1)
+    
+    # Read only the key columns to locate existing rows, not the whole sheet
+    ids, dates = ws.batch_get([
+        f"{column_letter(id_col)}2:{column_letter(id_col)}",
+        f"{column_letter(date_col)}2:{column_letter(date_col)}"
+    ])
+    
+    rows_by_key = {}
+    for offset in range(max(len(ids), len(dates))):
+        emp_id = ids[offset][0] if offset < len(ids) and ids[offset] else ""
+        day = dates[offset][0] if offset < len(dates) and dates[offset] else ""
+        rows_by_key.setdefault((str(emp_id), str(day)), []).append(offset + 2)
+    
+    # The last change for a key wins, so a key is never appended twice
+    latest = {(str(emp_id), str(day)): status for emp_id, day, status in changes}
+    
+    updates = []
+    new_rows = []
+    for (emp_id, day), status in latest.items():
+        rows = rows_by_key.get((emp_id, day))
+        if rows and overwrite:
+            updates.extend({"range": f"{status_letter}{row}", "values": [[status]]} for row in rows)
+        elif not rows:
+            values = {"employee_id": emp_id, "date": day, "status": status}
+            new_rows.append([values.get(column, "") for column in header])
+    
+    if updates:
+        ws.batch_update(updates)
+    if new_rows:
+        ws.append_rows(new_rows)
+    
+    return len(updates), len(new_rows)
+
+# =====================================================
+# LEAVE MANAGEMENT
+# =====================================================
+
+# Leave types: the attendance status an approved day is recorded as, and the days earned
+# per month employed (0: no balance is kept, e.g. unpaid leave)
+LEAVE_TYPES = {
+    "Annual": {"attendance_status": "Leave", "accrual_per_month": 1.25},
+    "Sick": {"attendance_status": "Leave", "accrual_per_month": 1.0},
+    "Unpaid": {"attendance_status": "Unpaid Leave", "accrual_per_month": 0.0}
+}
+LEAVE_ATTENDANCE_STATUSES = sorted({spec["attendance_status"] for spec in LEAVE_TYPES.values()})
+LEAVE_REQUEST_STATUSES = ["Pending", "Approved", "Rejected", "Cancelled"]
+LEAVE_LEDGER_COLUMNS = ["Accrued", "Taken", "Pending", "Balance"]
+
+def leave_days(start_date, end_date):
+    """Working days (Mon-Fri) from start_date to end_date inclusive"""
+    return pd.bdate_range(start_date, end_date).strftime("%Y-%m-%d").tolist()
+
+def leave_requests_frame(requests):
+    """The leave requests with every worksheet column, also when the worksheet is still empty"""
+    if requests.empty:
+        return pd.DataFrame(columns=MANAGED_WORKSHEETS["leave_requests"])
+    return requests
+
+def build_leave_ledger(df_emp, requests, month):
+    """Leave balance of every employee x accruing leave type as of a YYYY-MM month
+    
+    Days accrue from the join month through `month`; Taken counts approved requests and
+    Pending the requests still waiting for a decision.
+    """
+    import numpy as np
+    
+    accruing = {leave_type: spec for leave_type, spec in LEAVE_TYPES.items() if spec["accrual_per_month"]}
+    ids = df_emp["employee_id"].astype(str).to_numpy()
+    joined = pd.to_datetime(
+        df_emp.get("join_date", pd.Series("", index=df_emp.index)).astype(str), format="%Y-%m-%d", errors="coerce"
+    )
+    as_of = pd.Period(month, freq="M")
+    months_employed = ((as_of.year - joined.dt.year) * 12 + as_of.month - joined.dt.month + 1).clip(lower=0).fillna(0)
+    
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(ids, len(accruing)), np.tile(list(accruing), len(ids))], names=["employee_id", "leave_type"]
+    )
+    ledger = pd.DataFrame(
+        {"Accrued": np.outer(months_employed.to_numpy(), [spec["accrual_per_month"] for spec in accruing.values()]).ravel()},
+        index=index
+    )
+    
+    requests = leave_requests_frame(requests)
+    by_status = pd.DataFrame({
+        "employee_id": requests["employee_id"].astype(str),
+        "leave_type": requests["leave_type"].astype(str),
+        "status": requests["status"].astype(str),
+        "days": pd.to_numeric(requests["days"], errors="coerce").fillna(0.0)
+    }).groupby(["employee_id", "leave_type", "status"])["days"].sum().unstack("status")
+    by_status = by_status.reindex(index=index, columns=["Approved", "Pending"]).fillna(0.0)
+    
+    ledger["Taken"] = by_status["Approved"].to_numpy()
+    ledger["Pending"] = by_status["Pending"].to_numpy()
+    ledger["Balance"] = ledger["Accrued"] - ledger["Taken"]
+    return ledger.sort_index()
+
+def get_leave_ledger():
+    """Leave balances of the current data, updated in place for just the employees that changed
+    
+    The change feed tells which employees' records or leave requests changed since the
+    ledger was built; only their rows are rebuilt. A new month (more accrual) or a gap in
+    the feed rebuilds it in full.
+    """
+    datasets = ("employees", "leave_requests")
+    month = date.today().strftime("%Y-%m")
+    store = get_data_store()
+    
+    with store["lock"]:
+        df_emp, requests = (store["frames"][name] for name in datasets)
+        versions = tuple(store["versions"][name] for name in datasets)
+        cached = store["derived"].get("leave_ledger")
+    
+    if cached is not None and cached[0] == (versions, month):
+        return cached[1]
+    
+    affected = None
+    if cached is not None and cached[0][1] == month:
+        changed = [changes_since(name, version) for name, version in zip(datasets, cached[0][0])]
+        if all(keys is not None for keys in changed):
+            affected = {key.split("|")[0] for keys in changed for key in keys}
+    
+    if affected is None:
+        ledger = build_leave_ledger(df_emp, requests, month)
+    else:
+        previous = cached[1]
+        requests = leave_requests_frame(requests)
+        ledger = pd.concat([
+            previous[~previous.index.get_level_values("employee_id").isin(affected)],
+            build_leave_ledger(
+                df_emp[df_emp["employee_id"].astype(str).isin(affected)],
+                requests[requests["employee_id"].astype(str).isin(affected)],
+                month
+            )
+        ]).sort_index()
+    
+    with store["lock"]:
+        store["derived"]["leave_ledger"] = ((versions, month), ledger)
+    return ledger
+
+def validate_leave_request(employee_id, leave_type, start_date, end_date, requests, ledger):
+    """Error message for a leave request that can't be made, or None
+    
+    requests are the employee's own leave requests; ledger is a build_leave_ledger covering
+    at least that employee.
+    """
+    if end_date < start_date:
+        return "End date is before the start date"
+    
+    days = leave_days(start_date, end_date)
+    if not days:
+        return "The selected period has no working days"
+    
+    requests = leave_requests_frame(requests)
+    open_requests = requests[requests["status"].astype(str).isin(["Pending", "Approved"])]
+    overlapping = (
+        (open_requests["start_date"].astype(str) <= str(end_date)) & (open_requests["end_date"].astype(str) >= str(start_date))
+    )
+    if overlapping.any():
+        return f"Overlaps leave request {open_requests.loc[overlapping, 'request_id'].iloc[0]}"
+    
+    if LEAVE_TYPES[leave_type]["accrual_per_month"]:
+        key = (str(employee_id), leave_type)
+        available = ledger.loc[key, "Balance"] - ledger.loc[key, "Pending"] if key in ledger.index else 0.0
+        if len(days) > available:
+            return f"Only {available:g} {leave_type} leave days are available"
+    return None
+
+def leave_request_row(employee_id, leave_type, start_date, end_date, reason):
+    """A new Pending leave request as a worksheet row"""
+    now = datetime.now()
+    return [
+        f"LV{now:%Y%m%d%H%M%S%f}", str(employee_id), leave_type, str(start_date), str(end_date),
+        len(leave_days(start_date, end_date)), reason, "Pending", now.isoformat(timespec="seconds"), "", ""
+    ]
+
+def decide_leave_request(store, request, status, decided_by):
+    """Journal a decision on a Pending leave request; False (and nothing written) if it is no longer Pending
+    
+    Approving also records every working day of the request in attendance under the leave
+    type's status, so payroll and the attendance roster see the leave.
+    """
+    request_id = str(request["request_id"])
+    decision = {
+        "request_id": request_id,
+        "employee_id": str(request["employee_id"]),
+        "status": status,
+        "decided_by": str(decided_by),
+        "decided_at": datetime.now().isoformat(timespec="seconds")
+    }
+    
+    def current_request():
+        with store["lock"]:
+            requests = leave_requests_frame(store["frames"]["leave_requests"])
+        match = requests[requests["request_id"].astype(str) == request_id]
+        return match.iloc[0] if not match.empty else None
+    
+    current = current_request()
+    if current is None or str(current["status"]) != "Pending":
+        return False
+    
+    submit_write(store, "leave_requests", "decide", decision, decided_by)
+    
+    # Another decision may have landed first, in which case apply_write kept it
+    current = current_request()
+    if current is None or [str(current[column]) for column in ("status", "decided_by", "decided_at")] != [
+        decision["status"], decision["decided_by"], decision["decided_at"]
+    ]:
+        return False
+    
+    if status == "Approved":
+        attendance_status = LEAVE_TYPES[str(request["leave_type"])]["attendance_status"]
+        submit_write(store, "attendance", "upsert", {
+            "changes": [
+                [str(request["employee_id"]), day, attendance_status]
+                for day in leave_days(str(request["start_date"]), str(request["end_date"]))
+            ],
+            "overwrite": True
+        }, decided_by)
+    return True
+
+# =====================================================
+# ATTENDANCE QUALITY
+# =====================================================
+
+ATTENDANCE_ISSUE_COLUMNS = ["Issue", "Employee ID", "Date", "Status", "Detail"]
+
+def scan_attendance(df_att, df_emp):
+    """Data quality issues of the whole attendance frame, found in one vectorized pass"""
+    if df_att.empty:
+        return pd.DataFrame(columns=ATTENDANCE_ISSUE_COLUMNS)
+    
+    ids = df_att["employee_id"].astype(str)
+    days = df_att["date"].astype(str)
+    statuses = df_att["status"].astype(str)
+    parsed_days = pd.to_datetime(days, format="%Y-%m-%d", errors="coerce")
+    
+    employees = df_emp.assign(employee_id=df_emp["employee_id"].astype(str)).drop_duplicates("employee_id", keep="last").set_index("employee_id")
+    known = ids.isin(employees.index)
+    employee_status = ids.map(employees["status"].astype(str))
+    join_dates = pd.to_datetime(ids.map(employees.get("join_date", pd.Series(dtype=str)).astype(str)), format="%Y-%m-%d", errors="coerce")
+    
+    keys = ids + "|" + days
+    duplicated = keys.duplicated(keep=False)
+    conflicting = duplicated & (statuses.groupby(keys).transform("nunique") > 1)
+    
+    checks = [
+        (duplicated & ~conflicting, "Duplicate record", "Same status recorded more than once; counted once in payroll"),
+        (conflicting, "Conflicting records", "Different statuses recorded for the same day; payroll uses the last one"),
+        (~known, "Unknown employee", "Employee ID is not in the employee list"),
+        (known & (employee_status != "Active") & (statuses.str.lower() == "present"), "Inactive employee", "Marked present while inactive"),
+        (~statuses.isin(ATTENDANCE_STATUSES), "Invalid status", f"Status must be one of {', '.join(ATTENDANCE_STATUSES)}"),
+        (parsed_days.isna(), "Invalid date", "Date must be YYYY-MM-DD"),
+        ((parsed_days > pd.Timestamp(date.today())) & ~statuses.isin(LEAVE_ATTENDANCE_STATUSES),
+         "Future date", "Recorded for a day that has not happened yet"),
+        (parsed_days < join_dates, "Before join date", "Recorded before the employee joined")
+    ]
+    
+    return pd.concat(
+        [pd.DataFrame({"Issue": issue, "Employee ID": ids[mask], "Date": days[mask], "Status": statuses[mask], "Detail": detail})
+         for mask, issue, detail in checks if mask.any()] or [pd.DataFrame(columns=ATTENDANCE_ISSUE_COLUMNS)],
+        ignore_index=True
+    )
+
+def get_attendance_issues():
+    """scan_attendance of the live sheet and of every archived month, with the Source of each issue
+    
+    The sheet's report is rebuilt per data version; an archived month's only when its
+    partition is rewritten or the employees change, so a check-in never rescans the archive.
+    """
+    reports = [get_derived("attendance_issues", ("attendance", "employees"), scan_attendance).assign(Source="Sheet")]
+    
+    store = get_data_store()
+    with store["lock"]:
+        df_emp = store["frames"]["employees"]
+        employees_version = store["versions"]["employees"]
+    
+    for month, stamp in archive_stamps(archived_months()):
+        key = ("attendance_issues", month)
+        with store["lock"]:
+            cached = store["derived"].get(key)
+        
+        if cached is None or cached[0] != (stamp, employees_version):
+            cached = ((stamp, employees_version), scan_attendance(read_archived_attendance([month]), df_emp))
+            with store["lock"]:
+                store["derived"][key] = cached
+        if not cached[1].empty:
+            reports.append(cached[1].assign(Source=f"Archive {month}"))
+    return pd.concat(reports, ignore_index=True)
+
+# =====================================================
+# ATTENDANCE ARCHIVE
+# =====================================================
+
+# Closed months are moved out of the attendance sheet into one Parquet file per month
+ARCHIVE_DIR = LOCAL_DATA_DIR / "attendance_archive"
+ARCHIVE_COLUMNS = ["employee_id", "date", "status", "overtime_hours"]
+
+def archive_path(month):
+    """Parquet partition holding one archived YYYY-MM month"""
+    return ARCHIVE_DIR / f"{month}.parquet"
+
+def archived_months():
+    """Months that have an archived partition, oldest first"""
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(path.stem for path in ARCHIVE_DIR.glob("*.parquet"))
+
+def employee_archived_months(employee_id):
+    """Archived months holding any of one employee's attendance, read once per attendance version"""
+    employee_id = str(employee_id)
+
+    def build(df_att):
+        dates = read_archived_attendance(archived_months(), employee_id=employee_id, columns=["date"])["date"]
+        return sorted(set(dates.astype(str).str[:7]))
+
+    return get_derived(("archived_months", employee_id), ("attendance",), build)
+
+def attendance_keys(frame):
+    """employee_id|date key of every attendance row"""
+    return frame["employee_id"].astype(str) + "|" + frame["date"].astype(str)
+
+def read_archived_attendance(months, employee_id=None, columns=ARCHIVE_COLUMNS):
+    """Read archived months memory-mapped, loading only the given columns (and one employee's rows)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filters = [("employee_id", "=", str(employee_id))] if employee_id is not None else None
+    tables = []
+    for month in months:
+        path = archive_path(month)
+        if not path.exists():
+            continue
+        # Older partitions may lack optional columns such as overtime_hours
+        present = None if columns is None else [column for column in columns if column in pq.read_schema(path).names]
+        tables.append(pq.read_table(path, columns=present, filters=filters, memory_map=True))
+
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pa.concat_tables(tables, promote_options="default").to_pandas()
+
+def write_archive_partition(month, rows):
+    """Merge rows into a month's partition; rows for an already archived key replace the archived ones"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = rows.fillna("").astype(str)
+    if archive_path(month).exists():
+        archived = read_archived_attendance([month], columns=None)
+        rows = pd.concat([archived[~attendance_keys(archived).isin(attendance_keys(rows))], rows], ignore_index=True)
+
+    # Sorted by employee so single-employee reads can skip most of the file
+    rows = rows.sort_values(["employee_id", "date"], kind="stable").reset_index(drop=True)
+
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = archive_path(month).with_suffix(".tmp")
+    pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), temp_path)
+    os.replace(temp_path, archive_path(month))
+
+def attendance_for_months(df_att, months, employee_id=None):
+    """Attendance rows for the given months: live rows plus archived rows the live sheet does not override"""
+    months = list(months)
+    live = df_att[df_att["date"].astype(str).str[:7].isin(months)] if not df_att.empty else df_att
+
+    archived_in_range = sorted(set(months) & set(archived_months()))
+    if not archived_in_range:
+        return live
+
+    archived = read_archived_attendance(archived_in_range, employee_id=employee_id)
+    if not live.empty:
+        archived = archived[~attendance_keys(archived).isin(attendance_keys(live))]
+    return pd.concat([archived, live], ignore_index=True)
+
+def closed_live_months(df_att):
+    """Months before the current one that still have rows in the live sheet"""
+    if df_att.empty:
+        return []
+    current_month = date.today().strftime("%Y-%m")
+    return sorted(month for month in df_att["date"].astype(str).str[:7].unique() if month < current_month)
+
+ARCHIVE_DELETE_ATTEMPTS = 3
+
+def archive_sheet_months(ws, months):
+    """Archive the sheet's rows for the given months, then delete them with one batched request
+
+    The rows are re-read at send time so anything added since the local copy was archived is kept too.
+    Rows are deleted by position, so the key of every row is checked again right before the
+    delete; if another writer moved rows in between, the whole pass is repeated.
+    """
+    for attempt in range(ARCHIVE_DELETE_ATTEMPTS):
+        values = ws.get_all_values()
+        if len(values) < 2:
+            return
+
+        header = values[0]
+        rows = pd.DataFrame([row + [""] * (len(header) - len(row)) for row in values[1:]], columns=header)
+        row_months = rows["date"].str[:7]
+
+        # Merging into a partition is idempotent, so a repeated pass archives the same rows again safely
+        for month in months:
+            month_rows = rows[row_months == month]
+            if not month_rows.empty:
+                write_archive_partition(month, month_rows)
+
+        # Contiguous runs of rows to delete, as 0-based [start, end) indexes (the header is index 0)
+        positions = [offset + 1 for offset, in_month in enumerate(row_months.isin(months)) if in_month]
+        if not positions:
+            return
+        runs = []
+        for position in positions:
+            if runs and runs[-1][1] == position:
+                runs[-1][1] = position + 1
+            else:
+                runs.append([position, position + 1])
+
+        id_letter = column_letter(header.index("employee_id") + 1)
+        date_letter = column_letter(header.index("date") + 1)
+        ids, dates = ws.batch_get([f"{id_letter}2:{id_letter}", f"{date_letter}2:{date_letter}"])
+        current_keys = [
+            (str(ids[offset][0]) if offset < len(ids) and ids[offset] else "",
+             str(dates[offset][0]) if offset < len(dates) and dates[offset] else "")
+            for offset in range(max(len(ids), len(dates)))
+        ]
+        expected_keys = list(zip(rows["employee_id"].astype(str), rows["date"].astype(str)))
+        if any(
+            position - 1 >= len(current_keys) or current_keys[position - 1] != expected_keys[position - 1]
+            for position in positions
+        ):
+            continue
+
+        # Deleting from the bottom up keeps the earlier indexes valid
+        requests = [
+            {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": start, "endIndex": end}}}
+            for start, end in reversed(runs)
+        ]
+        ws.spreadsheet.batch_update({"requests": requests})
+        return
+
+    raise RuntimeError("The attendance sheet kept changing while its rows were being archived; retry later")
+
+# =====================================================
+# WRITE-AHEAD JOURNAL
+# =====================================================
+
+JOURNAL_PATH = LOCAL_DATA_DIR / "journal.sqlite"
+JOURNAL_FLUSH_SECONDS = 2
+JOURNAL_RETENTION_DAYS = 7
+# Sends a write may fail with transient errors before it is marked failed and stops holding up the queue
+JOURNAL_MAX_ATTEMPTS = 20
+
+EMPLOYEE_COLUMNS = [
+    "employee_id", "full_name", "place_of_birth", "date_of_birth", "national_id_number",
+    "gender", "join_date", "department", "position", "address", "bank_account_number",
+    "marital_status", "mothers_maiden_name", "daily_rate_basic", "daily_rate_transport",
+    "daily_rate_meal", "allowance_monthly", "status"
+]
+
+class JournalConflict(Exception):
+    """A journaled write that can never be applied, e.g. adding an employee ID that already exists"""
+
+def open_journal():
+    """Open the journal database, creating it on first use"""
+    LOCAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOURNAL_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS journal ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT, actor TEXT, dataset TEXT, op TEXT, "
+        "payload TEXT, status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, last_error TEXT, applied_at REAL)"
+    )
+    return conn
+
+def read_unsynced_writes(since=None):
+    """Pending writes, plus writes sent to Sheets after `since`, as {dataset: [(op, payload)]}"""
+    if not JOURNAL_PATH.exists():
+        return {}
+    
+    with closing(open_journal()) as conn:
+        rows = conn.execute(
+            "SELECT dataset, op, payload FROM journal "
+            "WHERE status IN ('pending', 'sending') OR (status = 'done' AND applied_at >= ?) ORDER BY id",
+            (since if since is not None else time.time(),)
+        ).fetchall()
+    
+    writes = {}
+    for dataset, op, payload in rows:
+        writes.setdefault(dataset, []).append((op, json.loads(payload)))
+    return writes
+
+def apply_write(frame, dataset, op, payload):
+    """Apply a journaled write to a local frame; idempotent so unsynced writes can be replayed"""
+    from gspread.utils import numericise, numericise_all
+    
+    if dataset == "rate_history":
+        # A later entry for the same employee and date replaces the earlier one
+        new_records = pd.DataFrame(
+            [numericise_all([str(value) for value in row], empty2zero=False, default_blank="") for row in payload["rows"]],
+            columns=MANAGED_WORKSHEETS["rate_history"]
+        )
+        if not frame.empty:
+            keys = frame["employee_id"].astype(str) + "|" + frame["effective_date"].astype(str)
+            new_keys = new_records["employee_id"].astype(str) + "|" + new_records["effective_date"].astype(str)
+            frame = frame[~keys.isin(new_keys)]
+        return pd.concat([frame, new_records], ignore_index=True)
+    
+    if dataset == "leave_requests":
+        request_ids = frame["request_id"].astype(str) if not frame.empty else pd.Series(dtype=str)
+        if op == "insert":
+            if (request_ids == str(payload["row"][0])).any():
+                return frame
+            new_record = pd.DataFrame(
+                [numericise_all([str(value) for value in payload["row"]], empty2zero=False, default_blank="")],
+                columns=MANAGED_WORKSHEETS["leave_requests"]
+            )
+            return new_record if frame.empty else pd.concat([frame, new_record], ignore_index=True)
+        
+        # Only a Pending request can be decided; a later decision on it is dropped
+        decided = (request_ids == str(payload["request_id"])) & (frame["status"].astype(str) == "Pending")
+        if not decided.any():
+            return frame
+        frame = frame.copy(deep=False)
+        for column in ("status", "decided_by", "decided_at"):
+            frame[column] = frame[column].astype(object).mask(decided, payload[column])
+        return frame
+    
+    if dataset == "attendance" and op == "archive":
+        return frame[~frame["date"].astype(str).str[:7].isin(payload["months"])].reset_index(drop=True)
+    
+    if dataset == "attendance":
+        latest = {(str(emp_id), str(day)): status for emp_id, day, status in payload["changes"]}
+        if frame.empty:
+            keys = pd.Series(dtype=str)
+        else:
+            keys = frame["employee_id"].astype(str) + "|" + frame["date"].astype(str)
+        statuses = pd.Series(list(latest.values()), index=[f"{emp_id}|{day}" for emp_id, day in latest])
+        existing = keys.isin(statuses.index)
+        
+        if payload.get("overwrite", True) and existing.any():
+            # A new frame object for the store; copy-on-write copies only the status column
+            frame = frame.copy(deep=False)
+            frame.loc[existing, "status"] = keys[existing].map(statuses).to_numpy()
+        
+        known = set(keys[existing])
+        new_records = [
+            {"employee_id": numericise(emp_id), "date": day, "status": status}
+            for (emp_id, day), status in latest.items()
+            if f"{emp_id}|{day}" not in known
+        ]
+        if new_records:
+            frame = pd.concat([frame, pd.DataFrame(new_records)], ignore_index=True)
+        return frame
+    
+    if op == "upsert":
+        new_records = pd.DataFrame(
+            [numericise_all([str(value) for value in row], empty2zero=False, default_blank="") for row in payload["rows"]],
+            columns=EMPLOYEE_COLUMNS
+        ).drop_duplicates("employee_id", keep="last")
+        if frame.empty:
+            return new_records
+        
+        ids = frame["employee_id"].astype(str)
+        new_ids = new_records["employee_id"].astype(str)
+        updates = new_records.set_index(new_ids)
+        existing = ids.isin(new_ids)
+        
+        if existing.any():
+            # Upserted columns are replaced in place; any other columns keep their values
+            frame = frame.copy(deep=False)
+            for column in EMPLOYEE_COLUMNS:
+                current = frame[column].astype(object) if column in frame.columns else pd.Series("", index=frame.index, dtype=object)
+                frame[column] = current.mask(existing, ids.map(updates[column].astype(object)))
+            frame = frame.infer_objects()
+        
+        return pd.concat([frame, new_records[~new_ids.isin(ids)]], ignore_index=True)
+    
+    records = frame.to_dict("records")
+    
+    if op == "delete":
+        records = [record for record in records if str(record.get("employee_id")) != str(payload["employee_id"])]
+    else:
+        # Numericise like get_all_records so local and fetched rows have the same types
+        new_record = dict(zip(
+            EMPLOYEE_COLUMNS,
+            numericise_all([str(value) for value in payload["row"]], empty2zero=False, default_blank="")
+        ))
+        matches = [i for i, record in enumerate(records) if str(record.get("employee_id")) == str(payload["row"][0])]
+        if op == "update":
+            for i in matches:
+                records[i] = {**records[i], **new_record}
+        elif op == "insert" and not matches:
+            records.append(new_record)
+    
+    return pd.DataFrame(records, columns=frame.columns if len(frame.columns) else None)
+
+def submit_write(store, dataset, op, payload, actor):
+    """Durably journal a write and apply it to the shared data; the journal flusher sends it to Sheets"""
+    if store["service"]:
+        store["service"].call("submit_write", dataset, op, payload, str(actor))
+        pull_from_service(store)
+        return
+    
+    with closing(open_journal()) as conn:
+        with conn:
+            conn.execute(
+                "INSERT INTO journal (created_at, actor, dataset, op, payload) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), str(actor), dataset, op, json.dumps(payload, default=str))
+            )
+    
+    with store["lock"]:
+        before = store["frames"][dataset]
+        store["frames"][dataset] = apply_write(before, dataset, op, payload)
+        store["local_writes"].add(dataset)
+        # Archiving moves rows rather than changing them, but anything keyed on live rows must reload
+        record_change(store, dataset, None if op == "archive" else write_keys(dataset, op, payload))
+        after = store["frames"][dataset]
+    
+    audit_write(actor, dataset, op, payload, before, after)
+
+def find_employee_row(ws, employee_id):
+    """Return the sheet row number of an employee read fresh from the ID column, or None"""
+    ids = ws.col_values(1)
+    return ids.index(str(employee_id)) + 1 if str(employee_id) in ids else None
+
+def execute_write(worksheets, dataset, op, payload):
+    """Send one journaled write to Google Sheets, resolving rows by key at send time"""
+    ws = worksheets[dataset]
+    
+    if dataset == "rate_history":
+        ws.append_rows(payload["rows"])
+        return
+    
+    if dataset == "leave_requests":
+        request_ids = ws.col_values(1)
+        if op == "insert":
+            # Already there when an earlier send went through but its response was lost
+            if str(payload["row"][0]) not in request_ids:
+                ws.append_row(payload["row"])
+            return
+        if str(payload["request_id"]) not in request_ids:
+            raise JournalConflict(f"Leave request {payload['request_id']} no longer exists")
+        row_number = request_ids.index(str(payload["request_id"])) + 1
+        current = ws.row_values(row_number)[7:11] + [""] * 4
+        if [current[0], current[2], current[3]] == [payload["status"], payload["decided_by"], payload["decided_at"]]:
+            # Already sent; the earlier response was lost
+            return
+        if current[0] != "Pending":
+            raise JournalConflict(f"Leave request {payload['request_id']} is {current[0]}, not Pending")
+        ws.batch_update([
+            {"range": f"H{row_number}", "values": [[payload["status"]]]},
+            {"range": f"J{row_number}:K{row_number}", "values": [[payload["decided_by"], payload["decided_at"]]]}
+        ])
+        return
+    
+    if dataset == "attendance" and op == "archive":
+        archive_sheet_months(ws, payload["months"])
+        return
+    
+    if dataset == "attendance":
+        upsert_attendance(ws, payload["changes"], payload.get("overwrite", True))
+        return
+    
+    if op == "upsert":
+        # One read of the ID column, one batched update and one append for the whole upload
+        row_numbers = {str(value): number for number, value in enumerate(ws.col_values(1), start=1)}
+        updates = [
+            {"range": f"A{row_numbers[str(row[0])]}:R{row_numbers[str(row[0])]}", "values": [row]}
+            for row in payload["rows"] if str(row[0]) in row_numbers
+        ]
+        inserts = [row for row in payload["rows"] if str(row[0]) not in row_numbers]
+        if updates:
+            ws.batch_update(updates)
+        if inserts:
+            ws.append_rows(inserts)
+        return
+    
+    employee_id = payload["employee_id"] if op == "delete" else payload["row"][0]
+    row_number = find_employee_row(ws, employee_id)
+    
+    if op == "delete":
+        if row_number:
+            ws.delete_rows(row_number)
+    elif op == "insert":
+        if row_number:
+            raise JournalConflict(f"Employee ID {employee_id} already exists")
+        ws.append_row(payload["row"])
+    else:
+        if not row_number:
+            raise JournalConflict(f"Employee ID {employee_id} no longer exists")
+        ws.update(f"A{row_number}:R{row_number}", [payload["row"]])
+
+def mark_journal_entries(entry_ids, status, error=None):
+    """Record the outcome of sending journal entries to Sheets"""
+    placeholders = ",".join("?" * len(entry_ids))
+    with closing(open_journal()) as conn:
+        with conn:
+            conn.execute(
+                f"UPDATE journal SET status = ?, last_error = ?, applied_at = ?, attempts = attempts + 1 "
+                f"WHERE id IN ({placeholders})",
+                (status, error, time.time() if status == "done" else None, *entry_ids)
+            )
+
+def release_journal_entries(entry_ids):
+    """Return claimed but unsent entries to the queue"""
+    if not entry_ids:
+        return
+    placeholders = ",".join("?" * len(entry_ids))
+    with closing(open_journal()) as conn:
+        with conn:
+            conn.execute(f"UPDATE journal SET status = 'pending' WHERE id IN ({placeholders})", entry_ids)
+
+def is_transient_error(error):
+    """True for errors worth retrying later: rate limits, server errors and network failures"""
+    from gspread.exceptions import APIError
+    
+    if isinstance(error, APIError):
+        status = getattr(error.response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(error, (OSError, TimeoutError))
+
+def flush_journal(store):
+    """Send pending writes to Sheets in order, coalescing consecutive attendance upserts into one call
+    
+    Returns False if a transient error stopped the flush (the remaining entries are retried later).
+    Any other error, or a transient one repeated JOURNAL_MAX_ATTEMPTS times, fails the entry
+    so later writes go ahead; retry_failed_writes puts it back in the queue.
+    """
+    if store["worksheets"] is None:
+        return False
+    
+    # Claim the entries in one write transaction so two flushers never send the same write
+    with closing(open_journal()) as conn:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, dataset, op, payload, attempts FROM journal WHERE status = 'pending' ORDER BY id LIMIT 500"
+            ).fetchall()
+            conn.executemany("UPDATE journal SET status = 'sending' WHERE id = ?", [(row[0],) for row in rows])
+    
+    batches = []
+    for entry_id, dataset, op, payload, attempts in rows:
+        payload = json.loads(payload)
+        last = batches[-1] if batches else None
+        if (last and dataset == "attendance" and last["dataset"] == "attendance"
+                and op == "upsert" and last["op"] == "upsert"
+                and last["payload"].get("overwrite", True) == payload.get("overwrite", True)):
+            last["ids"].append(entry_id)
+            last["payload"]["changes"].extend(payload["changes"])
+            last["attempts"] = max(last["attempts"], attempts)
+        else:
+            batches.append({"ids": [entry_id], "dataset": dataset, "op": op, "payload": payload, "attempts": attempts})
+    
+    for position, batch in enumerate(batches):
+        try:
+            execute_write(store["worksheets"], batch["dataset"], batch["op"], batch["payload"])
+        except Exception as e:
+            if not is_transient_error(e) or batch["attempts"] + 1 >= JOURNAL_MAX_ATTEMPTS:
+                mark_journal_entries(batch["ids"], "failed", f"{type(e).__name__}: {e}")
+                continue
+            mark_journal_entries(batch["ids"], "pending", f"{type(e).__name__}: {e}")
+            release_journal_entries([entry_id for later in batches[position + 1:] for entry_id in later["ids"]])
+            return False
+        mark_journal_entries(batch["ids"], "done")
+    return True
+
+def run_journal_flusher(store):
+    """Flush the journal for the lifetime of the process, backing off while Sheets keeps failing"""
+    failures = 0
+    while True:
+        time.sleep(min(60, JOURNAL_FLUSH_SECONDS * 2 ** failures))
+        try:
+            failures = 0 if flush_journal(store) else min(failures + 1, 5)
+        except sqlite3.Error:
+            failures = min(failures + 1, 5)
+
+@st.cache_resource
+def start_journal_flusher():
+    """Replay writes left pending by a previous run and keep flushing new ones in the background"""
+    # With a data service, the service owns the journal
+    if USE_DATA_SERVICE:
+        return None
+    
+    with closing(open_journal()) as conn:
+        with conn:
+            # Entries a previous process claimed but never confirmed are sent again
+            conn.execute("UPDATE journal SET status = 'pending' WHERE status = 'sending'")
+            conn.execute(
+                "DELETE FROM journal WHERE status = 'done' AND applied_at < ?",
+                (time.time() - JOURNAL_RETENTION_DAYS * 86400,)
+            )
+    
+    thread = threading.Thread(target=run_journal_flusher, args=(get_data_store(),), daemon=True)
+    thread.start()
+    return thread
+
+def journal_status():
+    """Counts of journal entries by status ('sending' counts as pending)"""
+    if USE_DATA_SERVICE:
+        return get_data_store()["service"].call("journal_status")
+    
+    with closing(open_journal()) as conn:
+        return dict(conn.execute(
+            "SELECT CASE WHEN status = 'sending' THEN 'pending' ELSE status END, COUNT(*) "
+            "FROM journal GROUP BY 1"
+        ).fetchall())
+
+def recent_journal_entries(limit=100):
+    """Most recent journal entries, newest first"""
+    if USE_DATA_SERVICE:
+        return get_data_store()["service"].call("recent_journal_entries", limit)
+    
+    with closing(open_journal()) as conn:
+        return pd.read_sql_query(
+            "SELECT id, created_at, actor, dataset, op, status, attempts, last_error "
+            "FROM journal ORDER BY id DESC LIMIT ?",
+            conn,
+            params=(limit,)
+        )
+
+def retry_failed_writes():
+    """Put failed journal entries back in the queue"""
+    if USE_DATA_SERVICE:
+        return get_data_store()["service"].call("retry_failed_writes")
+    
+    with closing(open_journal()) as conn:
+        with conn:
+            conn.execute("UPDATE journal SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+
+# =====================================================
+# AUDIT LOG
+# =====================================================
+
+AUDIT_PATH = LOCAL_DATA_DIR / "audit.sqlite"
+AUDIT_FLUSH_SECONDS = 5
+
+def open_audit_log():
+    """Open the audit database, creating it on first use"""
+    LOCAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(AUDIT_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS audit ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, at TEXT, actor TEXT, dataset TEXT, op TEXT, "
+        "entity TEXT, before TEXT, after TEXT)"
+    )
+    return conn
+
+@st.cache_resource
+def get_audit_queue():
+    """Process-wide buffer of writes waiting to be diffed into the audit log"""
+    queue = {
+        "pending": [],
+        "lock": threading.Lock()
+    }
+    threading.Thread(target=run_audit_flusher, args=(queue,), daemon=True).start()
+    return queue
+
+def audit_write(actor, dataset, op, payload, before, after):
+    """Queue a write for the audit log; the diff is computed in the background so saves don't wait"""
+    queue = get_audit_queue()
+    with queue["lock"]:
+        queue["pending"].append((datetime.now().isoformat(timespec="seconds"), str(actor), dataset, op, payload, before, after))
+
+def audit_value(value):
+    """Cell value as audit text, so 100, 100.0 and "100" compare equal"""
+    if value is None or value != value:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def audit_changes(dataset, op, payload, before, after):
+    """(entity, before, after) of each entity a write changed, with only the fields that changed"""
+    if op == "archive":
+        return [(",".join(payload["months"]), None, {"archived": "moved to the attendance archive"})]
+    
+    keys = write_keys(dataset, op, payload)
+    rows = []
+    for frame in (before, after):
+        if frame.empty:
+            rows.append({})
+            continue
+        frame_keys = entity_keys(frame, dataset)
+        touched = frame_keys.isin(keys)
+        rows.append({
+            key: {column: audit_value(value) for column, value in record.items()}
+            for key, record in zip(frame_keys[touched], frame[touched].to_dict("records"))
+        })
+    
+    changes = []
+    for key in sorted(keys):
+        old, new = rows[0].get(key), rows[1].get(key)
+        if old is None or new is None:
+            if old != new:
+                changes.append((key, old, new))
+            continue
+        fields = [column for column in dict.fromkeys([*old, *new]) if old.get(column, "") != new.get(column, "")]
+        if fields:
+            changes.append((key, {column: old.get(column, "") for column in fields}, {column: new.get(column, "") for column in fields}))
+    return changes
+
+def audit_entries(at, actor, dataset, op, payload, before, after):
+    """Audit log rows of one queued write; a write that can't be diffed gets one row saying why"""
+    try:
+        return [
+            (at, actor, dataset, op, entity, json.dumps(old), json.dumps(new))
+            for entity, old, new in audit_changes(dataset, op, payload, before, after)
+        ]
+    except Exception as e:
+        return [(at, actor, dataset, op, "", json.dumps(None), json.dumps({"audit error": f"{type(e).__name__}: {e}"}))]
+
+def flush_audit_log(queue):
+    """Diff all queued writes and append them to the audit log in one transaction; on failure keep them queued"""
+    with queue["lock"]:
+        batch = list(queue["pending"])
+    
+    if not batch:
+        return
+    
+    entries = [entry for record in batch for entry in audit_entries(*record)]
+    
+    try:
+        with closing(open_audit_log()) as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO audit (at, actor, dataset, op, entity, before, after) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    entries
+                )
+    except (sqlite3.Error, OSError):
+        return
+    
+    with queue["lock"]:
+        del queue["pending"][:len(batch)]
+
+def run_audit_flusher(queue):
+    """Flush the audit queue every few seconds for the lifetime of the process"""
+    while True:
+        time.sleep(AUDIT_FLUSH_SECONDS)
+        # Whatever goes wrong, the batch stays queued and the thread keeps going
+        try:
+            flush_audit_log(queue)
+        except Exception:
+            pass
+
+def recent_audit_entries(limit=100, entity=""):
+    """Most recent audit log entries, newest first, optionally for entities containing a search term"""
+    if USE_DATA_SERVICE:
+        return get_data_store()["service"].call("recent_audit_entries", limit, entity)
+    
+    with closing(open_audit_log()) as conn:
+        return pd.read_sql_query(
+            "SELECT at, actor, dataset, op, entity, before, after FROM audit "
+            "WHERE entity LIKE ? ORDER BY id DESC LIMIT ?",
+            conn,
+            params=(f"%{entity}%", limit)
+        )
+
+# =====================================================
+# BULK EMPLOYEE UPLOAD
+# =====================================================
+
+REQUIRED_EMPLOYEE_COLUMNS = ["employee_id", "full_name", "department", "position"]
+EMPLOYEE_DATE_COLUMNS = ["date_of_birth", "join_date"]
+EMPLOYEE_CHOICES = {
+    "gender": ["Male", "Female"],
+    "marital_status": ["Single", "Married", "Divorced", "Widowed"],
+    "status": ["Active", "Inactive"]
+}
+# Values for columns a new employee's upload row leaves out
+EMPLOYEE_DEFAULTS = {column: "" for column in EMPLOYEE_COLUMNS} | {column: 0.0 for column in RATE_COLUMNS} | {"status": "Active"}
+
+def read_employee_upload(file):
+    """Read an uploaded CSV or XLSX file of employees as text, with normalized column names"""
+    if file.name.lower().endswith((".xlsx", ".xls")):
+        upload = pd.read_excel(file, dtype=str)
+    else:
+        upload = pd.read_csv(file, dtype=str, keep_default_na=False)
+    
+    upload.columns = [str(column).strip().lower().replace(" ", "_") for column in upload.columns]
+    return upload.fillna("").apply(lambda column: column.str.strip())
+
+def validate_employee_upload(upload, df_emp):
+    """Check every upload row at once; returns (plan, problems)
+    
+    plan has one row per valid upload row with the full employee record, its Action
+    (Insert, Update or Unchanged) and the Changes an update makes. Columns the upload
+    leaves out keep their current values (or defaults for new employees).
+    """
+    missing = [column for column in REQUIRED_EMPLOYEE_COLUMNS if column not in upload.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    
+    columns = [column for column in EMPLOYEE_COLUMNS if column in upload.columns]
+    upload = upload[columns]
+    ids = upload["employee_id"]
+    
+    checks = [(upload[column] == "", f"{column} is required") for column in REQUIRED_EMPLOYEE_COLUMNS]
+    checks.append((ids.duplicated(keep=False) & (ids != ""), "employee_id appears more than once in the file"))
+    for column in EMPLOYEE_DATE_COLUMNS:
+        if column in columns:
+            parsed = pd.to_datetime(upload[column], format="%Y-%m-%d", errors="coerce")
+            checks.append((parsed.isna() & (upload[column] != ""), f"{column} must be a YYYY-MM-DD date"))
+    for column in RATE_COLUMNS:
+        if column in columns:
+            amounts = pd.to_numeric(upload[column].where(upload[column] != "", "0"), errors="coerce")
+            checks.append((~(amounts >= 0), f"{column} must be a number of at least 0"))
+    for column, choices in EMPLOYEE_CHOICES.items():
+        if column in columns:
+            checks.append((~upload[column].isin(choices + [""]), f"{column} must be one of {', '.join(choices)}"))
+    
+    problems = pd.concat(
+        [pd.DataFrame({"Row": upload.index[mask] + 2, "Employee ID": ids[mask], "Problem": message})
+         for mask, message in checks if mask.any()] or [pd.DataFrame(columns=["Row", "Employee ID", "Problem"])],
+        ignore_index=True
+    ).sort_values("Row", kind="stable", ignore_index=True)
+    
+    valid = upload[~upload.index.isin(problems["Row"] - 2)].set_index("employee_id", drop=False)
+    
+    current = df_emp.reindex(columns=EMPLOYEE_COLUMNS).astype(object)
+    current = current.assign(employee_id=current["employee_id"].astype(str)).drop_duplicates("employee_id", keep="last")
+    current = current.set_index("employee_id", drop=False).reindex(valid.index)
+    is_new = current["employee_id"].isna()
+    
+    records = current.fillna(EMPLOYEE_DEFAULTS).astype(object)
+    records.update(valid.where(valid != "", records[columns]))
+    records["employee_id"] = valid["employee_id"]
+    for column in RATE_COLUMNS:
+        records[column] = pd.to_numeric(records[column], errors="coerce").fillna(0.0)
+    
+    # Changed columns of existing employees; numbers compare by value so 100 equals "100.0"
+    changed = pd.DataFrame({
+        column: ~((current[column].astype(str) == records[column].astype(str)) |
+                  (pd.to_numeric(current[column], errors="coerce") == pd.to_numeric(records[column], errors="coerce")))
+        for column in EMPLOYEE_COLUMNS[1:]
+    })
+    changed.loc[is_new] = False
+    
+    plan = records.reset_index(drop=True)
+    plan["Action"] = "Unchanged"
+    plan.loc[changed.any(axis=1).to_numpy(), "Action"] = "Update"
+    plan.loc[is_new.to_numpy(), "Action"] = "Insert"
+    plan["Changes"] = [
+        "; ".join(f"{column}: {current.at[employee_id, column]} → {records.at[employee_id, column]}" for column in row.index[row])
+        for employee_id, row in changed.iterrows()
+    ] if not changed.empty else []
+    plan["Rate Changed"] = changed[RATE_COLUMNS].any(axis=1).to_numpy()
+    return plan, problems
+
+def employee_upload_writes(plan, df_emp, history, rates_effective):
+    """Journal payloads for an upload plan: one employee upsert and one rate history append"""
+    pending = plan[plan["Action"] != "Unchanged"]
+    rows = [
+        [str(value) if column not in RATE_COLUMNS else float(value) for column, value in zip(EMPLOYEE_COLUMNS, record)]
+        for record in pending[EMPLOYEE_COLUMNS].itertuples(index=False)
+    ]
+    
+    rate_rows = [
+        [str(record["employee_id"]), str(record["join_date"])] + [float(record[column]) for column in RATE_COLUMNS]
+        for _, record in pending[pending["Action"] == "Insert"].iterrows()
+    ]
+    previous = df_emp.assign(employee_id=df_emp["employee_id"].astype(str)).drop_duplicates("employee_id", keep="last")
+    previous = previous.set_index("employee_id", drop=False)
+    for _, record in pending[(pending["Action"] == "Update") & pending["Rate Changed"]].iterrows():
+        rate_rows.extend(rate_history_rows(
+            history, previous.loc[record["employee_id"]], rates_effective, [record[column] for column in RATE_COLUMNS]
+        ))
+    return {"rows": rows}, {"rows": rate_rows}
+
+# =====================================================
+# STAFF CHECK-IN QUEUE
+# =====================================================
+
+CHECKIN_FLUSH_SECONDS = 5
+
+@st.cache_resource
+def get_checkin_queue():
+    """Process-wide buffer of staff check-ins, flushed to the attendance sheet in batches"""
+    queue = {
+        "pending": {},
+        "lock": threading.Lock()
+    }
+    threading.Thread(target=run_checkin_flusher, args=(queue, get_data_store()), daemon=True).start()
+    return queue
+
+def queue_checkin(employee_id, day):
+    """Buffer a check-in; repeated taps for the same employee and day collapse into one"""
+    queue = get_checkin_queue()
+    with queue["lock"]:
+        queue["pending"][(str(employee_id), str(day))] = "Present"
+
+def is_checked_in(employee_id, day):
+    """True if the check-in is still waiting in the queue"""
+    queue = get_checkin_queue()
+    with queue["lock"]:
+        return (str(employee_id), str(day)) in queue["pending"]
+
+def flush_checkins(queue, store):
+    """Journal buffered check-ins as insert-only attendance writes; whatever isn't journaled stays queued
+    
+    Each employee's check-ins are one write with the employee as its actor, so the audit log
+    shows who checked in; the journal still sends consecutive check-ins to Sheets together.
+    """
+    with queue["lock"]:
+        batch = dict(queue["pending"])
+    
+    by_employee = {}
+    for (emp_id, day), status in batch.items():
+        by_employee.setdefault(emp_id, []).append([emp_id, day, status])
+    
+    for emp_id, changes in by_employee.items():
+        try:
+            submit_write(store, "attendance", "upsert", {"changes": changes, "overwrite": False}, actor=emp_id)
+        except (sqlite3.Error, OSError):
+            return
+        
+        with queue["lock"]:
+            for _, day, _ in changes:
+                queue["pending"].pop((emp_id, day), None)
+
+def run_checkin_flusher(queue, store):
+    """Flush buffered check-ins every few seconds for the lifetime of the process"""
+    while True:
+        time.sleep(CHECKIN_FLUSH_SECONDS)
+        flush_checkins(queue, store)
+
+# =====================================================
+# BACKGROUND COMPUTATION
+# =====================================================
+
+COMPUTE_WORKERS = int(os.environ.get("HR_COMPUTE_WORKERS", 4))
+COMPUTE_JOBS_KEPT = 64
+
+@st.cache_resource
+def get_compute_pool():
+    """Process-wide worker pool for heavy computations, with the jobs it has run by key"""
+    from collections import OrderedDict
+    
+    return {
+        "executor": ThreadPoolExecutor(max_workers=COMPUTE_WORKERS, thread_name_prefix="hr-compute"),
+        "jobs": OrderedDict(),
+        "lock": threading.Lock()
+    }
+
+def dataset_versions(*datasets):
+    """Current versions of the given datasets, for keying results computed from them"""
+    store = get_data_store()
+    with store["lock"]:
+        return tuple(store["versions"][name] for name in datasets)
+
+def submit_job(key, fn, *args):
+    """Future of fn(*args) run in the pool, shared by every caller using the same key
+    
+    A job that is running or finished is reused instead of started again, so a double
+    click or a second admin opening the same report gets the same (possibly ready) result.
+    Keys should include the versions of the data the job reads. Failed jobs are retried.
+    """
+    pool = get_compute_pool()
+    
+    with pool["lock"]:
+        future = pool["jobs"].get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            future = pool["executor"].submit(fn, *args)
+            pool["jobs"][key] = future
+        pool["jobs"].move_to_end(key)
+        
+        # Forget the oldest finished jobs; running ones are kept so they stay deduplicated
+        for old_key in list(pool["jobs"]):
+            if len(pool["jobs"]) <= COMPUTE_JOBS_KEPT:
+                break
+            if pool["jobs"][old_key].done():
+                del pool["jobs"][old_key]
+    
+    return future
+
+def payroll_range_report(months, department):
+    """(payroll, per-employee summary, export sheets) of the current data for a month range, optionally one department"""
+    range_payroll = get_store_payroll(months)
+    if department != "All":
+        range_payroll = range_payroll[range_payroll["Department"] == department].reset_index(drop=True)
+    range_summary = summarize_payroll_range(range_payroll, months)
+    
+    sheets = {"Summary": range_summary}
+    for month, month_df in range_payroll.groupby("Month", sort=False):
+        sheets[month] = month_df[PAYROLL_COLUMNS + ["Total Salary"]]
+    return range_payroll, range_summary, sheets
+
+def workbook_bytes(sheets):
+    """build_payroll_workbook as bytes, safe to share between sessions"""
+    return build_payroll_workbook(sheets).getvalue()
+
+# =====================================================
+# DIRECTORY QUERIES
+# =====================================================
+
+DIRECTORY_CACHE_MB = float(os.environ.get("HR_DIRECTORY_CACHE_MB", 32))
+
+@st.cache_resource
+def get_directory_cache():
+    """Process-wide LRU of Directory search results, bounded by the memory they hold"""
+    from collections import OrderedDict
+    
+    return {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+
+def filter_employees(df_emp, search_term, department, status):
+    """(filtered employees, "ID - Name" options) for a Directory search and filters"""
+    filtered = df_emp
+    
+    if search_term:
+        filtered = filtered[
+            (filtered["full_name"].str.contains(search_term, case=False, na=False, regex=False)) |
+            (filtered["employee_id"].astype(str).str.contains(search_term, na=False, regex=False))
+        ]
+    
+    if department != "All":
+        filtered = filtered[filtered["department"] == department]
+    
+    if status != "All":
+        filtered = filtered[filtered["status"] == status]
+    
+    options = (filtered["employee_id"].astype(str) + " - " + filtered["full_name"].astype(str)).tolist()
+    return filtered, options
+
+def directory_query(search_term, department, status):
+    """filter_employees on the current employees, cached across sessions by data version and query
+    
+    After a write, a cached result for the same query is brought up to date by re-filtering
+    only the employees the change feed lists, instead of searching every row again.
+    """
+    store = get_data_store()
+    with store["lock"]:
+        df_emp = store["frames"]["employees"]
+        key = (store["versions"]["employees"], search_term, department, status)
+    
+    cache = get_directory_cache()
+    with cache["lock"]:
+        if key in cache["entries"]:
+            cache["entries"].move_to_end(key)
+            return cache["entries"][key][0]
+        # The same query on an older version can be patched with the rows that changed since
+        previous = max(
+            ((cached_key[0], entry[0]) for cached_key, entry in cache["entries"].items() if cached_key[1:] == key[1:]),
+            default=None,
+            key=lambda item: item[0]
+        )
+    
+    changed = changes_since("employees", previous[0]) if previous is not None else None
+    
+    if changed is not None and (search_term or department != "All" or status != "All"):
+        ids = df_emp["employee_id"].astype(str)
+        still_matching = set(previous[1][0]["employee_id"].astype(str)) - changed
+        now_matching = set(filter_employees(df_emp[ids.isin(changed)], search_term, department, status)[0]["employee_id"].astype(str))
+        filtered = df_emp[ids.isin(still_matching | now_matching)]
+        result = (filtered, (filtered["employee_id"].astype(str) + " - " + filtered["full_name"].astype(str)).tolist())
+    else:
+        result = filter_employees(df_emp, search_term, department, status)
+    # An unfiltered result is the store's own frame, so only its options take extra memory
+    size = sum(sys.getsizeof(option) for option in result[1])
+    if result[0] is not df_emp:
+        size += int(result[0].memory_usage(deep=True).sum())
+    
+    with cache["lock"]:
+        if key not in cache["entries"]:
+            cache["entries"][key] = (result, size)
+            cache["bytes"] += size
+        # Least recently used results go first, and results for older data versions with them
+        while cache["bytes"] > DIRECTORY_CACHE_MB * 1024 * 1024 and len(cache["entries"]) > 1:
+            cache["bytes"] -= cache["entries"].popitem(last=False)[1][1]
+    return result
+
+# =====================================================
+# SESSION REGISTRY
+# =====================================================
+
+SESSION_IDLE_SECONDS = float(os.environ.get("HR_SESSION_IDLE_MINUTES", 30)) * 60
+# Set HR_PERSIST_SESSIONS to keep sign-ins across server restarts. Behind a data service
+# sessions are always persisted, in the HR_LOCAL_DATA_DIR the workers share, so a session
+# resumes on whichever worker the browser reconnects to.
+PERSIST_SESSIONS = bool(os.environ.get("HR_PERSIST_SESSIONS") or os.environ.get("HR_DATA_SERVICE"))
+SESSIONS_PATH = LOCAL_DATA_DIR / "sessions.sqlite"
+SESSION_TOUCH_SECONDS = 60
+SESSION_RESULTS_KEPT = 8
+# Browser cookie holding the session token, so a reconnect resumes the session without
+# the token ever appearing in the URL
+SESSION_COOKIE = "hr_session"
+SESSION_COOKIE_ENDPOINT = "/session-cookie"
+# Served through asgi.py, the cookie is set HttpOnly by the server: the page only gets a
+# single-use ticket that its script trades for the cookie, never the token itself
+HTTPONLY_SESSION_COOKIE = bool(os.environ.get("HR_HTTPONLY_COOKIE"))
+COOKIE_TICKET_SECONDS = 60
+# Under plain `streamlit run` the page script has to write the cookie, so it can't be
+# HttpOnly; it is then kept only this long and renewed while the session is in use
+SCRIPT_COOKIE_SECONDS = 10 * 60
+
+@st.cache_resource
+def get_login_sessions():
+    """Process-wide registry of signed-in sessions by token, independent of the browser connection"""
+    return {"sessions": {}, "tickets": {}, "lock": threading.Lock()}
+
+def open_sessions_db():
+    """Open the persisted sessions database, creating it on first use"""
+    LOCAL_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(SESSIONS_PATH, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, principal TEXT, last_seen REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS cookie_tickets (ticket TEXT PRIMARY KEY, token TEXT, expires REAL)")
+    return conn
+
+def make_principal(username, role):
+    """The signed-in user with their permissions, derived once at sign-in"""
+    role_key = str(role).lower()
+    return {
+        "username": str(username),
+        "role": str(role),
+        # Staff and Department Heads sign in with their employee ID
+        "employee_id": str(username) if role_key in ("staff", "head") else None,
+        "is_admin": role_key == "admin",
+        "is_staff": role_key == "staff",
+        "is_head": role_key == "head"
+    }
+
+def new_session(principal, now):
+    """Registry entry: the principal, the data slice it works from and its page results"""
+    return {
+        "principal": principal,
+        "slice": principal["employee_id"],
+        "results": {},
+        "last_seen": now,
+        "persisted_at": now
+    }
+
+def open_session(principal):
+    """Register a signed-in principal and return the token that resumes its session"""
+    token = secrets.token_urlsafe(24)
+    now = time.time()
+    
+    registry = get_login_sessions()
+    with registry["lock"]:
+        registry["sessions"][token] = new_session(principal, now)
+    
+    if PERSIST_SESSIONS:
+        with closing(open_sessions_db()) as conn:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (token, json.dumps(principal), now))
+    return token
+
+def resume_session(token):
+    """The live session for a token, or None once it is unknown or has been idle too long"""
+    if not token:
+        return None
+    
+    now = time.time()
+    registry = get_login_sessions()
+    with registry["lock"]:
+        for idle_token in [t for t, entry in registry["sessions"].items() if now - entry["last_seen"] > SESSION_IDLE_SECONDS]:
+            del registry["sessions"][idle_token]
+        
+        session = registry["sessions"].get(token)
+        if session is not None:
+            session["last_seen"] = now
+            if not PERSIST_SESSIONS or now - session["persisted_at"] < SESSION_TOUCH_SECONDS:
+                return session
+            session["persisted_at"] = now
+    
+    if not PERSIST_SESSIONS:
+        return None
+    
+    # Persisted sessions outlive the process; their last activity is written at most once a minute
+    with closing(open_sessions_db()) as conn:
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - SESSION_IDLE_SECONDS,))
+            row = conn.execute("SELECT principal FROM sessions WHERE token = ?", (token,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE sessions SET last_seen = ? WHERE token = ?", (now, token))
+    
+    if row is None:
+        with registry["lock"]:
+            registry["sessions"].pop(token, None)
+        return None
+    
+    with registry["lock"]:
+        return registry["sessions"].setdefault(token, new_session(json.loads(row[0]), now))
+
+def end_session(token):
+    """Forget a session, e.g. on sign-out"""
+    registry = get_login_sessions()
+    with registry["lock"]:
+        registry["sessions"].pop(token, None)
+    
+    if PERSIST_SESSIONS:
+        with closing(open_sessions_db()) as conn:
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+def issue_cookie_ticket(token):
+    """Single-use ticket the browser trades for the HttpOnly session cookie (see asgi.py)"""
+    ticket = secrets.token_urlsafe(24)
+    expires = time.time() + COOKIE_TICKET_SECONDS
+    
+    registry = get_login_sessions()
+    with registry["lock"]:
+        registry["tickets"][ticket] = (token, expires)
+    
+    # Persisted like the sessions, so the ticket works on whichever worker the browser reaches
+    if PERSIST_SESSIONS:
+        with closing(open_sessions_db()) as conn:
+            with conn:
+                conn.execute("INSERT INTO cookie_tickets VALUES (?, ?, ?)", (ticket, token, expires))
+    return ticket
+
+def redeem_cookie_ticket(ticket):
+    """The session token a ticket was issued for, or None once it was used, expired or its session ended"""
+    now = time.time()
+    registry = get_login_sessions()
+    with registry["lock"]:
+        entry = registry["tickets"].pop(ticket, None)
+        for stale in [t for t, (_, expires) in registry["tickets"].items() if expires < now]:
+            del registry["tickets"][stale]
+    
+    if PERSIST_SESSIONS:
+        with closing(open_sessions_db()) as conn:
+            with conn:
+                row = conn.execute("SELECT token, expires FROM cookie_tickets WHERE ticket = ?", (ticket,)).fetchone()
+                conn.execute("DELETE FROM cookie_tickets WHERE ticket = ? OR expires < ?", (ticket, now))
+        # The database is what every worker shares, so only it says whether the ticket is unused
+        entry = row
+    
+    if entry is None or entry[1] < now or resume_session(entry[0]) is None:
+        return None
+    return entry[0]
+
+def session_result(session, key, build, *args):
+    """build(*args) computed once per session and key; keys should include the data versions used"""
+    registry = get_login_sessions()
+    with registry["lock"]:
+        if key in session["results"]:
+            return session["results"][key]
+    
+    value = build(*args)
+    with registry["lock"]:
+        session["results"][key] = value
+        # Only the most recent page results are kept
+        for stale_key in list(session["results"])[:-SESSION_RESULTS_KEPT]:
+            del session["results"][stale_key]
+    return value
+
+# =====================================================
+# DATA SERVICE CLIENT
+# =====================================================
+
+# With HR_DATA_SERVICE=host:port set, this process follows the store of a data service
+# (data_service.py) instead of reading Google Sheets and running its own journal, so
+# several Streamlit workers share one Sheets sync, one journal and one payroll cache.
+# After the first pull a worker receives only the rows the change feed lists as changed.
+USE_DATA_SERVICE = bool(os.environ.get("HR_DATA_SERVICE"))
+SERVICE_POLL_SECONDS = 2
+
+def data_service_address():
+    """(host, port) the data service listens on; loopback only unless HR_DATA_SERVICE_ALLOW_REMOTE is set"""
+    import ipaddress
+    
+    host, port = os.environ["HR_DATA_SERVICE"].rsplit(":", 1)
+    try:
+        loopback = host == "localhost" or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    # The service unpickles what it receives, so it must not be reachable from other hosts by accident
+    if not loopback and not os.environ.get("HR_DATA_SERVICE_ALLOW_REMOTE"):
+        raise RuntimeError(
+            f"HR_DATA_SERVICE host {host} is not a loopback address; set HR_DATA_SERVICE_ALLOW_REMOTE=1 to allow it"
+        )
+    return host, int(port)
+
+def data_service_key():
+    """Shared secret workers authenticate to the data service with (HR_DATA_SERVICE_KEY, required)"""
+    key = os.environ.get("HR_DATA_SERVICE_KEY")
+    if not key:
+        raise RuntimeError("HR_DATA_SERVICE_KEY must be set to a shared secret to use the data service")
+    return key.encode("utf-8")
+
+class DataServiceClient:
+    """Calls into the data service, over one connection per calling thread"""
+    
+    def __init__(self):
+        self.local = threading.local()
+    
+    def call(self, method, *args):
+        """Run a data service method; raises ConnectionError if the service is unreachable"""
+        from multiprocessing.connection import Client
+        
+        for attempt in range(2):
+            try:
+                if getattr(self.local, "conn", None) is None:
+                    self.local.conn = Client(data_service_address(), authkey=data_service_key())
+                self.local.conn.send((method, args))
+                status, value = self.local.conn.recv()
+                break
+            except (OSError, EOFError) as e:
+                self.local.conn = None
+                # A dropped connection is reopened once, e.g. after the service restarted
+                if attempt:
+                    raise ConnectionError(f"Data service unreachable: {e}") from e
+        
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+def store_entity_keys(store, dataset):
+    """entity_keys of a store frame, computed once per dataset version; caller holds the lock"""
+    cached = store["derived"].get(("entity_keys", dataset))
+    if cached is None or cached[0] != store["versions"][dataset]:
+        cached = (store["versions"][dataset], entity_keys(store["frames"][dataset], dataset))
+        store["derived"][("entity_keys", dataset)] = cached
+    return cached[1]
+
+def dataset_delta(store, dataset, known_version):
+    """What a worker holding known_version of a dataset needs to catch up; caller holds the lock
+    
+    When the change feed covers every version since known_version, that is just the rows
+    of the changed keys and their positions; otherwise the whole frame.
+    """
+    import numpy as np
+    
+    version = store["versions"][dataset]
+    frame = store["frames"][dataset]
+    feed = [entry for entry in store["changes"][dataset] if entry[0] > known_version]
+    delta = {"version": version, "feed": feed}
+    
+    complete = [entry[0] for entry in feed] == list(range(known_version + 1, version + 1))
+    if not known_version or not complete or dataset not in ENTITY_KEYS or frame.empty or any(keys is None for _, keys in feed):
+        return {**delta, "frame": frame}
+    
+    keys = set().union(*(keys for _, keys in feed))
+    positions = np.flatnonzero(store_entity_keys(store, dataset).isin(keys).to_numpy())
+    return {**delta, "keys": keys, "positions": positions, "rows": frame.take(positions), "length": len(frame), "columns": list(frame.columns)}
+
+def patch_frame(frame, keys, delta):
+    """(frame, entity keys) with a dataset_delta applied, or None if the delta doesn't fit the frame"""
+    import numpy as np
+    
+    kept = ~keys.isin(delta["keys"]).to_numpy()
+    n_kept = int(kept.sum())
+    if list(frame.columns) != delta["columns"] or n_kept + len(delta["rows"]) != delta["length"]:
+        return None
+    
+    # Unchanged rows keep their relative order; changed rows go back where the service has them
+    order = np.empty(delta["length"], dtype=np.int64)
+    unchanged_slots = np.ones(delta["length"], dtype=bool)
+    unchanged_slots[delta["positions"]] = False
+    order[unchanged_slots] = np.arange(n_kept)
+    order[delta["positions"]] = n_kept + np.arange(len(delta["rows"]))
+    
+    patched = pd.concat([frame[kept], delta["rows"]], ignore_index=True).take(order).reset_index(drop=True)
+    patched_keys = pd.concat([keys[kept], entity_keys(delta["rows"], delta["dataset"])], ignore_index=True).take(order).reset_index(drop=True)
+    return patched, patched_keys
+
+def pull_from_service(store):
+    """Bring the store up to date with the data service, fetching only the rows that changed where it can"""
+    with store["lock"]:
+        known_versions = dict(store["versions"])
+    
+    try:
+        changes = store["service"].call("changes", known_versions)
+        
+        with store["lock"]:
+            patched = {}
+            for name, delta in changes["datasets"].items():
+                if "frame" not in delta and store["versions"][name] == known_versions[name]:
+                    patched[name] = patch_frame(store["frames"][name], store_entity_keys(store, name), {**delta, "dataset": name})
+        
+        # A delta that doesn't fit (the local copy drifted) is replaced by the whole dataset
+        refetch = {name: 0 for name, result in patched.items() if result is None}
+        if refetch:
+            changes["datasets"].update(store["service"].call("changes", refetch)["datasets"])
+    except ConnectionError as e:
+        with store["lock"]:
+            store["offline"] = True
+            store["error"] = e
+        return False
+    
+    with store["lock"]:
+        for name, delta in changes["datasets"].items():
+            if store["versions"][name] != known_versions[name]:
+                # Another thread pulled this dataset meanwhile
+                continue
+            feed = delta["feed"]
+            # A gap in the service's feed (or a first pull) means the whole dataset may have changed
+            if [entry[0] for entry in feed] != list(range(store["versions"][name] + 1, delta["version"] + 1)):
+                feed = [(delta["version"], None)]
+            if patched.get(name) is not None and "frame" not in delta:
+                store["frames"][name], keys = patched[name]
+                store["derived"][("entity_keys", name)] = (delta["version"], keys)
+            else:
+                store["frames"][name] = delta["frame"]
+            store["versions"][name] = delta["version"]
+            store["changes"][name].extend(feed)
+        store["synced_at"] = changes["synced_at"]
+        store["offline"] = changes["offline"]
+        store["error"] = changes["error"]
+    return True
+
+def run_service_poll(store):
+    """Keep the store in step with the data service for the lifetime of the process"""
+    while True:
+        time.sleep(SERVICE_POLL_SECONDS)
+        pull_from_service(store)
@@ -0,0 +1,155 @@
+"""CSV-backed stand-in for the gspread calls the app makes
+
+Set HR_SHEETS_STANDIN to a directory holding one <worksheet>.csv per worksheet (first
+row is the header) to run the app or the data service without Google Sheets, e.g. to
+try a multi-process deployment locally.
+"""
+import csv
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol, numericise_all
+
+# Every read-modify-write of a CSV file happens under this lock
+_lock = threading.RLock()
+
+class LocalWorksheet:
+    """One worksheet stored as a CSV file"""
+
+    def __init__(self, spreadsheet, path):
+        self.spreadsheet = spreadsheet
+        self.path = path
+        self.title = path.stem
+        # Stable across processes and unaffected by worksheets added later
+        self.id = zlib.crc32(self.title.encode("utf-8"))
+
+    def _read(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return [row for row in csv.reader(f)]
+
+    def _write(self, rows):
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(rows)
+        os.replace(temp_path, self.path)
+
+    def _set_cells(self, rows, range_name, values):
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        for row_offset, row_values in enumerate(values):
+            while len(rows) < row + row_offset:
+                rows.append([])
+            target = rows[row + row_offset - 1]
+            for col_offset, value in enumerate(row_values):
+                while len(target) < col + col_offset:
+                    target.append("")
+                target[col + col_offset - 1] = str(value)
+
+    def get_all_values(self):
+        with _lock:
+            return self._read()
+
+    def get_all_records(self):
+        rows = self.get_all_values()
+        if not rows:
+            return []
+        header = rows[0]
+        return [
+            dict(zip(header, numericise_all(row + [""] * (len(header) - len(row)), empty2zero=False, default_blank="")))
+            for row in rows[1:]
+        ]
+
+    def row_values(self, row):
+        rows = self.get_all_values()
+        return rows[row - 1] if len(rows) >= row else []
+
+    def col_values(self, col):
+        return [row[col - 1] if len(row) >= col else "" for row in self.get_all_values()]
+
+    def batch_get(self, ranges):
+        """Values of A1 ranges such as "B2:B" or "A1:R1", trimmed like the Sheets API does"""
+        rows = self.get_all_values()
+        results = []
+        for range_name in ranges:
+            start, _, end = range_name.partition(":")
+            first_row, first_col = a1_to_rowcol(start)
+            end_col = re.match(r"[A-Z]+", end or start).group(0)
+            last_col = a1_to_rowcol(f"{end_col}1")[1]
+            end_row = re.search(r"\d+", end or start)
+            last_row = int(end_row.group(0)) if end_row else len(rows)
+
+            values = []
+            for row in rows[first_row - 1:last_row]:
+                cells = row[first_col - 1:last_col]
+                while cells and cells[-1] == "":
+                    cells.pop()
+                values.append(cells)
+            while values and not values[-1]:
+                values.pop()
+            results.append(values)
+        return results
+
+    def update(self, range_name, values):
+        with _lock:
+            rows = self._read()
+            self._set_cells(rows, range_name, values)
+            self._write(rows)
+
+    def batch_update(self, data):
+        with _lock:
+            rows = self._read()
+            for item in data:
+                self._set_cells(rows, item["range"], item["values"])
+            self._write(rows)
+
+    def append_row(self, values):
+        self.append_rows([values])
+
+    def append_rows(self, values):
+        with _lock:
+            rows = self._read()
+            rows.extend([str(value) for value in row] for row in values)
+            self._write(rows)
+
+    def delete_rows(self, start_index, end_index=None):
+        with _lock:
+            rows = self._read()
+            del rows[start_index - 1:end_index or start_index]
+            self._write(rows)
+
+class LocalSpreadsheet:
+    """A directory of CSV worksheets"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def worksheets(self):
+        with _lock:
+            paths = sorted(self.directory.glob("*.csv"))
+        return [LocalWorksheet(self, path) for path in paths]
+
+    def worksheet(self, title):
+        for ws in self.worksheets():
+            if ws.title == title:
+                return ws
+        raise WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        with _lock:
+            (self.directory / f"{title}.csv").touch()
+        return self.worksheet(title)
+
+    def batch_update(self, body):
+        """Apply deleteDimension row requests, the only kind the app sends"""
+        by_id = {ws.id: ws for ws in self.worksheets()}
+        with _lock:
+            for request in body.get("requests", []):
+                target = request["deleteDimension"]["range"]
+                ws = by_id[target["sheetId"]]
+                rows = ws._read()
+                del rows[target["startIndex"]:target["endIndex"]]
+                ws._write(rows)
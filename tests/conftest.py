@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import threading
+from collections import deque
+from pathlib import Path
+
+import pytest
+
+# Nothing a test does may touch the repo's own local_data
+os.environ.setdefault("HR_LOCAL_DATA_DIR", tempfile.mkdtemp(prefix="hr_tests_"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import hr_data
+
+hr_data.import_data_stack()
+
+@pytest.fixture
+def local_data(tmp_path, monkeypatch):
+    """A fresh local data directory (journal, audit log, archive, snapshot, sessions) per test"""
+    monkeypatch.setattr(hr_data, "LOCAL_DATA_DIR", tmp_path)
+    monkeypatch.setattr(hr_data, "SNAPSHOT_PATH", tmp_path / "snapshot.sqlite")
+    monkeypatch.setattr(hr_data, "ARCHIVE_DIR", tmp_path / "attendance_archive")
+    monkeypatch.setattr(hr_data, "JOURNAL_PATH", tmp_path / "journal.sqlite")
+    monkeypatch.setattr(hr_data, "AUDIT_PATH", tmp_path / "audit.sqlite")
+    monkeypatch.setattr(hr_data, "SESSIONS_PATH", tmp_path / "sessions.sqlite")
+    return tmp_path
+
+@pytest.fixture
+def sheets(tmp_path):
+    """Worksheets by name, backed by CSV files (see local_sheets.py), each holding just its header"""
+    from local_sheets import LocalSpreadsheet
+
+    headers = {
+        "employees": hr_data.EMPLOYEE_COLUMNS,
+        "attendance": ["employee_id", "date", "status"],
+        "users": ["username", "password", "role"],
+        **hr_data.MANAGED_WORKSHEETS
+    }
+    spreadsheet = LocalSpreadsheet(tmp_path / "sheets")
+    for name in hr_data.WORKSHEET_NAMES:
+        spreadsheet.add_worksheet(name).append_row(headers[name])
+    return {ws.title: ws for ws in spreadsheet.worksheets()}
+
+@pytest.fixture
+def audit_queue(monkeypatch):
+    """The audit queue, without its background flusher so tests flush it themselves"""
+    queue = {"pending": [], "lock": threading.Lock()}
+    monkeypatch.setattr(hr_data, "get_audit_queue", lambda: queue)
+    return queue
+
+@pytest.fixture
+def make_store(local_data, audit_queue):
+    """Factory of empty in-memory data stores"""
+    def make_store():
+        return {
+            "frames": {name: hr_data.pd.DataFrame() for name in hr_data.WORKSHEET_NAMES},
+            "checksums": {},
+            "versions": {name: 0 for name in hr_data.WORKSHEET_NAMES},
+            "worksheets": None,
+            "synced_at": None,
+            "offline": False,
+            "error": None,
+            "derived": {},
+            "changes": {name: deque(maxlen=hr_data.CHANGE_FEED_LENGTH) for name in hr_data.WORKSHEET_NAMES},
+            "local_writes": set(),
+            "service": None,
+            "lock": threading.Lock()
+        }
+    return make_store
+
+@pytest.fixture
+def store(make_store, monkeypatch):
+    """An in-memory data store, used in place of the process-wide one"""
+    store = make_store()
+    monkeypatch.setattr(hr_data, "get_data_store", lambda: store)
+    return store
@@ -0,0 +1,110 @@
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+ROWS = [
+    ["101", "2026-01-05", "Present"],
+    ["102", "2026-01-05", "Absent"],
+    ["101", "2026-02-02", "Present"],
+    ["101", "2026-01-06", "Leave"],
+    ["102", "2026-02-02", "Present"]
+]
+
+@pytest.fixture
+def attendance_ws(local_data, sheets):
+    ws = sheets["attendance"]
+    ws.append_rows(ROWS)
+    return ws
+
+def insert_row(ws, position, row):
+    """Insert a row at a 1-based sheet position, as another writer sorting the sheet would"""
+    rows = ws.get_all_values()
+    rows.insert(position - 1, row)
+    ws._write(rows)
+
+def archived(months, employee_id=None):
+    frame = hr_data.read_archived_attendance(months, employee_id=employee_id)
+    return sorted(map(tuple, frame[["employee_id", "date", "status"]].to_numpy().tolist()))
+
+def test_archiving_moves_the_month_out_of_the_sheet(attendance_ws):
+    hr_data.archive_sheet_months(attendance_ws, ["2026-01"])
+
+    assert attendance_ws.get_all_values()[1:] == [ROWS[2], ROWS[4]]
+    assert hr_data.archived_months() == ["2026-01"]
+    assert archived(["2026-01"]) == sorted([tuple(ROWS[0]), tuple(ROWS[1]), tuple(ROWS[3])])
+    assert archived(["2026-01"], employee_id=102) == [tuple(ROWS[1])]
+
+def test_archiving_again_changes_nothing(attendance_ws):
+    hr_data.archive_sheet_months(attendance_ws, ["2026-01"])
+    hr_data.archive_sheet_months(attendance_ws, ["2026-01"])
+
+    assert attendance_ws.get_all_values()[1:] == [ROWS[2], ROWS[4]]
+    assert len(archived(["2026-01"])) == 3
+
+def test_rows_moved_before_the_delete_are_verified_and_kept(attendance_ws, monkeypatch):
+    batch_get = attendance_ws.batch_get
+    moved = []
+
+    def batch_get_after_insert(ranges):
+        # Another writer inserts a row above the archived ones between the read and the delete
+        if not moved:
+            insert_row(attendance_ws, 2, ["103", "2026-02-03", "Present"])
+            moved.append(True)
+        return batch_get(ranges)
+
+    monkeypatch.setattr(attendance_ws, "batch_get", batch_get_after_insert)
+
+    hr_data.archive_sheet_months(attendance_ws, ["2026-01"])
+
+    assert attendance_ws.get_all_values()[1:] == [["103", "2026-02-03", "Present"], ROWS[2], ROWS[4]]
+    assert len(archived(["2026-01"])) == 3
+
+def test_a_sheet_that_keeps_changing_is_left_alone(attendance_ws, monkeypatch):
+    batch_get = attendance_ws.batch_get
+
+    def batch_get_after_insert(ranges):
+        insert_row(attendance_ws, 2, ["103", "2026-02-03", "Present"])
+        return batch_get(ranges)
+
+    monkeypatch.setattr(attendance_ws, "batch_get", batch_get_after_insert)
+
+    with pytest.raises(RuntimeError):
+        hr_data.archive_sheet_months(attendance_ws, ["2026-01"])
+
+    remaining = attendance_ws.get_all_values()[1:]
+    assert all(row in remaining for row in ROWS)
+
+def test_partition_merge_replaces_rows_of_the_same_day(local_data):
+    hr_data.write_archive_partition("2026-01", pd.DataFrame(ROWS[:2], columns=["employee_id", "date", "status"]))
+    hr_data.write_archive_partition("2026-01", pd.DataFrame([["101", "2026-01-05", "Leave"]], columns=["employee_id", "date", "status"]))
+
+    assert archived(["2026-01"]) == [("101", "2026-01-05", "Leave"), ("102", "2026-01-05", "Absent")]
+
+def test_live_rows_override_archived_ones(local_data):
+    hr_data.write_archive_partition("2026-01", pd.DataFrame(ROWS[:2], columns=["employee_id", "date", "status"]))
+    live = pd.DataFrame([["101", "2026-01-05", "Leave"], ["101", "2026-02-02", "Present"]], columns=["employee_id", "date", "status"])
+
+    rows = hr_data.attendance_for_months(live, ["2026-01"])
+
+    assert sorted(map(tuple, rows[["employee_id", "date", "status"]].astype(str).to_numpy().tolist())) == [
+        ("101", "2026-01-05", "Leave"), ("102", "2026-01-05", "Absent")
+    ]
+
+def test_staff_see_only_their_own_archived_months(store):
+    hr_data.write_archive_partition("2026-01", pd.DataFrame(ROWS[:2], columns=["employee_id", "date", "status"]))
+    hr_data.write_archive_partition("2026-02", pd.DataFrame([ROWS[4]], columns=["employee_id", "date", "status"]))
+
+    assert hr_data.employee_archived_months(101) == ["2026-01"]
+    assert hr_data.employee_archived_months(102) == ["2026-01", "2026-02"]
+    assert hr_data.employee_archived_months(103) == []
+
+def test_journaled_archive_drops_the_months_from_the_store(store):
+    store["frames"]["attendance"] = pd.DataFrame(ROWS, columns=["employee_id", "date", "status"])
+
+    hr_data.submit_write(store, "attendance", "archive", {"months": ["2026-01"]}, "admin")
+
+    assert store["frames"]["attendance"]["date"].tolist() == ["2026-02-02", "2026-02-02"]
+    # Rows moved rather than changed, so cached views reload in full
+    assert hr_data.changes_since("attendance", 0) is None
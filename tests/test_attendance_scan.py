@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def employees():
+    return pd.DataFrame([
+        {"employee_id": 101, "full_name": "Alice", "join_date": "2020-01-06", "status": "Active"},
+        {"employee_id": 102, "full_name": "Bob", "join_date": "2026-03-02", "status": "Inactive"}
+    ])
+
+def issues_of(rows):
+    issues = hr_data.scan_attendance(pd.DataFrame(rows, columns=["employee_id", "date", "status"]), employees())
+    assert list(issues.columns) == hr_data.ATTENDANCE_ISSUE_COLUMNS
+    return sorted(zip(issues["Issue"], issues["Employee ID"], issues["Date"]))
+
+def test_clean_attendance_has_no_issues():
+    assert issues_of([[101, "2026-03-02", "Present"], [102, "2026-03-02", "Absent"]]) == []
+
+def test_empty_attendance_has_no_issues():
+    issues = hr_data.scan_attendance(pd.DataFrame(), employees())
+
+    assert issues.empty
+    assert list(issues.columns) == hr_data.ATTENDANCE_ISSUE_COLUMNS
+
+def test_duplicates_are_told_apart_from_conflicts():
+    issues = issues_of([
+        [101, "2026-03-02", "Present"], [101, "2026-03-02", "Present"],
+        [101, "2026-03-03", "Present"], [101, "2026-03-03", "Absent"]
+    ])
+
+    assert issues == [
+        ("Conflicting records", "101", "2026-03-03"), ("Conflicting records", "101", "2026-03-03"),
+        ("Duplicate record", "101", "2026-03-02"), ("Duplicate record", "101", "2026-03-02")
+    ]
+
+def test_row_level_issues():
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+
+    issues = issues_of([
+        [999, "2026-03-02", "Present"],
+        [102, "2026-03-03", "Present"],
+        [101, "2026-03-04", "Holiday"],
+        [101, "04/03/2026", "Present"],
+        [101, tomorrow, "Present"],
+        # Approved leave is recorded ahead
+        [101, (date.today() + timedelta(days=2)).isoformat(), "Leave"],
+        [102, "2026-02-27", "Absent"]
+    ])
+
+    assert issues == [
+        ("Before join date", "102", "2026-02-27"),
+        ("Future date", "101", tomorrow),
+        ("Inactive employee", "102", "2026-03-03"),
+        ("Invalid date", "101", "04/03/2026"),
+        ("Invalid status", "101", "2026-03-04"),
+        ("Unknown employee", "999", "2026-03-02")
+    ]
+
+@pytest.fixture
+def archived_scans(store, monkeypatch):
+    """Months read from the archive for a scan, with the store holding the employees and a clean sheet"""
+    store["frames"]["employees"] = employees()
+    store["frames"]["attendance"] = pd.DataFrame([[101, "2026-03-02", "Present"]], columns=["employee_id", "date", "status"])
+    reads = []
+    read_archived_attendance = hr_data.read_archived_attendance
+
+    def recording_read(months, *args, **kwargs):
+        # Merging into a partition reads it with columns=None; only whole-row reads are scans
+        if "columns" not in kwargs:
+            reads.extend(months)
+        return read_archived_attendance(months, *args, **kwargs)
+
+    monkeypatch.setattr(hr_data, "read_archived_attendance", recording_read)
+    return reads
+
+def archive(month, rows):
+    hr_data.write_archive_partition(month, pd.DataFrame(rows, columns=["employee_id", "date", "status"]))
+
+def issues_with_source():
+    issues = hr_data.get_attendance_issues()
+    return sorted(zip(issues["Issue"], issues["Employee ID"], issues["Source"]))
+
+def test_archived_months_are_scanned_too(archived_scans):
+    archive("2026-01", [["101", "2026-01-05", "Present"], ["999", "2026-01-05", "Present"]])
+    archive("2026-02", [["101", "2026-02-02", "Present"], ["101", "2026-02-02", "Absent"]])
+
+    assert issues_with_source() == [
+        ("Conflicting records", "101", "Archive 2026-02"), ("Conflicting records", "101", "Archive 2026-02"),
+        ("Unknown employee", "999", "Archive 2026-01")
+    ]
+
+def test_a_partition_is_rescanned_only_when_rewritten(archived_scans, store):
+    archive("2026-01", [["999", "2026-01-05", "Present"]])
+    archive("2026-02", [["101", "2026-02-02", "Present"]])
+    hr_data.get_attendance_issues()
+
+    # A check-in changes only the sheet
+    hr_data.submit_write(store, "attendance", "upsert", {"changes": [["101", "2026-03-03", "Present"]]}, "101")
+    hr_data.get_attendance_issues()
+    assert archived_scans == ["2026-01", "2026-02"]
+
+    archive("2026-02", [["999", "2026-02-03", "Present"]])
+    issues = issues_with_source()
+
+    assert archived_scans == ["2026-01", "2026-02", "2026-02"]
+    assert issues == [("Unknown employee", "999", "Archive 2026-01"), ("Unknown employee", "999", "Archive 2026-02")]
+
+def test_an_employee_change_rescans_the_archive(archived_scans, store):
+    archive("2026-01", [["999", "2026-01-05", "Present"]])
+    hr_data.get_attendance_issues()
+
+    with store["lock"]:
+        store["frames"]["employees"] = pd.concat([employees(), pd.DataFrame([
+            {"employee_id": 999, "full_name": "Zed", "join_date": "2020-01-06", "status": "Active"}
+        ])], ignore_index=True)
+        hr_data.record_change(store, "employees", {"999"})
+
+    assert hr_data.get_attendance_issues().empty
+    assert archived_scans == ["2026-01", "2026-01"]
@@ -0,0 +1,87 @@
+import json
+from contextlib import closing
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def audit_log():
+    with closing(hr_data.open_audit_log()) as conn:
+        return [
+            (actor, entity, json.loads(before), json.loads(after))
+            for actor, entity, before, after in conn.execute("SELECT actor, entity, before, after FROM audit ORDER BY id")
+        ]
+
+def attendance(*rows):
+    return pd.DataFrame(rows, columns=["employee_id", "date", "status"])
+
+@pytest.fixture
+def audit_queue(local_data, audit_queue):
+    """The audit queue, logging to this test's own audit database"""
+    return audit_queue
+
+def queue_write(actor, before, after, changes):
+    hr_data.audit_write(actor, "attendance", "upsert", {"changes": changes}, before, after)
+
+def test_only_changed_fields_are_logged(audit_queue):
+    before = attendance(["101", "2026-03-02", "Absent"])
+    queue_write("admin", before, attendance(["101", "2026-03-02", "Present"], ["102", "2026-03-02", "Present"]), [
+        ["101", "2026-03-02", "Present"], ["102", "2026-03-02", "Present"]
+    ])
+
+    hr_data.flush_audit_log(audit_queue)
+
+    assert audit_log() == [
+        ("admin", "101|2026-03-02", {"status": "Absent"}, {"status": "Present"}),
+        ("admin", "102|2026-03-02", None, {"employee_id": "102", "date": "2026-03-02", "status": "Present"})
+    ]
+    assert audit_queue["pending"] == []
+
+def test_a_write_that_cant_be_diffed_is_logged_and_dropped_alone(audit_queue):
+    queue_write("admin", attendance(), attendance(["101", "2026-03-02", "Present"]), [["101", "2026-03-02", "Present"]])
+    # A malformed change has no entity key
+    queue_write("102", attendance(), attendance(), [["102"]])
+    queue_write("103", attendance(), attendance(["103", "2026-03-02", "Present"]), [["103", "2026-03-02", "Present"]])
+
+    hr_data.flush_audit_log(audit_queue)
+
+    log = audit_log()
+    assert [(actor, entity) for actor, entity, _, _ in log] == [("admin", "101|2026-03-02"), ("102", ""), ("103", "103|2026-03-02")]
+    assert log[1][3]["audit error"].startswith("ValueError")
+    assert audit_queue["pending"] == []
+
+def test_a_failed_write_to_the_log_keeps_the_batch_queued(audit_queue, monkeypatch):
+    def locked():
+        raise hr_data.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(hr_data, "open_audit_log", locked)
+    queue_write("admin", attendance(), attendance(["101", "2026-03-02", "Present"]), [["101", "2026-03-02", "Present"]])
+
+    hr_data.flush_audit_log(audit_queue)
+
+    assert len(audit_queue["pending"]) == 1
+
+class Stop(BaseException):
+    pass
+
+def test_the_flusher_survives_an_unexpected_error(audit_queue, monkeypatch):
+    flushes = []
+
+    def flush(queue):
+        flushes.append(queue)
+        if len(flushes) == 1:
+            raise RuntimeError("unexpected")
+
+    def sleep(seconds):
+        if len(flushes) == 3:
+            raise Stop
+
+    monkeypatch.setattr(hr_data, "flush_audit_log", flush)
+    monkeypatch.setattr(hr_data.time, "sleep", sleep)
+
+    with pytest.raises(Stop):
+        hr_data.run_audit_flusher(audit_queue)
+
+    assert len(flushes) == 3
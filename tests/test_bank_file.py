@@ -0,0 +1,70 @@
+import hashlib
+from datetime import date
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def payroll(*rows):
+    return pd.DataFrame(rows, columns=["Employee ID", "Name", "Bank Account", "Total Salary"])
+
+PAYROLL = payroll(
+    [101, "Alice", 1234.0, 2540.5],
+    [102, "Bob", "", 1800.0],
+    [103, "Carol", "98765", 0.0],
+    [104, "Dan", "55501", -12.5],
+    [105, "Eve", "AB12", 1000.004]
+)
+
+def lines(payroll, file_format):
+    return hr_data.bank_transfer_file(payroll, "2026-02", date(2026, 3, 1), file_format).decode("utf-8").splitlines()
+
+def test_fixed_width_records_have_their_layout():
+    header, *details, trailer = lines(PAYROLL, "Fixed Width")
+
+    assert header == "HPAYROLL202602       20260301"
+    assert details == [
+        "D1234                000000000254050PAYROLL202602-101       Alice                              ",
+        "DAB12                000000000100000PAYROLL202602-105       Eve                                "
+    ]
+    assert all(len(line) == 1 + 20 + 15 + 24 + 35 for line in details)
+    digest = hashlib.sha256("".join(line + "\n" for line in details).encode("utf-8")).hexdigest()
+    # Count, total in cents, hash total of the account digits (1234 + 12) and the checksum
+    assert trailer == f"T{2:08d}{354050:018d}{1246:010d}{digest}"
+
+def test_csv_carries_the_same_records():
+    rows = lines(PAYROLL, "CSV")
+
+    assert rows[:2] == ["record_type,account_number,amount,reference,beneficiary_name", "H,PAYROLL202602,20260301,,"]
+    assert rows[2:4] == ["D,1234,2540.50,PAYROLL202602-101,Alice", "D,AB12,1000.00,PAYROLL202602-105,Eve"]
+    digest = hashlib.sha256("".join(line + "\n" for line in rows[2:4]).encode("utf-8")).hexdigest()
+    assert rows[4] == f"T,2,3540.50,1246,{digest}"
+
+def test_names_with_commas_are_quoted_in_csv():
+    rows = lines(payroll([101, "Smith, Jr", "1234", 10.0]), "CSV")
+
+    assert rows[2] == 'D,1234,10.00,PAYROLL202602-101,"Smith, Jr"'
+
+def test_excluded_rows_are_listed_with_the_reason():
+    assert hr_data.bank_transfer_exclusions(PAYROLL) == [
+        ("Bob", "no bank account"),
+        ("Carol", "net pay is 0.00"),
+        ("Dan", "net pay is -12.50")
+    ]
+
+def test_records_that_dont_fit_stop_the_file():
+    bad = payroll([101, "A" * 36, "1234", 10.0], [102, "Bob", "12-34", 10.0], [103, "Line\nbreak", "1", 10.0])
+
+    assert hr_data.bank_transfer_problems(bad, "2026-02") == [
+        ("A" * 36, "name is longer than 35 characters"),
+        ("Bob", "bank account has characters other than letters and digits"),
+        ("Line\nbreak", "name has line breaks or control characters")
+    ]
+    with pytest.raises(ValueError):
+        lines(bad, "Fixed Width")
+
+def test_rows_that_are_left_out_are_not_checked():
+    # Nothing is paid to this record, so its overlong name never reaches the file
+    assert hr_data.bank_transfer_problems(payroll([101, "A" * 36, "1234", 0.0]), "2026-02") == []
@@ -0,0 +1,99 @@
+import io
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def current_employees():
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update(employee_id=101, full_name="Alice", department="Sales", position="Clerk", join_date="2024-01-15",
+               gender="Female", status="Active", daily_rate_basic=100.0, daily_rate_transport=20.0,
+               daily_rate_meal=15.0, allowance_monthly=500.0)
+    return pd.DataFrame([row], columns=hr_data.EMPLOYEE_COLUMNS)
+
+def upload(text, name="employees.csv"):
+    file = io.BytesIO(text.encode("utf-8"))
+    file.name = name
+    return hr_data.read_employee_upload(file)
+
+def test_upload_columns_and_values_are_normalized():
+    frame = upload("Employee ID, Full Name ,Department,Position\n 101 ,Alice , Sales,Clerk\n")
+
+    assert list(frame.columns) == ["employee_id", "full_name", "department", "position"]
+    assert frame.iloc[0].tolist() == ["101", "Alice", "Sales", "Clerk"]
+
+def test_missing_required_columns_are_reported():
+    with pytest.raises(ValueError, match="position"):
+        hr_data.validate_employee_upload(upload("employee_id,full_name,department\n101,Alice,Sales\n"), current_employees())
+
+def test_every_problem_is_reported_with_its_sheet_row():
+    frame = upload(
+        "employee_id,full_name,department,position,join_date,daily_rate_basic,gender\n"
+        "102,Bob,Sales,Clerk,2026-02-30,80,Male\n"
+        "103,,Sales,Clerk,2026-03-01,-5,Other\n"
+        "104,Dan,Sales,Clerk,,,\n"
+        "104,Dan,Sales,Clerk,,,\n"
+        "105,Eve,Finance,Analyst,2026-03-01,abc,Female\n"
+        "106,Fay,Finance,Analyst,2026-03-01,90,Female\n"
+    )
+
+    plan, problems = hr_data.validate_employee_upload(frame, current_employees())
+
+    assert problems.values.tolist() == [
+        [2, "102", "join_date must be a YYYY-MM-DD date"],
+        [3, "103", "full_name is required"],
+        [3, "103", "daily_rate_basic must be a number of at least 0"],
+        [3, "103", "gender must be one of Male, Female"],
+        [4, "104", "employee_id appears more than once in the file"],
+        [5, "104", "employee_id appears more than once in the file"],
+        [6, "105", "daily_rate_basic must be a number of at least 0"]
+    ]
+    # Valid rows are still planned
+    assert plan["employee_id"].tolist() == ["106"]
+
+def test_plan_inserts_updates_and_leaves_unchanged_rows():
+    frame = upload(
+        "employee_id,full_name,department,position,daily_rate_basic\n"
+        "101,Alice,Sales,Clerk,100\n"
+        "107,Gus,Finance,Analyst,\n"
+    )
+    plan, problems = hr_data.validate_employee_upload(frame, current_employees())
+    assert problems.empty
+    assert plan["Action"].tolist() == ["Unchanged", "Insert"]
+    # A new employee gets defaults for the columns the upload leaves out
+    assert plan.loc[1, ["status", "daily_rate_basic", "address"]].tolist() == ["Active", 0.0, ""]
+
+    moved = upload("employee_id,full_name,department,position,daily_rate_basic\n101,Alice,Finance,Clerk,110\n")
+    plan, _ = hr_data.validate_employee_upload(moved, current_employees())
+
+    assert plan.loc[0, "Action"] == "Update"
+    assert plan.loc[0, "Changes"] == "department: Sales → Finance; daily_rate_basic: 100.0 → 110"
+    assert plan.loc[0, "Rate Changed"]
+    # Columns the upload leaves out keep their current values
+    assert plan.loc[0, ["join_date", "allowance_monthly"]].tolist() == ["2024-01-15", 500.0]
+
+def test_writes_cover_only_changed_employees_and_their_rates():
+    frame = upload(
+        "employee_id,full_name,department,position,join_date,daily_rate_basic\n"
+        "101,Alice,Sales,Clerk,,110\n"
+        "107,Gus,Finance,Analyst,2026-03-01,90\n"
+    )
+    plan, _ = hr_data.validate_employee_upload(frame, current_employees())
+
+    employees, rates = hr_data.employee_upload_writes(plan, current_employees(), pd.DataFrame(), "2026-03-01")
+
+    assert [row[0] for row in employees["rows"]] == ["101", "107"]
+    assert rates["rows"] == [
+        ["107", "2026-03-01", 90.0, 0.0, 0.0, 0.0],
+        # Alice had no history yet, so her old rates are seeded first
+        ["101", "1900-01-01", 100.0, 20.0, 15.0, 500.0],
+        ["101", "2026-03-01", 110.0, 20.0, 15.0, 500.0]
+    ]
+
+def test_unchanged_upload_writes_nothing():
+    frame = upload("employee_id,full_name,department,position\n101,Alice,Sales,Clerk\n")
+    plan, _ = hr_data.validate_employee_upload(frame, current_employees())
+
+    assert hr_data.employee_upload_writes(plan, current_employees(), pd.DataFrame(), "2026-03-01") == ({"rows": []}, {"rows": []})
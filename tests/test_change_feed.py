@@ -0,0 +1,93 @@
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def employee_row(employee_id, full_name):
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update(employee_id=employee_id, full_name=full_name, department="Sales", status="Active")
+    return [row[column] for column in hr_data.EMPLOYEE_COLUMNS]
+
+def leave_requests():
+    return pd.DataFrame([
+        ["LV1", 101, "Annual", "2026-03-02", "2026-03-03", 2, "", "Pending", "2026-02-20T09:00:00", "", ""],
+        ["LV2", 102, "Sick", "2026-03-04", "2026-03-04", 1, "", "Approved", "2026-02-20T09:00:00", "admin", "2026-02-21T10:00:00"]
+    ], columns=hr_data.MANAGED_WORKSHEETS["leave_requests"])
+
+WRITES = [
+    ("employees", pd.DataFrame([employee_row(101, "Alice"), employee_row(102, "Bob")], columns=hr_data.EMPLOYEE_COLUMNS), [
+        ("insert", {"row": employee_row(103, "Carol")}),
+        ("update", {"row": employee_row(102, "Robert")}),
+        ("delete", {"employee_id": 101}),
+        ("upsert", {"rows": [employee_row(101, "Alicia"), employee_row(104, "Dan")]})
+    ]),
+    ("attendance", pd.DataFrame([{"employee_id": 101, "date": "2026-03-02", "status": "Absent"}]), [
+        ("upsert", {"changes": [["101", "2026-03-02", "Present"], ["102", "2026-03-02", "Present"]]})
+    ]),
+    ("rate_history", pd.DataFrame([[101, "1900-01-01", 100.0, 20.0, 15.0, 500.0]], columns=hr_data.MANAGED_WORKSHEETS["rate_history"]), [
+        ("upsert", {"rows": [["101", "2026-03-01", 110.0, 20.0, 15.0, 500.0]]})
+    ]),
+    ("leave_requests", leave_requests(), [
+        ("decide", {"request_id": "LV1", "employee_id": "101", "status": "Rejected", "decided_by": "admin",
+                    "decided_at": "2026-02-22T08:00:00"}),
+        ("insert", {"row": ["LV3", "103", "Annual", "2026-04-01", "2026-04-01", "1", "", "Pending", "2026-03-20T09:00:00", "", ""]})
+    ])
+]
+
+@pytest.mark.parametrize("dataset, frame, op, payload", [
+    (dataset, frame, op, payload) for dataset, frame, writes in WRITES for op, payload in writes
+])
+def test_write_keys_match_the_rows_a_write_changes(dataset, frame, op, payload):
+    after = hr_data.apply_write(frame, dataset, op, payload)
+
+    assert hr_data.write_keys(dataset, op, payload) == hr_data.changed_keys(dataset, frame, after)
+
+def test_changed_keys_of_added_and_removed_rows():
+    before = pd.DataFrame({"employee_id": [101, 102, 103], "full_name": ["Alice", "Bob", "Carol"]})
+    after = pd.DataFrame({"employee_id": [101, 103, 104], "full_name": ["Alice", "Caroline", "Dan"]})
+
+    assert hr_data.changed_keys("employees", before, after) == {"102", "103", "104"}
+    assert hr_data.changed_keys("employees", before, before.copy()) == set()
+
+def test_changed_keys_is_unknown_when_the_columns_differ():
+    before = pd.DataFrame({"employee_id": [101], "full_name": ["Alice"]})
+
+    assert hr_data.changed_keys("employees", before, before.assign(department="Sales")) is None
+    assert hr_data.changed_keys("employees", None, before) is None
+    assert hr_data.changed_keys("users", before, before) is None
+
+def test_changes_since(store):
+    with store["lock"]:
+        hr_data.record_change(store, "employees", {"101"})
+        hr_data.record_change(store, "employees", {"102", "101"})
+
+    assert hr_data.changes_since("employees", 0) == {"101", "102"}
+    assert hr_data.changes_since("employees", 1) == {"102", "101"}
+    assert hr_data.changes_since("employees", 2) == set()
+
+    with store["lock"]:
+        hr_data.record_change(store, "employees", None)
+
+    assert hr_data.changes_since("employees", 2) is None
+    assert hr_data.changes_since("employees", 3) == set()
+
+def test_changes_since_a_version_older_than_the_feed_is_unknown(store):
+    with store["lock"]:
+        for _ in range(hr_data.CHANGE_FEED_LENGTH + 1):
+            hr_data.record_change(store, "attendance", {"101|2026-03-02"})
+
+    assert hr_data.changes_since("attendance", 0) is None
+    assert hr_data.changes_since("attendance", 1) == {"101|2026-03-02"}
+
+def test_submitted_writes_feed_their_keys(store):
+    hr_data.submit_write(store, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+    hr_data.submit_write(store, "attendance", "upsert", {"changes": [["101", "2026-03-02", "Present"]]}, "admin")
+
+    assert hr_data.changes_since("employees", 0) == {"101"}
+    assert hr_data.changes_since("attendance", 0) == {"101|2026-03-02"}
+
+def test_touches_employee_matches_whole_ids_only():
+    assert hr_data.touches_employee({"101|2026-03-02"}, "101")
+    assert hr_data.touches_employee({"101"}, "101")
+    assert not hr_data.touches_employee({"1012|2026-03-02", "10"}, "101")
@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+@pytest.fixture
+def queue(monkeypatch):
+    """The check-in queue, without its background flusher"""
+    queue = {"pending": {}, "lock": threading.Lock()}
+    monkeypatch.setattr(hr_data, "get_checkin_queue", lambda: queue)
+    return queue
+
+def journaled_changes():
+    with closing(hr_data.open_journal()) as conn:
+        rows = conn.execute("SELECT dataset, op, payload FROM journal ORDER BY id").fetchall()
+    assert all(row[:2] == ("attendance", "upsert") for row in rows)
+    payloads = [json.loads(row[2]) for row in rows]
+    assert all(payload["overwrite"] is False for payload in payloads)
+    return sorted(tuple(change) for payload in payloads for change in payload["changes"])
+
+def test_repeated_taps_collapse_into_one_checkin(queue):
+    hr_data.queue_checkin(101, "2026-03-02")
+    hr_data.queue_checkin("101", "2026-03-02")
+    hr_data.queue_checkin(102, "2026-03-02")
+
+    assert queue["pending"] == {("101", "2026-03-02"): "Present", ("102", "2026-03-02"): "Present"}
+    assert hr_data.is_checked_in(101, "2026-03-02")
+    assert not hr_data.is_checked_in(101, "2026-03-03")
+
+def test_flush_journals_the_batch_without_overwriting_recorded_days(queue, store):
+    store["frames"]["attendance"] = pd.DataFrame([{"employee_id": 101, "date": "2026-03-02", "status": "Leave"}])
+    hr_data.queue_checkin(101, "2026-03-02")
+    hr_data.queue_checkin(102, "2026-03-02")
+
+    hr_data.flush_checkins(queue, store)
+
+    assert queue["pending"] == {}
+    assert journaled_changes() == [("101", "2026-03-02", "Present"), ("102", "2026-03-02", "Present")]
+    attendance = store["frames"]["attendance"]
+    assert attendance["status"].tolist() == ["Leave", "Present"]
+    assert hr_data.changes_since("attendance", 0) == {"101|2026-03-02", "102|2026-03-02"}
+
+def test_empty_queue_writes_nothing(queue, store):
+    hr_data.flush_checkins(queue, store)
+
+    assert store["versions"]["attendance"] == 0
+    assert not hr_data.JOURNAL_PATH.exists()
+
+def test_failed_flush_keeps_the_checkins_queued(queue, store, monkeypatch):
+    def failing_write(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(hr_data, "submit_write", failing_write)
+    hr_data.queue_checkin(101, "2026-03-02")
+
+    hr_data.flush_checkins(queue, store)
+
+    assert queue["pending"] == {("101", "2026-03-02"): "Present"}
+
+def test_checkin_queued_during_a_flush_is_kept(queue, store, monkeypatch):
+    submit_write = hr_data.submit_write
+
+    def write_and_tap(*args, **kwargs):
+        submit_write(*args, **kwargs)
+        hr_data.queue_checkin(103, "2026-03-02")
+
+    monkeypatch.setattr(hr_data, "submit_write", write_and_tap)
+    hr_data.queue_checkin(101, "2026-03-02")
+
+    hr_data.flush_checkins(queue, store)
+
+    assert queue["pending"] == {("103", "2026-03-02"): "Present"}
+
+def test_each_employee_is_the_actor_of_their_checkins(queue, store, audit_queue):
+    hr_data.queue_checkin(101, "2026-03-02")
+    hr_data.queue_checkin(102, "2026-03-02")
+    hr_data.queue_checkin(101, "2026-03-03")
+
+    hr_data.flush_checkins(queue, store)
+
+    with closing(hr_data.open_journal()) as conn:
+        actors = [actor for actor, in conn.execute("SELECT actor FROM journal ORDER BY id")]
+    assert actors == ["101", "102"]
+    assert [entry[1] for entry in audit_queue["pending"]] == ["101", "102"]
+
+def test_a_failed_employee_keeps_only_the_unjournaled_checkins(queue, store, monkeypatch):
+    submit_write = hr_data.submit_write
+
+    def failing_for_102(store, dataset, op, payload, actor):
+        if actor == "102":
+            raise sqlite3.OperationalError("database is locked")
+        submit_write(store, dataset, op, payload, actor)
+
+    monkeypatch.setattr(hr_data, "submit_write", failing_for_102)
+    hr_data.queue_checkin(101, "2026-03-02")
+    hr_data.queue_checkin(102, "2026-03-02")
+
+    hr_data.flush_checkins(queue, store)
+
+    assert queue["pending"] == {("102", "2026-03-02"): "Present"}
+    assert journaled_changes() == [("101", "2026-03-02", "Present")]
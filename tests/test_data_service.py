@@ -0,0 +1,132 @@
+import pickle
+
+import pytest
+
+import data_service
+import hr_data
+
+pd = hr_data.pd
+
+class InProcessService:
+    """Calls data service handlers directly, pickling both ways like the real connection"""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+        self.sent = []
+
+    def call(self, method, *args):
+        self.calls.append((method, args))
+        # In its own process, the service's data layer works on the service's store
+        get_data_store = hr_data.get_data_store
+        hr_data.get_data_store = lambda: self.store
+        try:
+            value = data_service.HANDLERS[method](self.store, *pickle.loads(pickle.dumps(args)))
+        finally:
+            hr_data.get_data_store = get_data_store
+        self.sent.append(value)
+        return pickle.loads(pickle.dumps(value))
+
+def employee_row(employee_id, full_name):
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update(employee_id=employee_id, full_name=full_name, department="Sales", status="Active",
+               daily_rate_basic=100, daily_rate_transport=10, daily_rate_meal=10, allowance_monthly=0)
+    return [row[column] for column in hr_data.EMPLOYEE_COLUMNS]
+
+@pytest.fixture
+def service_store(make_store):
+    service_store = make_store()
+    service_store["frames"]["employees"] = pd.DataFrame(
+        [employee_row(101, "Alice"), employee_row(102, "Bob"), employee_row(103, "Carol")], columns=hr_data.EMPLOYEE_COLUMNS
+    )
+    service_store["frames"]["attendance"] = pd.DataFrame([
+        {"employee_id": employee_id, "date": day, "status": "Present"}
+        for day in pd.bdate_range("2026-02-02", "2026-02-27").strftime("%Y-%m-%d")
+        for employee_id in (101, 102, 103)
+    ])
+    for name in hr_data.WORKSHEET_NAMES:
+        service_store["versions"][name] = 1
+    return service_store
+
+@pytest.fixture
+def worker(store, service_store):
+    """The worker's store, following service_store"""
+    store["service"] = InProcessService(service_store)
+    assert hr_data.pull_from_service(store)
+    return store
+
+def assert_in_step(worker, service_store):
+    assert worker["versions"] == service_store["versions"]
+    for name in ("employees", "attendance"):
+        pd.testing.assert_frame_equal(worker["frames"][name], service_store["frames"][name], check_dtype=False)
+
+def last_changes(worker):
+    return worker["service"].sent[-1]["datasets"]
+
+def test_first_pull_copies_every_dataset(worker, service_store):
+    assert_in_step(worker, service_store)
+    assert all("frame" in delta for delta in last_changes(worker).values())
+
+def test_a_checkin_sends_only_its_row(worker, service_store):
+    hr_data.submit_write(service_store, "attendance", "upsert", {"changes": [["102", "2026-03-02", "Present"]], "overwrite": False}, "102")
+
+    assert hr_data.pull_from_service(worker)
+
+    delta = last_changes(worker)["attendance"]
+    assert "frame" not in delta
+    assert len(delta["rows"]) == 1
+    assert list(last_changes(worker)) == ["attendance"]
+    assert_in_step(worker, service_store)
+    assert hr_data.changes_since("attendance", 1) == {"102|2026-03-02"}
+
+def test_mixed_writes_keep_the_worker_in_step(worker, service_store):
+    hr_data.submit_write(service_store, "employees", "update", {"row": employee_row(102, "Robert")}, "admin")
+    hr_data.submit_write(service_store, "employees", "delete", {"employee_id": 101}, "admin")
+    hr_data.submit_write(service_store, "employees", "insert", {"row": employee_row(104, "Dan")}, "admin")
+    hr_data.submit_write(service_store, "attendance", "upsert", {"changes": [["103", "2026-02-04", "Absent"]]}, "admin")
+
+    assert hr_data.pull_from_service(worker)
+
+    assert all("frame" not in delta for delta in last_changes(worker).values())
+    assert_in_step(worker, service_store)
+    assert worker["frames"]["employees"]["full_name"].tolist() == ["Robert", "Carol", "Dan"]
+
+def test_a_gap_in_the_feed_sends_the_whole_dataset(worker, service_store):
+    with service_store["lock"]:
+        service_store["frames"]["employees"] = service_store["frames"]["employees"].iloc[::-1].reset_index(drop=True)
+        hr_data.record_change(service_store, "employees", None)
+
+    assert hr_data.pull_from_service(worker)
+
+    assert "frame" in last_changes(worker)["employees"]
+    assert_in_step(worker, service_store)
+    assert hr_data.changes_since("employees", 1) is None
+
+def test_a_drifted_copy_is_fetched_again_in_full(worker, service_store):
+    # The worker's copy lost a row it should have, so the delta can't be placed
+    with worker["lock"]:
+        worker["frames"]["attendance"] = worker["frames"]["attendance"].iloc[1:].reset_index(drop=True)
+        worker["derived"].pop(("entity_keys", "attendance"), None)
+    hr_data.submit_write(service_store, "attendance", "upsert", {"changes": [["101", "2026-03-02", "Present"]]}, "admin")
+
+    assert hr_data.pull_from_service(worker)
+
+    assert [method for method, _ in worker["service"].calls[-2:]] == ["changes", "changes"]
+    assert_in_step(worker, service_store)
+
+def test_payroll_of_the_current_data_is_computed_by_the_service(worker, service_store):
+    payroll = hr_data.get_store_payroll(["2026-02"])
+
+    assert ("payroll", (["2026-02"],)) in worker["service"].calls
+    assert ("payroll", "2026-02") in service_store["derived"]
+    assert ("payroll", "2026-02") not in worker["derived"]
+    assert payroll["Present Days"].tolist() == [20, 20, 20]
+
+def test_payroll_of_given_frames_is_computed_from_them(worker, service_store):
+    df_emp = worker["frames"]["employees"].iloc[[0]]
+    df_att = worker["frames"]["attendance"].iloc[:3]
+
+    payroll = hr_data.get_payroll(df_emp, df_att, pd.DataFrame(), ["2026-02"])
+
+    assert not any(method == "payroll" for method, _ in worker["service"].calls)
+    assert payroll["Present Days"].tolist() == [1]
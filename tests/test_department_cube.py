@@ -0,0 +1,99 @@
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+MONTHS = ["2026-01", "2026-02"]
+
+def employees():
+    return pd.DataFrame([
+        {"employee_id": 101, "full_name": "Alice", "department": "Finance", "status": "Active", "join_date": "2025-06-01",
+         "daily_rate_basic": 100.0, "daily_rate_transport": 20.0, "daily_rate_meal": 15.0, "allowance_monthly": 500.0},
+        {"employee_id": 102, "full_name": "Bob", "department": "Sales", "status": "Active", "join_date": "2025-06-01",
+         "daily_rate_basic": 80.0, "daily_rate_transport": 10.0, "daily_rate_meal": 10.0, "allowance_monthly": 0.0},
+        {"employee_id": 103, "full_name": "Carol", "department": "Sales", "status": "Active", "join_date": "2026-02-01",
+         "daily_rate_basic": 90.0, "daily_rate_transport": 10.0, "daily_rate_meal": 10.0, "allowance_monthly": 0.0}
+    ])
+
+def attendance():
+    return pd.DataFrame([
+        {"employee_id": employee_id, "date": day, "status": "Present"}
+        for day in pd.bdate_range("2026-01-01", "2026-02-28").strftime("%Y-%m-%d")
+        for employee_id in (101, 102, 103)
+        if not (employee_id == 103 and day < "2026-02") and not (employee_id == 102 and day.endswith("5"))
+    ])
+
+@pytest.fixture
+def rolled_up(monkeypatch):
+    """Months whose cube slice was rebuilt"""
+    months = []
+    rollup_department_month = hr_data.rollup_department_month
+
+    def recording_rollup(month_payroll, df_emp, month):
+        months.append(month)
+        return rollup_department_month(month_payroll, df_emp, month)
+
+    monkeypatch.setattr(hr_data, "rollup_department_month", recording_rollup)
+    return months
+
+def test_cube_adds_up_the_payroll(store):
+    df_emp, df_att = employees(), attendance()
+
+    cube = hr_data.get_department_cube(df_emp, df_att, pd.DataFrame(), MONTHS)
+
+    payroll = hr_data.compute_payroll(df_emp, df_att, MONTHS)
+    expected = payroll.groupby(["Department", "Month"])["Total Salary"].sum()
+    assert cube["Payroll Cost"].to_dict() == pytest.approx(expected.to_dict())
+    assert cube["Present Days"].to_dict() == payroll.groupby(["Department", "Month"])["Present Days"].sum().to_dict()
+
+def test_headcount_counts_employees_who_had_joined(store):
+    cube = hr_data.get_department_cube(employees(), attendance(), pd.DataFrame(), MONTHS)
+
+    # Carol joined in February
+    assert cube["Headcount"].to_dict() == {
+        ("Finance", "2026-01"): 1, ("Finance", "2026-02"): 1,
+        ("Sales", "2026-01"): 1, ("Sales", "2026-02"): 2
+    }
+    assert cube.loc[("Finance", "2026-02"), "Attendance Rate"] == pytest.approx(1.0)
+    assert cube.loc[("Sales", "2026-02"), "Possible Days"] == 2 * hr_data.working_days(["2026-02"])[0]
+
+def test_inactive_employees_count_only_in_months_they_attended(store):
+    df_emp = employees()
+    df_emp.loc[df_emp["employee_id"] == 103, ["status", "join_date"]] = ["Inactive", ""]
+
+    cube = hr_data.get_department_cube(df_emp, attendance(), pd.DataFrame(), MONTHS)
+
+    assert cube.loc[("Sales", "2026-01"), "Headcount"] == 1
+    assert cube.loc[("Sales", "2026-02"), "Headcount"] == 2
+
+def test_rollup_recomputes_the_rate_from_the_sums(store):
+    cube = hr_data.get_department_cube(employees(), attendance(), pd.DataFrame(), MONTHS)
+
+    months = hr_data.rollup_cube(cube, "Month")
+
+    february = months.loc["2026-02"]
+    assert february["Headcount"] == 3
+    assert february["Attendance Rate"] == pytest.approx(february["Present Days"] / february["Possible Days"])
+    # Not the mean of the department rates
+    assert february["Attendance Rate"] != pytest.approx(cube.xs("2026-02", level="Month")["Attendance Rate"].mean())
+
+def test_an_edit_rebuilds_only_its_month(store, rolled_up):
+    df_emp, df_att, history = employees(), attendance(), pd.DataFrame()
+    hr_data.get_department_cube(df_emp, df_att, history, MONTHS)
+
+    edited = hr_data.apply_write(df_att, "attendance", "upsert", {"changes": [["101", "2026-02-02", "Absent"]]})
+    cube = hr_data.get_department_cube(df_emp, edited, history, MONTHS)
+
+    assert rolled_up == MONTHS + ["2026-02"]
+    assert cube.loc[("Finance", "2026-02"), "Present Days"] == hr_data.working_days(["2026-02"])[0] - 1
+
+def test_a_department_move_rebuilds_every_month(store, rolled_up):
+    df_emp, df_att, history = employees(), attendance(), pd.DataFrame()
+    hr_data.get_department_cube(df_emp, df_att, history, MONTHS)
+
+    moved = df_emp.assign(department=["Finance", "Finance", "Sales"])
+    cube = hr_data.get_department_cube(moved, df_att, history, MONTHS)
+
+    assert rolled_up == MONTHS + MONTHS
+    assert cube.loc[("Finance", "2026-01"), "Headcount"] == 2
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+QUERIES = [("", "Sales", "All"), ("a", "All", "All"), ("10", "All", "Active"), ("", "All", "All")]
+
+def employee_row(employee_id, full_name, department="Sales", status="Active"):
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update(employee_id=employee_id, full_name=full_name, department=department, status=status)
+    return [row[column] for column in hr_data.EMPLOYEE_COLUMNS]
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = {"entries": OrderedDict(), "bytes": 0, "lock": threading.Lock()}
+    monkeypatch.setattr(hr_data, "get_directory_cache", lambda: cache)
+    return cache
+
+@pytest.fixture
+def employees(store, cache):
+    store["frames"]["employees"] = pd.DataFrame([
+        employee_row(101, "Alice"), employee_row(102, "Bob", "Finance"),
+        employee_row(103, "Carla", status="Inactive"), employee_row(104, "Dave")
+    ], columns=hr_data.EMPLOYEE_COLUMNS)
+    return store
+
+@pytest.fixture
+def filtered(monkeypatch):
+    """Number of employees each filter_employees call searched"""
+    sizes = []
+    filter_employees = hr_data.filter_employees
+    monkeypatch.setattr(
+        hr_data, "filter_employees", lambda df_emp, *query: sizes.append(len(df_emp)) or filter_employees(df_emp, *query)
+    )
+    return sizes
+
+def assert_same_result(actual, expected):
+    pd.testing.assert_frame_equal(actual[0], expected[0])
+    assert actual[1] == expected[1]
+
+def test_a_repeated_query_is_served_from_the_cache(employees, filtered):
+    first = hr_data.directory_query("a", "All", "All")
+    second = hr_data.directory_query("a", "All", "All")
+
+    assert second is first
+    assert filtered == [4]
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_results_patched_after_writes_match_a_full_search(employees, query):
+    hr_data.directory_query(*query)
+    hr_data.submit_write(employees, "employees", "update", {"row": employee_row(102, "Barbara", "Sales")}, "admin")
+    hr_data.submit_write(employees, "employees", "delete", {"employee_id": 101}, "admin")
+    hr_data.submit_write(employees, "employees", "insert", {"row": employee_row(105, "Ava")}, "admin")
+    hr_data.submit_write(employees, "employees", "update", {"row": employee_row(104, "Dave", status="Inactive")}, "admin")
+
+    result = hr_data.directory_query(*query)
+
+    assert_same_result(result, hr_data.filter_employees(employees["frames"]["employees"], *query))
+
+def test_a_patch_searches_only_the_changed_employees(employees, filtered):
+    hr_data.directory_query("", "Sales", "All")
+    hr_data.submit_write(employees, "employees", "update", {"row": employee_row(102, "Bob", "Sales")}, "admin")
+
+    result = hr_data.directory_query("", "Sales", "All")
+
+    assert filtered == [4, 1]
+    assert result[1] == ["101 - Alice", "102 - Bob", "103 - Carla", "104 - Dave"]
+
+def test_a_gap_in_the_feed_searches_everyone_again(employees, filtered):
+    hr_data.directory_query("", "Sales", "All")
+    with employees["lock"]:
+        employees["frames"]["employees"] = employees["frames"]["employees"].iloc[::-1].reset_index(drop=True)
+        hr_data.record_change(employees, "employees", None)
+
+    result = hr_data.directory_query("", "Sales", "All")
+
+    assert filtered == [4, 4]
+    assert result[1] == ["104 - Dave", "103 - Carla", "101 - Alice"]
+
+def test_least_recently_used_results_are_evicted_first(employees, cache, monkeypatch):
+    hr_data.directory_query("101", "All", "All")
+    # Room for two results of one employee each
+    monkeypatch.setattr(hr_data, "DIRECTORY_CACHE_MB", 2.5 * cache["bytes"] / 1024 / 1024)
+
+    hr_data.directory_query("102", "All", "All")
+    # Touching the first result keeps it over the second
+    hr_data.directory_query("101", "All", "All")
+    hr_data.directory_query("104", "All", "All")
+
+    assert [key[1] for key in cache["entries"]] == ["101", "104"]
+    assert cache["bytes"] == sum(entry[1] for entry in cache["entries"].values())
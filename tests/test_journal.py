@@ -0,0 +1,183 @@
+from contextlib import closing
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+
+import hr_data
+
+pd = hr_data.pd
+
+def api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = f'{{"error": {{"code": {status}, "message": "HTTP {status}", "status": ""}}}}'.encode("utf-8")
+    return APIError(response)
+
+def employee_row(employee_id, full_name):
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update(employee_id=employee_id, full_name=full_name, department="Sales", status="Active")
+    return [row[column] for column in hr_data.EMPLOYEE_COLUMNS]
+
+def journal(*columns):
+    with closing(hr_data.open_journal()) as conn:
+        return conn.execute(f"SELECT {', '.join(columns)} FROM journal ORDER BY id").fetchall()
+
+@pytest.fixture
+def online(store, sheets):
+    """Store connected to the CSV worksheets"""
+    store["worksheets"] = sheets
+    return store
+
+def test_replayed_writes_change_nothing():
+    attendance = pd.DataFrame([{"employee_id": 101, "date": "2026-03-02", "status": "Absent"}])
+    writes = [
+        ("attendance", "upsert", {"changes": [["101", "2026-03-02", "Present"], ["102", "2026-03-02", "Present"]]}),
+        ("rate_history", "upsert", {"rows": [["101", "2026-03-01", 110, 20, 15, 500]]}),
+        ("employees", "insert", {"row": employee_row(104, "Dan")}),
+        ("employees", "upsert", {"rows": [employee_row(101, "Alice"), employee_row(105, "Eve")]})
+    ]
+    frames = {
+        "attendance": attendance,
+        "rate_history": pd.DataFrame(),
+        "employees": pd.DataFrame([employee_row(101, "Al")], columns=hr_data.EMPLOYEE_COLUMNS)
+    }
+
+    for dataset, op, payload in writes:
+        once = hr_data.apply_write(frames[dataset], dataset, op, payload)
+        twice = hr_data.apply_write(once, dataset, op, payload)
+        pd.testing.assert_frame_equal(twice, once)
+        frames[dataset] = once
+
+    assert frames["attendance"]["status"].tolist() == ["Present", "Present"]
+    assert frames["employees"]["full_name"].tolist() == ["Alice", "Dan", "Eve"]
+    # The store's frame itself is never modified in place
+    assert attendance["status"].tolist() == ["Absent"]
+
+def test_insert_only_attendance_upsert_keeps_recorded_days():
+    frame = pd.DataFrame([{"employee_id": 101, "date": "2026-03-02", "status": "Leave"}])
+    changes = [["101", "2026-03-02", "Present"], ["101", "2026-03-03", "Present"]]
+
+    kept = hr_data.apply_write(frame, "attendance", "upsert", {"changes": changes, "overwrite": False})
+    overwritten = hr_data.apply_write(frame, "attendance", "upsert", {"changes": changes, "overwrite": True})
+
+    assert kept["status"].tolist() == ["Leave", "Present"]
+    assert overwritten["status"].tolist() == ["Present", "Present"]
+    assert frame["status"].tolist() == ["Leave"]
+
+def leave_requests():
+    return pd.DataFrame([
+        ["LV1", 101, "Annual", "2026-03-02", "2026-03-03", 2, "", "Pending", "2026-02-20T09:00:00", "", ""],
+        ["LV2", 102, "Sick", "2026-03-04", "2026-03-04", 1, "", "Approved", "2026-02-20T09:00:00", "admin", "2026-02-21T10:00:00"]
+    ], columns=hr_data.MANAGED_WORKSHEETS["leave_requests"])
+
+def decision(request_id, status, decided_by="admin"):
+    return {"request_id": request_id, "employee_id": "101", "status": status, "decided_by": decided_by,
+            "decided_at": "2026-02-22T08:00:00"}
+
+def test_decide_applies_only_to_a_pending_request():
+    decided = hr_data.apply_write(leave_requests(), "leave_requests", "decide", decision("LV1", "Approved"))
+
+    assert decided.loc[0, ["status", "decided_by"]].tolist() == ["Approved", "admin"]
+    assert decided.loc[1].tolist() == leave_requests().loc[1].tolist()
+
+    # A second decision on the now-approved request is dropped
+    again = hr_data.apply_write(decided, "leave_requests", "decide", decision("LV1", "Cancelled", "manager"))
+    assert again.loc[0, ["status", "decided_by"]].tolist() == ["Approved", "admin"]
+
+def test_replayed_leave_request_insert_is_applied_once():
+    row = ["LV3", "103", "Annual", "2026-04-01", "2026-04-01", "1", "", "Pending", "2026-03-20T09:00:00", "", ""]
+
+    once = hr_data.apply_write(leave_requests(), "leave_requests", "insert", {"row": row})
+    twice = hr_data.apply_write(once, "leave_requests", "insert", {"row": row})
+
+    assert len(once) == 3
+    assert twice.equals(once)
+    # Numericised like rows fetched from Sheets
+    assert once.loc[2, "days"] == 1
+
+def test_submitted_write_is_journaled_and_applied(store):
+    hr_data.submit_write(store, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+
+    assert journal("actor", "dataset", "op", "status") == [("admin", "employees", "insert", "pending")]
+    assert store["frames"]["employees"]["full_name"].tolist() == ["Alice"]
+    assert hr_data.read_unsynced_writes()["employees"] == [("insert", {"row": employee_row(101, "Alice")})]
+
+def test_flush_sends_writes_in_order_and_coalesces_attendance(online, sheets, monkeypatch):
+    sends = []
+    upsert_attendance = hr_data.upsert_attendance
+    monkeypatch.setattr(
+        hr_data, "upsert_attendance", lambda ws, changes, overwrite=True: sends.append(len(changes)) or upsert_attendance(ws, changes, overwrite)
+    )
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+    for day in ("2026-03-02", "2026-03-03", "2026-03-04"):
+        hr_data.submit_write(online, "attendance", "upsert", {"changes": [["101", day, "Present"]]}, "admin")
+    hr_data.submit_write(online, "employees", "update", {"row": employee_row(101, "Alicia")}, "admin")
+
+    assert hr_data.flush_journal(online)
+
+    assert sends == [3]
+    assert [status for status, in journal("status")] == ["done"] * 5
+    assert sheets["employees"].get_all_records()[0]["full_name"] == "Alicia"
+    assert [row["date"] for row in sheets["attendance"].get_all_records()] == ["2026-03-02", "2026-03-03", "2026-03-04"]
+
+def test_offline_store_sends_nothing(store):
+    hr_data.submit_write(store, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+
+    assert not hr_data.flush_journal(store)
+    assert journal("status") == [("pending",)]
+
+@pytest.mark.parametrize("error", [api_error(429), api_error(503), ConnectionError("reset"), TimeoutError()])
+def test_transient_error_holds_the_queue(online, monkeypatch, error):
+    def execute_write(worksheets, dataset, op, payload):
+        if payload["row"][1] == "Alice":
+            raise error
+
+    monkeypatch.setattr(hr_data, "execute_write", execute_write)
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(102, "Bob")}, "admin")
+
+    assert not hr_data.flush_journal(online)
+
+    assert journal("status", "attempts") == [("pending", 1), ("pending", 0)]
+
+@pytest.mark.parametrize("error", [api_error(400), api_error(403), hr_data.JournalConflict("gone"), KeyError("employee_id")])
+def test_permanent_error_fails_only_that_write(online, monkeypatch, error):
+    def execute_write(worksheets, dataset, op, payload):
+        if payload["row"][1] == "Alice":
+            raise error
+
+    monkeypatch.setattr(hr_data, "execute_write", execute_write)
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(102, "Bob")}, "admin")
+
+    assert hr_data.flush_journal(online)
+
+    assert [row[:2] for row in journal("status", "attempts")] == [("failed", 1), ("done", 1)]
+    assert journal("last_error")[0][0].startswith(type(error).__name__)
+
+def test_transient_error_fails_the_write_after_the_attempt_cap(online, monkeypatch):
+    def execute_write(worksheets, dataset, op, payload):
+        raise api_error(503)
+
+    monkeypatch.setattr(hr_data, "execute_write", execute_write)
+    monkeypatch.setattr(hr_data, "JOURNAL_MAX_ATTEMPTS", 3)
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(101, "Alice")}, "admin")
+
+    assert not hr_data.flush_journal(online)
+    assert not hr_data.flush_journal(online)
+    assert hr_data.flush_journal(online)
+    assert journal("status", "attempts") == [("failed", 3)]
+
+    hr_data.retry_failed_writes()
+
+    assert journal("status", "attempts") == [("pending", 0)]
+
+def test_adding_an_existing_employee_is_a_conflict(online, sheets):
+    sheets["employees"].append_row(employee_row(101, "Alice"))
+    hr_data.submit_write(online, "employees", "insert", {"row": employee_row(101, "Another Alice")}, "admin")
+
+    assert hr_data.flush_journal(online)
+
+    assert journal("status") == [("failed",)]
+    assert [record["full_name"] for record in sheets["employees"].get_all_records()] == ["Alice"]
@@ -0,0 +1,129 @@
+from datetime import date
+
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+build_leave_ledger = hr_data.build_leave_ledger
+
+def employee_row(employee_id, full_name, join_date, department="Sales"):
+    row = dict.fromkeys(hr_data.EMPLOYEE_COLUMNS, "")
+    row.update({
+        "employee_id": employee_id, "full_name": full_name, "join_date": join_date, "department": department,
+        "daily_rate_basic": 100, "daily_rate_transport": 10, "daily_rate_meal": 10, "allowance_monthly": 0,
+        "status": "Active"
+    })
+    return [row[column] for column in hr_data.EMPLOYEE_COLUMNS]
+
+def request_row(request_id, employee_id, leave_type, days, status="Pending"):
+    return [request_id, employee_id, leave_type, "2026-03-02", "2026-03-06", days, "", status, "2026-02-20T09:00:00", "", ""]
+
+@pytest.fixture
+def built(monkeypatch):
+    """Employee IDs of every build_leave_ledger call, one sorted list per call"""
+    calls = []
+
+    def recording_build(df_emp, requests, month):
+        calls.append(sorted(df_emp["employee_id"].astype(str)))
+        return build_leave_ledger(df_emp, requests, month)
+
+    monkeypatch.setattr(hr_data, "build_leave_ledger", recording_build)
+    return calls
+
+@pytest.fixture
+def loaded(store):
+    """Store holding three employees and their leave requests"""
+    store["frames"]["employees"] = pd.DataFrame(
+        [employee_row(101, "Alice", "2020-01-06"), employee_row(102, "Bob", "2025-11-03"), employee_row(103, "Carol", "2026-01-12")],
+        columns=hr_data.EMPLOYEE_COLUMNS
+    )
+    store["frames"]["leave_requests"] = pd.DataFrame([
+        request_row("LV1", 101, "Annual", 5, "Approved"),
+        request_row("LV2", 101, "Sick", 2),
+        request_row("LV3", 102, "Annual", 3),
+        request_row("LV4", 103, "Unpaid", 4, "Approved")
+    ], columns=hr_data.MANAGED_WORKSHEETS["leave_requests"])
+    store["versions"].update(employees=1, leave_requests=1)
+    return store
+
+def assert_matches_full_rebuild(store):
+    ledger = hr_data.get_leave_ledger()
+    expected = build_leave_ledger(
+        store["frames"]["employees"], store["frames"]["leave_requests"], date.today().strftime("%Y-%m")
+    )
+    pd.testing.assert_frame_equal(ledger, expected, check_index_type=False)
+    return ledger
+
+def test_first_call_builds_the_full_ledger(loaded, built):
+    ledger = assert_matches_full_rebuild(loaded)
+
+    assert built == [["101", "102", "103"]]
+    assert ledger.loc[("101", "Annual"), "Taken"] == 5
+    assert ledger.loc[("101", "Sick"), "Pending"] == 2
+    # Unpaid leave doesn't accrue, so it has no balance
+    assert ("103", "Unpaid") not in ledger.index
+
+def test_unchanged_data_reuses_the_ledger(loaded, built):
+    first = hr_data.get_leave_ledger()
+
+    assert hr_data.get_leave_ledger() is first
+    assert len(built) == 1
+
+def test_incremental_ledger_matches_full_rebuild_after_mixed_writes(loaded, built):
+    assert_matches_full_rebuild(loaded)
+
+    hr_data.submit_write(loaded, "leave_requests", "insert", {"row": request_row("LV5", 102, "Sick", 1)}, "admin")
+    assert hr_data.decide_leave_request(
+        loaded, loaded["frames"]["leave_requests"].iloc[2], "Approved", "admin"
+    )
+    assert_matches_full_rebuild(loaded)
+    assert built[-1] == ["102"]
+
+    hr_data.submit_write(loaded, "employees", "update", {"row": employee_row(103, "Carol", "2025-06-02")}, "admin")
+    hr_data.submit_write(loaded, "employees", "insert", {"row": employee_row(104, "Dan", "2026-02-02")}, "admin")
+    hr_data.submit_write(loaded, "leave_requests", "insert", {"row": request_row("LV6", 104, "Annual", 1)}, "admin")
+    hr_data.submit_write(loaded, "leave_requests", "decide", {
+        "request_id": "LV2", "employee_id": "101", "status": "Rejected", "decided_by": "admin",
+        "decided_at": "2026-02-21T10:00:00"
+    }, "admin")
+    assert_matches_full_rebuild(loaded)
+    assert built[-1] == ["101", "103", "104"]
+
+    hr_data.submit_write(loaded, "employees", "delete", {"employee_id": 102}, "admin")
+    ledger = assert_matches_full_rebuild(loaded)
+    assert built[-1] == []
+    assert "102" not in ledger.index.get_level_values("employee_id")
+
+def test_a_gap_in_the_change_feed_rebuilds_in_full(loaded, built):
+    hr_data.get_leave_ledger()
+
+    with loaded["lock"]:
+        loaded["frames"]["employees"] = hr_data.apply_write(
+            loaded["frames"]["employees"], "employees", "update", {"row": employee_row(101, "Alice", "2024-01-08")}
+        )
+        hr_data.record_change(loaded, "employees", None)
+
+    assert_matches_full_rebuild(loaded)
+    assert built[-1] == ["101", "102", "103"]
+
+def test_only_a_pending_request_can_be_decided(loaded):
+    request = loaded["frames"]["leave_requests"].iloc[2]
+    assert hr_data.decide_leave_request(loaded, request, "Approved", "admin")
+    versions = dict(loaded["versions"])
+
+    # The request is no longer Pending, so a late second decision writes nothing
+    assert not hr_data.decide_leave_request(loaded, request, "Rejected", "manager")
+
+    assert loaded["versions"] == versions
+    ledger = assert_matches_full_rebuild(loaded)
+    assert ledger.loc[("102", "Annual"), ["Taken", "Pending"]].tolist() == [3, 0]
+
+def test_an_employees_own_ledger_matches_their_rows_of_the_full_one(loaded):
+    month = date.today().strftime("%Y-%m")
+    requests = loaded["frames"]["leave_requests"]
+
+    own = build_leave_ledger(loaded["frames"]["employees"].iloc[[0]], requests[requests["employee_id"] == 101], month)
+
+    full = hr_data.get_leave_ledger()
+    pd.testing.assert_frame_equal(own, full.loc[["101"]], check_index_type=False)
@@ -0,0 +1,136 @@
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+def employees():
+    return pd.DataFrame([
+        {"employee_id": 101, "full_name": "Alice", "department": "Finance", "bank_account_number": "111222",
+         "daily_rate_basic": 100.0, "daily_rate_transport": 20.0, "daily_rate_meal": 15.0,
+         "allowance_monthly": 500.0, "join_date": "2020-01-06", "status": "Active"},
+        {"employee_id": 102, "full_name": "Bob", "department": "Sales", "bank_account_number": "333444",
+         "daily_rate_basic": 80.0, "daily_rate_transport": 10.0, "daily_rate_meal": 10.0,
+         "allowance_monthly": 0.0, "join_date": "2021-03-01", "status": "Active"},
+        {"employee_id": 103, "full_name": "Carol", "department": "Sales", "bank_account_number": "",
+         "daily_rate_basic": 120.0, "daily_rate_transport": 25.0, "daily_rate_meal": 12.5,
+         "allowance_monthly": 250.0, "join_date": "2022-07-11", "status": "Active"}
+    ])
+
+def attendance():
+    rows = []
+    for day in pd.bdate_range("2026-01-01", "2026-02-28").strftime("%Y-%m-%d"):
+        rows.append({"employee_id": 101, "date": day, "status": "Present"})
+        rows.append({"employee_id": 102, "date": day, "status": "Absent" if day.endswith(("3", "7")) else "Present"})
+        if day >= "2026-02-01":
+            rows.append({"employee_id": 103, "date": day, "status": "present" if day.endswith("0") else "Absent"})
+    return pd.DataFrame(rows)
+
+def baseline_payroll(df_emp, df_att, month):
+    """Payroll of one month as the original row-by-row page loop computed it"""
+    df_month = df_att[df_att["date"].str.startswith(month)]
+    rows = []
+    for _, emp in df_emp.iterrows():
+        present_days = len(
+            df_month[(df_month["employee_id"] == emp["employee_id"]) & (df_month["status"].astype(str).str.lower() == "present")]
+        )
+        daily = float(emp["daily_rate_basic"]) + float(emp["daily_rate_transport"]) + float(emp["daily_rate_meal"])
+        rows.append({
+            "Employee ID": emp["employee_id"],
+            "Present Days": present_days,
+            "Salary from Attendance": daily * present_days,
+            "Monthly Allowance": float(emp["allowance_monthly"]),
+            "Total Salary": daily * present_days + float(emp["allowance_monthly"])
+        })
+    return pd.DataFrame(rows)
+
+@pytest.mark.parametrize("month", ["2026-01", "2026-02"])
+def test_matches_baseline(month):
+    df_emp, df_att = employees(), attendance()
+    expected = baseline_payroll(df_emp, df_att, month)
+
+    payroll = hr_data.compute_payroll(df_emp, df_att, [month])
+
+    assert payroll["Month"].eq(month).all()
+    for column in expected.columns:
+        assert payroll[column].tolist() == pytest.approx(expected[column].tolist()), column
+    assert payroll["Total Salary"].sum() == pytest.approx(expected["Total Salary"].sum())
+
+def test_months_computed_together_match_each_month_alone():
+    df_emp, df_att = employees(), attendance()
+
+    together = hr_data.compute_payroll(df_emp, df_att, ["2026-01", "2026-02"])
+
+    for month, month_payroll in together.groupby("Month"):
+        alone = hr_data.compute_payroll(df_emp, df_att, [month])
+        assert month_payroll["Total Salary"].tolist() == pytest.approx(alone["Total Salary"].tolist())
+
+def test_paid_leave_is_paid_and_unpaid_leave_is_not():
+    df_emp = employees().iloc[[0]]
+    df_att = pd.DataFrame([
+        {"employee_id": 101, "date": "2026-03-02", "status": "Present"},
+        {"employee_id": 101, "date": "2026-03-03", "status": "Leave"},
+        {"employee_id": 101, "date": "2026-03-04", "status": "Unpaid Leave"},
+        {"employee_id": 101, "date": "2026-03-05", "status": "Absent"}
+    ])
+
+    row = hr_data.compute_payroll(df_emp, df_att, ["2026-03"]).iloc[0]
+
+    assert row["Present Days"] == 1
+    assert row["Paid Leave Days"] == 1
+    assert row["Salary from Attendance"] == pytest.approx(2 * 135.0)
+    assert row["Total Salary"] == pytest.approx(2 * 135.0 + 500.0)
+
+def test_duplicated_day_is_paid_once_and_the_last_record_wins():
+    df_emp = employees().iloc[[0]]
+    df_att = pd.DataFrame([
+        {"employee_id": 101, "date": "2026-03-02", "status": "Present"},
+        {"employee_id": 101, "date": "2026-03-02", "status": "Present"},
+        {"employee_id": 101, "date": "2026-03-03", "status": "Present"},
+        {"employee_id": 101, "date": "2026-03-03", "status": "Absent"}
+    ])
+
+    row = hr_data.compute_payroll(df_emp, df_att, ["2026-03"]).iloc[0]
+
+    assert row["Present Days"] == 1
+    assert row["Salary from Attendance"] == pytest.approx(135.0)
+
+def test_days_are_paid_at_the_rate_in_force_on_that_day():
+    df_emp = employees().iloc[[0]].assign(daily_rate_basic=200.0)
+    history = pd.DataFrame([
+        [101, "1900-01-01", 100.0, 20.0, 15.0, 500.0],
+        [101, "2026-03-04", 200.0, 20.0, 15.0, 500.0]
+    ], columns=hr_data.MANAGED_WORKSHEETS["rate_history"])
+    df_att = pd.DataFrame([
+        {"employee_id": 101, "date": day, "status": "Present"} for day in ["2026-02-27", "2026-03-02", "2026-03-03", "2026-03-04"]
+    ])
+
+    payroll = hr_data.compute_payroll(df_emp, df_att, ["2026-02", "2026-03"], history).set_index("Month")
+
+    assert payroll.loc["2026-02", "Salary from Attendance"] == pytest.approx(135.0)
+    assert payroll.loc["2026-03", "Salary from Attendance"] == pytest.approx(2 * 135.0 + 235.0)
+    assert payroll.loc["2026-03", "Daily Basic"] == pytest.approx(200.0)
+
+def test_optional_rule_columns_add_and_deduct():
+    df_emp = employees().iloc[[0]].assign(
+        overtime_rate_hourly=30.0, bonus_monthly=100.0, deduction_monthly=40.0, tax_rate_percent=10.0,
+        allowance_prorated_monthly=210.0
+    )
+    df_att = pd.DataFrame([
+        {"employee_id": 101, "date": day, "status": "Present", "overtime_hours": 2}
+        for day in pd.bdate_range("2026-03-02", "2026-03-12").strftime("%Y-%m-%d")
+    ])
+
+    row = hr_data.compute_payroll(df_emp, df_att, ["2026-03"]).iloc[0]
+
+    # 9 of March 2026's 22 working days
+    earned = 9 * 135.0 + 500.0 + 210.0 * 9 / 22 + 18 * 30.0 + 100.0
+    assert row["Overtime"] == pytest.approx(540.0)
+    assert row["Prorated Allowance"] == pytest.approx(210.0 * 9 / 22)
+    assert row["Tax"] == pytest.approx(earned * 0.10)
+    assert row["Total Salary"] == pytest.approx(earned - 40.0 - earned * 0.10)
+    assert row["Total Salary"] == pytest.approx(hr_data.payroll_total(pd.DataFrame([row]))[0])
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        hr_data.evaluate_pay_rule({"rule": "per_week"}, {}, 0.0)
@@ -0,0 +1,115 @@
+import pytest
+
+import hr_data
+
+pd = hr_data.pd
+
+MONTHS = ["2026-01", "2026-02", "2026-03"]
+
+def employees():
+    return pd.DataFrame([
+        {"employee_id": 101, "full_name": "Alice", "department": "Finance", "bank_account_number": "111222",
+         "daily_rate_basic": 100.0, "daily_rate_transport": 20.0, "daily_rate_meal": 15.0, "allowance_monthly": 500.0},
+        {"employee_id": 102, "full_name": "Bob", "department": "Sales", "bank_account_number": "333444",
+         "daily_rate_basic": 80.0, "daily_rate_transport": 10.0, "daily_rate_meal": 10.0, "allowance_monthly": 0.0}
+    ])
+
+def attendance():
+    return pd.DataFrame([
+        {"employee_id": employee_id, "date": day, "status": "Present"}
+        for day in pd.bdate_range("2026-01-01", "2026-03-31").strftime("%Y-%m-%d")
+        for employee_id in (101, 102)
+        if not (employee_id == 102 and day.endswith("5"))
+    ])
+
+@pytest.fixture
+def computed(monkeypatch):
+    """Months compute_payroll was called for, and how often the attendance was split by month"""
+    calls = {"months": [], "splits": 0}
+    compute_payroll = hr_data.compute_payroll
+    split_attendance_by_month = hr_data.split_attendance_by_month
+
+    def recording_compute(df_emp, df_att, months, history=None):
+        calls["months"].extend(months)
+        return compute_payroll(df_emp, df_att, months, history)
+
+    def recording_split(df_att, months):
+        calls["splits"] += 1
+        return split_attendance_by_month(df_att, months)
+
+    monkeypatch.setattr(hr_data, "compute_payroll", recording_compute)
+    monkeypatch.setattr(hr_data, "split_attendance_by_month", recording_split)
+    return calls
+
+def assert_same_payroll(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+def test_range_matches_a_single_pass_computation(store):
+    df_emp, df_att = employees(), attendance()
+
+    payroll = hr_data.get_payroll(df_emp, df_att, pd.DataFrame(), MONTHS)
+
+    assert_same_payroll(payroll, hr_data.compute_payroll(df_emp, df_att, MONTHS))
+
+def test_same_frames_reuse_every_month_without_splitting_again(store, computed):
+    df_emp, df_att, history = employees(), attendance(), pd.DataFrame()
+
+    first = hr_data.get_payroll(df_emp, df_att, history, MONTHS)
+    second = hr_data.get_payroll(df_emp, df_att, history, MONTHS)
+
+    assert computed == {"months": MONTHS, "splits": 1}
+    assert_same_payroll(second, first)
+
+def test_an_edit_recomputes_only_its_month(store, computed):
+    df_emp, df_att, history = employees(), attendance(), pd.DataFrame()
+    hr_data.get_payroll(df_emp, df_att, history, MONTHS)
+
+    edited = hr_data.apply_write(df_att, "attendance", "upsert", {"changes": [["102", "2026-02-05", "Present"]]})
+    payroll = hr_data.get_payroll(df_emp, edited, history, MONTHS)
+
+    assert computed["months"] == MONTHS + ["2026-02"]
+    assert_same_payroll(payroll, hr_data.compute_payroll(df_emp, edited, MONTHS))
+
+def test_a_later_rate_change_keeps_closed_months_cached(store, computed):
+    df_emp, df_att = employees(), attendance()
+    history = pd.DataFrame([
+        [101, "1900-01-01", 100.0, 20.0, 15.0, 500.0],
+        [102, "1900-01-01", 80.0, 10.0, 10.0, 0.0]
+    ], columns=hr_data.MANAGED_WORKSHEETS["rate_history"])
+    hr_data.get_payroll(df_emp, df_att, history, MONTHS)
+
+    raised = pd.concat([history, pd.DataFrame(
+        [[101, "2026-03-02", 120.0, 20.0, 15.0, 500.0]], columns=hr_data.MANAGED_WORKSHEETS["rate_history"]
+    )], ignore_index=True)
+    payroll = hr_data.get_payroll(df_emp.assign(daily_rate_basic=[120.0, 80.0]), df_att, raised, MONTHS)
+
+    assert computed["months"] == MONTHS + ["2026-03"]
+    march = payroll[(payroll["Month"] == "2026-03") & (payroll["Employee ID"] == 101)].iloc[0]
+    assert march["Salary from Attendance"] == pytest.approx(155.0 + 21 * 155.0)
+
+def test_archived_months_are_read_once_and_included(store, computed, monkeypatch):
+    df_emp, df_att = employees(), attendance()
+    january = df_att["date"].str.startswith("2026-01")
+    hr_data.write_archive_partition("2026-01", df_att[january])
+    live = df_att[~january].reset_index(drop=True)
+    reads = []
+    read_archived_attendance = hr_data.read_archived_attendance
+    monkeypatch.setattr(hr_data, "read_archived_attendance", lambda months, *args, **kwargs: reads.append(list(months)) or read_archived_attendance(months, *args, **kwargs))
+
+    payroll = hr_data.get_payroll(df_emp, live, pd.DataFrame(), MONTHS)
+
+    assert reads == [["2026-01"]]
+    assert_same_payroll(payroll, hr_data.compute_payroll(df_emp, df_att, MONTHS))
+
+def test_a_rewritten_archive_partition_recomputes_its_month(store, computed):
+    df_emp, df_att = employees(), attendance()
+    january = df_att["date"].str.startswith("2026-01")
+    hr_data.write_archive_partition("2026-01", df_att[january])
+    live = df_att[~january].reset_index(drop=True)
+    hr_data.get_payroll(df_emp, live, pd.DataFrame(), MONTHS)
+
+    hr_data.write_archive_partition("2026-01", pd.DataFrame([{"employee_id": "102", "date": "2026-01-05", "status": "Present"}]))
+    payroll = hr_data.get_payroll(df_emp, live, pd.DataFrame(), MONTHS)
+
+    assert computed["months"] == MONTHS + ["2026-01"]
+    assert payroll.loc[(payroll["Month"] == "2026-01") & (payroll["Employee ID"] == 102), "Present Days"].iloc[0] == 21
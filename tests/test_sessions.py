@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+from starlette.requests import Request
+
+import asgi
+import hr_data
+
+@pytest.fixture
+def registry(local_data, monkeypatch):
+    """A fresh sign-in registry"""
+    registry = {"sessions": {}, "tickets": {}, "lock": threading.Lock()}
+    monkeypatch.setattr(hr_data, "get_login_sessions", lambda: registry)
+    return registry
+
+@pytest.fixture
+def token(registry):
+    return hr_data.open_session(hr_data.make_principal("10001", "Staff"))
+
+def request(method, body=b"", scheme="https"):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http", "method": method, "scheme": scheme, "path": hr_data.SESSION_COOKIE_ENDPOINT,
+        "headers": [], "query_string": b"", "server": ("hr.example", 443)
+    }
+    return Request(scope, receive)
+
+def test_a_ticket_works_once(token):
+    ticket = hr_data.issue_cookie_ticket(token)
+
+    assert hr_data.redeem_cookie_ticket(ticket) == token
+    assert hr_data.redeem_cookie_ticket(ticket) is None
+    assert hr_data.redeem_cookie_ticket("made-up") is None
+
+def test_an_expired_ticket_is_refused(token, monkeypatch):
+    monkeypatch.setattr(hr_data, "COOKIE_TICKET_SECONDS", -1)
+
+    assert hr_data.redeem_cookie_ticket(hr_data.issue_cookie_ticket(token)) is None
+
+def test_a_ticket_of_a_signed_out_session_is_refused(token):
+    ticket = hr_data.issue_cookie_ticket(token)
+    hr_data.end_session(token)
+
+    assert hr_data.redeem_cookie_ticket(ticket) is None
+
+def test_persisted_tickets_work_on_another_worker(registry, monkeypatch):
+    monkeypatch.setattr(hr_data, "PERSIST_SESSIONS", True)
+    token = hr_data.open_session(hr_data.make_principal("admin", "Admin"))
+    ticket = hr_data.issue_cookie_ticket(token)
+    # The other worker never saw the sign-in
+    registry["sessions"].clear()
+    registry["tickets"].clear()
+
+    assert hr_data.redeem_cookie_ticket(ticket) == token
+    assert hr_data.redeem_cookie_ticket(ticket) is None
+
+def test_endpoint_sets_an_httponly_cookie(token):
+    response = asyncio.run(asgi.set_session_cookie(request("POST", hr_data.issue_cookie_ticket(token).encode())))
+
+    assert response.status_code == 204
+    cookie = response.headers["set-cookie"]
+    assert cookie.startswith(f"{hr_data.SESSION_COOKIE}={token};")
+    assert all(flag in cookie for flag in ("HttpOnly", "Secure", "SameSite=strict", "Path=/"))
+
+def test_endpoint_refuses_a_bad_ticket(registry):
+    response = asyncio.run(asgi.set_session_cookie(request("POST", b"made-up")))
+
+    assert response.status_code == 403
+    assert "set-cookie" not in response.headers
+
+def test_endpoint_clears_the_cookie():
+    response = asyncio.run(asgi.clear_session_cookie(request("DELETE", scheme="http")))
+
+    cookie = response.headers["set-cookie"]
+    assert "Max-Age=0" in cookie and "HttpOnly" in cookie
+    assert "Secure" not in cookie